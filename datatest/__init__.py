@@ -27,9 +27,11 @@ from .main import DataTestProgram
 from .main import main
 
 from .dataaccess import DataSource
+from .dataaccess import DataFrameSource
 from .dataaccess import DataQuery
 from .dataaccess import DataResult
 from .dataaccess import working_directory
+from .dataaccess import afetch_many
 
 
 __version__ = '0.8.3.dev0'
@@ -70,6 +72,7 @@ __all__ = [
     'DataQuery',
     'DataResult',
     'working_directory',
+    'afetch_many',
 ]
 
 # Temporary alias for old "required" decorator.
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import ast
+import hashlib
 import inspect
+import math
 import os
+import random
+import re
+import sqlite3
+import struct
 import sys
-from io import IOBase
+import time
+import weakref
+import zipfile
 from numbers import Number
 from sqlite3 import Binary
 
@@ -21,7 +30,22 @@ from .utils.misc import _make_token
 from .utils.misc import _unique_everseen
 from .utils.misc import string_types
 from .load.sqltemp import TemporarySqliteTable
+from .load.sqltemp import TemporaryDatabase
 from .load.sqltemp import _from_csv
+from .load.sqltemp import _from_csv_cached
+from .load.sqltemp import _copy_table
+from .load.sqltemp import _get_csv_fieldnames
+from .load.sqltemp import _get_columns_from_data
+from .load.sqltemp import _select_columns
+from .load.sqltemp import _LazyTable
+from .load.sqltemp import _from_xlsx
+from .load.xlsxreader import XlsxReader
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # <- New in Python 3.4.
+    asyncio = None
 
 
 class working_directory(contextlib.ContextDecorator):
@@ -281,7 +305,26 @@ def _apply_to_data(function, data_iterator):
     return function(data_iterator)
 
 
-def _map_data(function, iterable):
+def _domap(func, itrbl):
+    """Apply *func* to each element of *itrbl* (elements that are
+    not data elements are unpacked when *func* expects multiple
+    parameters).
+    """
+    if _expects_multiple_params(func):
+        for x in itrbl:
+            if isinstance(x, BaseElement):
+                yield func(x)
+            else:
+                yield func(*x)
+    else:
+        for x in itrbl:
+            yield func(x)
+
+
+def _map_data(function, iterable, workers=None, executor=None):
+    if workers or executor:
+        return _map_data_parallel(function, iterable, workers, executor)
+
     def wrapper(iterable):
         if isinstance(iterable, BaseElement):
             return function(iterable)  # <- EXIT!
@@ -290,17 +333,7 @@ def _map_data(function, iterable):
         if issubclass(evaluation_type, collections.Set):
             evaluation_type = list
 
-        def domap(func, itrbl):
-            if _expects_multiple_params(func):
-                for x in itrbl:
-                    if isinstance(x, BaseElement):
-                        yield func(x)
-                    else:
-                        yield func(*x)
-            else:
-                for x in itrbl:
-                    yield func(x)
-        return DataResult(domap(function, iterable), evaluation_type)
+        return DataResult(_domap(function, iterable), evaluation_type)
 
     return _apply_to_data(wrapper, iterable)
 
@@ -325,11 +358,135 @@ def _filter_data(function, iterable):
     return _apply_to_data(wrapper, iterable)
 
 
-def _apply_data(function, data):
+def _apply_data(function, data, workers=None, executor=None):
     """Group-wise function application."""
+    if (workers or executor) and _is_collection_of_items(data):
+        return _apply_data_parallel(function, data, workers, executor)
     return _apply_to_data(function, data)
 
 
+##########################################################
+# Functions to execute apply and map steps in parallel.
+##########################################################
+
+def _evaluate_group(value):
+    """Return an evaluated (and picklable) copy of a group *value*."""
+    if isinstance(value, DataResult):
+        return value.fetch()
+    if isinstance(value, collections.Iterator):
+        return list(value)
+    return value
+
+
+def _make_chunks(values, workers):
+    """Split *values* into a list of chunks (about four chunks per
+    worker) so that each worker receives several values at a time.
+    """
+    values = list(values)
+    chunksize = max(1, -(-len(values) // (workers * 4)))  # <- Ceiling division.
+    return [values[i:i + chunksize] for i in range(0, len(values), chunksize)]
+
+
+def _apply_chunk(args):
+    """Call a function on each group in a chunk (runs in a worker)."""
+    function, groups = args
+    return [function(group) for group in groups]
+
+
+def _map_chunk(args):
+    """Map a function over each group in a chunk (runs in a worker)."""
+    function, groups = args
+    mapped = []
+    for group in groups:
+        if isinstance(group, BaseElement):
+            mapped.append(function(group))
+        else:
+            mapped.append(list(_domap(function, group)))
+    return mapped
+
+
+def _run_chunks(chunk_function, function, groups, workers, executor):
+    """Run *chunk_function* over chunks of *groups* using the given
+    *executor* (any object with a map() method like a process pool)
+    or a new pool of *workers* processes. Returns a list of results
+    in the same order as *groups*.
+
+    The data is split into about four chunks per worker. When
+    *workers* is not given, the number of CPUs is used (even with an
+    *executor*, whose size is not part of the map() interface).
+    """
+    import multiprocessing
+    workers = workers or multiprocessing.cpu_count()
+    if executor is None:
+        pool = multiprocessing.Pool(workers)
+    else:
+        pool = None
+
+    chunks = [(function, chunk) for chunk in _make_chunks(groups, workers)]
+    try:
+        chunk_results = list((executor or pool).map(chunk_function, chunks))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return list(itertools.chain.from_iterable(chunk_results))
+
+
+def _apply_data_parallel(function, data, workers=None, executor=None):
+    """Group-wise function application using multiple processes.
+    Groups are evaluated before they are sent to workers.
+    """
+    evaluation_type = _get_evaluation_type(data)
+    keys, groups = [], []
+    for key, value in data:
+        keys.append(key)
+        groups.append(_evaluate_group(value))
+    results = _run_chunks(_apply_chunk, function, groups, workers, executor)
+    return DataResult(DictItems(zip(keys, results)), evaluation_type)
+
+
+def _map_data_parallel(function, iterable, workers=None, executor=None):
+    """Apply *function* to each element using multiple processes.
+    Mapping results are split by group (preserving their order),
+    other results are split into chunks of elements.
+    """
+    def get_type(value):
+        evaluation_type = _get_evaluation_type(value)
+        if issubclass(evaluation_type, collections.Set):
+            evaluation_type = list
+        return evaluation_type
+
+    if _is_collection_of_items(iterable):
+        evaluation_type = _get_evaluation_type(iterable)
+        keys, groups, types = [], [], []
+        for key, value in iterable:
+            keys.append(key)
+            if isinstance(value, BaseElement):
+                groups.append(value)
+                types.append(None)
+            else:
+                types.append(get_type(value))
+                groups.append(_evaluate_group(value))
+        results = _run_chunks(_map_chunk, function, groups, workers, executor)
+        results = ((k, DataResult(iter(v), t) if t else v)
+                   for k, v, t in zip(keys, results, types))
+        return DataResult(DictItems(results), evaluation_type)
+
+    if isinstance(iterable, BaseElement):
+        return function(iterable)
+
+    evaluation_type = get_type(iterable)
+    elements = [[x] for x in _evaluate_group(iterable)]
+    results = _run_chunks(_map_chunk, function, elements, workers, executor)
+    return DataResult((x[0] for x in results), evaluation_type)
+
+
+try:
+    _sqlite_numeric_types = (int, long, float)
+except NameError:
+    _sqlite_numeric_types = (int, float)
+
+
 def _sqlite_cast_as_real(value):
     """Convert value to REAL (float) or default to 0.0 to match SQLite
     behavior. See the "Conversion Processing" table in the "CAST
@@ -346,16 +503,20 @@ def _sqlite_cast_as_real(value):
 
 def _sqlite_sum(iterable):
     """Sum the elements and return the total (should match SQLite
-    behavior).
+    behavior). Like SQLite, the total is an integer if all non-None
+    elements are integers.
     """
     if isinstance(iterable, BaseElement):
         iterable = [iterable]
-    iterable = (_sqlite_cast_as_real(x) for x in iterable if x != None)
-    try:
-        start_value = next(iterable)
-    except StopIteration:  # From SQLite docs: "If there are no non-NULL
-        return None        # input rows then sum() returns NULL..."
-    return sum(iterable, start_value)
+    total = None
+    for x in iterable:
+        if x == None:
+            continue
+        if not isinstance(x, _sqlite_numeric_types):  # <- Numbers need no cast.
+            x = _sqlite_cast_as_real(x)
+        total = x if total is None else total + x
+    return total  # From SQLite docs: "If there are no non-NULL input
+                  # rows then sum() returns NULL..."
 
 
 def _sqlite_count(iterable):
@@ -407,7 +568,9 @@ def _sqlite_avg(iterable):
     total = 0.0
     count = 0
     for x in iterable:
-        total = total + _sqlite_cast_as_real(x)
+        if not isinstance(x, _sqlite_numeric_types):
+            x = _sqlite_cast_as_real(x)
+        total = total + x
         count += 1
     return total / count if count else None
 
@@ -431,6 +594,458 @@ def _sqlite_max(iterable):
     return max(iterable, default=None, key=_sqlite_sortkey)
 
 
+def _sqlite_median(iterable):
+    """Return the median of non-None elements (the average of the
+    two middle values when there is an even number of elements).
+    Returns None if all elements are None.
+    """
+    return _sqlite_percentile(iterable, 50)
+
+
+def _sqlite_percentile(iterable, p):
+    """Return the *p*-th percentile (0 to 100) of non-None elements
+    using linear interpolation between the closest ranks. Returns
+    None if all elements are None.
+    """
+    if isinstance(iterable, BaseElement):
+        iterable = [iterable]
+    values = sorted(x if isinstance(x, _sqlite_numeric_types) else _sqlite_cast_as_real(x)
+                    for x in iterable if x != None)
+    if not values:
+        return None
+
+    rank = (len(values) - 1) * (p / 100.0)
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    fraction = rank - lower
+    return values[lower] + (values[upper] - values[lower]) * fraction
+
+
+def _sqlite_variance(iterable):
+    """Return the sample variance of non-None elements. Returns
+    None if there are fewer than two non-None elements.
+    """
+    if isinstance(iterable, BaseElement):
+        iterable = [iterable]
+    count = 0
+    mean = 0.0
+    sum_of_squares = 0.0
+    for x in iterable:  # <- Welford's algorithm.
+        if x == None:
+            continue
+        if not isinstance(x, _sqlite_numeric_types):
+            x = _sqlite_cast_as_real(x)
+        count += 1
+        delta = x - mean
+        mean += delta / count
+        sum_of_squares += delta * (x - mean)
+    if count < 2:
+        return None
+    return sum_of_squares / (count - 1)
+
+
+def _sqlite_stddev(iterable):
+    """Return the sample standard deviation of non-None elements.
+    Returns None if there are fewer than two non-None elements.
+    """
+    variance = _sqlite_variance(iterable)
+    if variance is None:
+        return None
+    return variance ** 0.5
+
+
+class _SqliteParameterized(object):
+    """Base class for callables that take extra parameters and
+    that can format the SQL to call an equivalent aggregate
+    function. Subclasses must define the SQL function *name*.
+    """
+    name = None
+
+    def __init__(self, *args):
+        self.args = args
+
+    def _sql_args(self):
+        return self.args
+
+    def sql(self, expression):
+        sql_args = ', '.join(repr(x) for x in self._sql_args())
+        return '{0}({1}, {2})'.format(self.name, expression, sql_args)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.args == other.args
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.__class__, self.args))
+
+    def __repr__(self):
+        args_repr = ', '.join(repr(x) for x in self.args)
+        return '{0}({1})'.format(self.name.lower(), args_repr)
+
+
+class _SqlitePercentile(_SqliteParameterized):
+    """Callable that returns the *p*-th percentile of an iterable
+    (see _sqlite_percentile()). Instances can also format the SQL
+    to call the equivalent PERCENTILE aggregate.
+    """
+    name = 'PERCENTILE'
+
+    def __init__(self, p):
+        super(_SqlitePercentile, self).__init__(p)
+        self.p = p
+
+    def __call__(self, iterable):
+        return _sqlite_percentile(iterable, self.p)
+
+    def _sql_args(self):
+        return (float(self.p),)
+
+
+def _sketch_hash(value):
+    """Return a stable 64-bit hash of *value* for use in sketches.
+
+    Unlike hash(), the result does not vary between processes so
+    sketches built separately can be merged. Numbers that compare
+    as equal (like 1 and 1.0) get the same hash.
+    """
+    if isinstance(value, string_types):
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        data = b's:' + value
+    elif isinstance(value, Number):
+        try:
+            if value == int(value):
+                text = str(int(value))
+            else:
+                text = repr(float(value))
+        except (TypeError, ValueError, OverflowError):
+            text = repr(value)  # <- For complex numbers, NaN, and inf.
+        data = b'n:' + text.encode('ascii')
+    elif isinstance(value, (bytes, bytearray, Binary)):
+        data = b'b:' + bytes(value)
+    else:
+        data = b'o:' + repr(value).encode('utf-8')
+    return struct.unpack('>Q', hashlib.sha1(data).digest()[:8])[0]
+
+
+class _HyperLogLog(object):
+    """HyperLogLog sketch to estimate the number of distinct values.
+
+    The *precision* (4 to 18) sets the number of registers used
+    (2 ** precision). Sketches with the same precision can be
+    combined with merge().
+    """
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            msg = 'precision must be between 4 and 18, got {0!r}'
+            raise ValueError(msg.format(precision))
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def error(self):
+        """The relative standard error of count() estimates."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        hashed = _sketch_hash(value)
+        remaining_bits = 64 - self.precision
+        index = hashed >> remaining_bits
+        remainder = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Update sketch to include the values from *other*."""
+        if self.precision != other.precision:
+            msg = 'cannot merge sketches with different precision: {0!r} and {1!r}'
+            raise ValueError(msg.format(self.precision, other.precision))
+        self.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+
+        estimate = alpha * size * size / sum(2.0 ** -x for x in self.registers)
+        if estimate <= 2.5 * size:  # <- Small range correction.
+            zeros = sum(1 for x in self.registers if not x)
+            if zeros:
+                estimate = size * math.log(float(size) / zeros)
+        return int(round(estimate))
+
+
+def _hll_precision(error):
+    """Return the smallest HyperLogLog precision whose relative
+    standard error does not exceed *error* (limited to 4 to 18).
+    """
+    if not 0 < error < 1:
+        raise ValueError('error must be between 0 and 1, got {0!r}'.format(error))
+    precision = int(math.ceil(math.log((1.04 / error) ** 2, 2)))
+    return max(4, min(precision, 18))
+
+
+class _QuantileSketch(object):
+    """KLL sketch to estimate quantiles of a stream of values.
+
+    Values are kept in a hierarchy of compactors--when a compactor
+    is full, half of its sorted values are promoted to the next level
+    (where each value represents twice as many original values). The
+    rank error of quantile() estimates is roughly proportional to 1/k.
+    Sketches with the same *k* can be combined with merge().
+    """
+    def __init__(self, k=200):
+        self.k = k
+        self.compactors = [[]]
+        self.count = 0
+        self._random = random.Random(0)  # <- Fixed seed, reproducible.
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def _compress(self):
+        for level, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                items.sort()
+                leftover = len(items) % 2
+                offset = self._random.randint(0, 1)
+                self.compactors[level + 1].extend(items[leftover + offset::2])
+                self.compactors[level] = items[:leftover]
+                self._size = sum(len(x) for x in self.compactors)
+                if self._size < self._max_size:
+                    break
+        self._max_size = sum(self._capacity(x) for x in range(len(self.compactors)))
+
+    def add(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Update sketch to include the values from *other*."""
+        if self.k != other.k:
+            msg = 'cannot merge sketches with different k: {0!r} and {1!r}'
+            raise ValueError(msg.format(self.k, other.k))
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for items, other_items in zip(self.compactors, other.compactors):
+            items.extend(other_items)
+        self.count += other.count
+        self._size = sum(len(x) for x in self.compactors)
+        self._max_size = sum(self._capacity(x) for x in range(len(self.compactors)))
+        while self._size >= self._max_size:
+            self._compress()
+        return self
+
+    def quantile(self, q):
+        """Return the estimated *q*-th quantile (0 to 1) or None if
+        the sketch is empty.
+        """
+        if not self.count:
+            return None
+        weighted = sorted(
+            (value, 2 ** level)
+            for level, items in enumerate(self.compactors)
+            for value in items
+        )
+        target = q * self.count
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+
+def _quantile_sketch_k(error):
+    """Return the size parameter *k* of a quantile sketch whose rank
+    error is approximately *error*.
+    """
+    if not 0 < error < 1:
+        raise ValueError('error must be between 0 and 1, got {0!r}'.format(error))
+    return max(8, int(math.ceil(2.0 / error)))
+
+
+def _sqlite_approx_count_distinct(iterable, precision=14):
+    """Return an estimate of the number of distinct non-None elements
+    (see _HyperLogLog).
+    """
+    if isinstance(iterable, BaseElement):
+        iterable = [iterable]
+    sketch = _HyperLogLog(precision)
+    for x in iterable:
+        if x != None:
+            sketch.add(x)
+    return sketch.count()
+
+
+def _sqlite_approx_quantile(iterable, q, k=200):
+    """Return an estimate of the *q*-th quantile (0 to 1) of non-None
+    elements (see _QuantileSketch). Returns None if all elements are
+    None.
+    """
+    if isinstance(iterable, BaseElement):
+        iterable = [iterable]
+    sketch = _QuantileSketch(k)
+    for x in iterable:
+        if x != None:
+            sketch.add(_sqlite_cast_as_real(x))
+    return sketch.quantile(q)
+
+
+class _ApproxCountDistinct(_SqliteParameterized):
+    """Callable that estimates the number of distinct values in an
+    iterable within a relative standard *error* (see
+    _sqlite_approx_count_distinct()).
+    """
+    name = 'APPROX_COUNT_DISTINCT'
+
+    def __init__(self, error):
+        super(_ApproxCountDistinct, self).__init__(error)
+        self.precision = _hll_precision(error)
+
+    def __call__(self, iterable):
+        return _sqlite_approx_count_distinct(iterable, self.precision)
+
+    def _sql_args(self):
+        return (self.precision,)
+
+
+class _ApproxQuantile(_SqliteParameterized):
+    """Callable that estimates the *q*-th quantile of an iterable
+    within an approximate rank *error* (see _sqlite_approx_quantile()).
+    """
+    name = 'APPROX_QUANTILE'
+
+    def __init__(self, q, error):
+        super(_ApproxQuantile, self).__init__(q, error)
+        self.q = q
+        self.k = _quantile_sketch_k(error)
+
+    def __call__(self, iterable):
+        return _sqlite_approx_quantile(iterable, self.q, self.k)
+
+    def _sql_args(self):
+        return (float(self.q), self.k)
+
+
+class _ValuesAggregate(object):
+    """Base class for SQLite aggregates that need every value (see
+    sqlite3.Connection.create_aggregate).
+    """
+    def __init__(self):
+        self.values = []
+
+    def step(self, value, *args):
+        if value is not None:
+            self.values.append(value)
+        self.args = args
+
+
+class _MedianAggregate(_ValuesAggregate):
+    def finalize(self):
+        return _sqlite_median(self.values)
+
+
+class _PercentileAggregate(_ValuesAggregate):
+    def finalize(self):
+        if not self.values:
+            return None
+        return _sqlite_percentile(self.values, self.args[0])
+
+
+class _VarianceAggregate(object):
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_of_squares = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        if not isinstance(value, _sqlite_numeric_types):
+            value = _sqlite_cast_as_real(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sum_of_squares += delta * (value - self.mean)
+
+    def finalize(self):
+        if self.count < 2:
+            return None
+        return self.sum_of_squares / (self.count - 1)
+
+
+class _StddevAggregate(_VarianceAggregate):
+    def finalize(self):
+        variance = super(_StddevAggregate, self).finalize()
+        if variance is None:
+            return None
+        return variance ** 0.5
+
+
+class _ApproxCountDistinctAggregate(object):
+    def __init__(self):
+        self.sketch = None
+
+    def step(self, value, precision):
+        if self.sketch is None:
+            self.sketch = _HyperLogLog(precision)
+        if value is not None:
+            self.sketch.add(value)
+
+    def finalize(self):
+        if self.sketch is None:
+            return 0
+        return self.sketch.count()
+
+
+class _ApproxQuantileAggregate(object):
+    def __init__(self):
+        self.sketch = None
+
+    def step(self, value, q, k):
+        if self.sketch is None:
+            self.sketch = _QuantileSketch(k)
+            self.q = q
+        if value is not None:
+            self.sketch.add(_sqlite_cast_as_real(value))
+
+    def finalize(self):
+        if self.sketch is None:
+            return None
+        return self.sketch.quantile(self.q)
+
+
+_sqlite_aggregate_classes = [
+    ('MEDIAN', 1, _MedianAggregate),
+    ('PERCENTILE', 2, _PercentileAggregate),
+    ('VARIANCE', 1, _VarianceAggregate),
+    ('STDDEV', 1, _StddevAggregate),
+    ('APPROX_COUNT_DISTINCT', 2, _ApproxCountDistinctAggregate),
+    ('APPROX_QUANTILE', 3, _ApproxQuantileAggregate),
+]
+
+
 def _sqlite_distinct(iterable):
     """Filter iterable to unique values, while maintaining
     evaluation_type.
@@ -501,6 +1116,13 @@ def _parse_select(select):
     return key, value
 
 
+def _get_key_names(key):
+    """Return a tuple of column names for a *key* returned by
+    _parse_select().
+    """
+    return (key,) if isinstance(key, str) else tuple(key)
+
+
 ##########################################
 # Functions for query and execution steps.
 ##########################################
@@ -509,8 +1131,8 @@ def _get_step_repr(step):
     """Helper function to return repr for a single query step."""
     func, args, kwds = step
 
-    def _callable_name_or_repr(x):            # <- Helper function for
-        with contextlib.suppress(NameError):  #    the helper function!
+    def _callable_name_or_repr(x):                            # <- Helper function for
+        with contextlib.suppress(NameError, AttributeError):  #    the helper function!
             if callable(x):
                 return x.__name__
         return repr(x)
@@ -542,10 +1164,762 @@ RESULT_TOKEN = _make_token(
 )
 
 
+_sqlite_aggregate_names = {
+    _sqlite_sum: 'SUM',
+    _sqlite_count: 'COUNT',
+    _sqlite_avg: 'AVG',
+    _sqlite_min: 'MIN',
+    _sqlite_max: 'MAX',
+    _sqlite_median: 'MEDIAN',
+    _sqlite_variance: 'VARIANCE',
+    _sqlite_stddev: 'STDDEV',
+}
+
+
+def _sql_aggregate_call(sqlfunc, expression):
+    """Return SQL that calls the aggregate *sqlfunc* on *expression*.
+    The *sqlfunc* is an SQL function name (like 'SUM') or an object
+    with an sql() method (like _SqlitePercentile).
+    """
+    if isinstance(sqlfunc, string_types):
+        return '{0}({1})'.format(sqlfunc.upper(), expression)
+    return sqlfunc.sql(expression)
+
+
+def _is_scalar_select(select):
+    """Returns True if *select* returns individual values from a single
+    column (and not a set of values or a container of multiple columns).
+    """
+    value = _parse_select(select)[1]
+    if isinstance(value, collections.Set):
+        return False
+    return isinstance(tuple(value)[0], string_types)
+
+
+def _is_valid_compiled(compiled, grouped):
+    """Returns True if the sequence of *compiled* steps can be executed
+    as a single SQL statement with the same results as the original
+    Python execution steps.
+    """
+    names = [name for name, _ in compiled]
+    if not names:
+        return False
+
+    if names[-1] == 'aggregate':
+        return True  # <- EXIT! (aggregates work with maps and filters)
+
+    if 'map' in names:
+        return False  # <- EXIT! (mapped values must be aggregated)
+
+    if names == ['distinct']:
+        return True  # <- EXIT!
+
+    # Filtering a grouped select could remove all of the values from a
+    # group but Python execution keeps the group (with an empty result).
+    return not grouped
+
+
+def _get_compiled_steps(select, execution_steps):
+    """Return a 2-tuple containing a tuple of compiled steps and a
+    tuple of the remaining execution steps that could not be compiled.
+
+    Compiled steps are 2-tuples of ``(name, argument)`` pairs that
+    can be executed together as a single SELECT statement:
+
+    * ``('filter', function)``
+    * ``('map', function)``
+    * ``('aggregate', sql_function_name)``
+    * ``('distinct', None)``
+    """
+    scalar_select = _is_scalar_select(select)
+    candidates = []
+    for function, args, kwds in execution_steps:
+        if function is _apply_to_data and args[0] in _sqlite_aggregate_names:
+            candidates.append(('aggregate', _sqlite_aggregate_names[args[0]]))
+            break
+        elif (function is _apply_to_data
+                and isinstance(args[0], _SqliteParameterized)
+                and not isinstance(_parse_select(select)[1], collections.Set)):
+            candidates.append(('aggregate', args[0]))  # <- Multi-argument
+            break                                       #    aggregates can
+                                                        #    not use DISTINCT.
+        elif function is _sqlite_distinct:
+            candidates.append(('distinct', None))
+            break
+        elif function is _filter_data and scalar_select:
+            candidates.append(('filter', args[0]))
+        elif function is _map_data and scalar_select and not kwds:
+            candidates.append(('map', args[0]))
+        else:
+            break
+
+    grouped = bool(_parse_select(select)[0])
+    for stop in range(len(candidates), 0, -1):
+        compiled = tuple(candidates[:stop])
+        if _is_valid_compiled(compiled, grouped):
+            return compiled, tuple(execution_steps[stop:])
+    return (), tuple(execution_steps)
+
+
+#############################################################
+# Functions to translate simple lambdas into SQL expressions.
+#############################################################
+
+class _UntranslatableExpression(Exception):
+    """Raised when an expression can not be translated into SQL."""
+
+
+_sql_comparison_ops = {
+    'Eq': '=',
+    'NotEq': '!=',
+    'Lt': '<',
+    'LtE': '<=',
+    'Gt': '>',
+    'GtE': '>=',
+}
+
+_sql_arithmetic_ops = {
+    'Add': '+',
+    'Sub': '-',
+    'Mult': '*',
+}
+
+_sql_type_guards = {
+    'numeric': "typeof({0}) IN ('integer', 'real')",
+    'text': "typeof({0}) = 'text'",
+}
+
+
+def _get_literal(node):
+    """Return value of literal *node* or raise _UntranslatableExpression."""
+    node_type = node.__class__.__name__
+    if node_type == 'Num':
+        return node.n
+    if node_type == 'Str':
+        return node.s
+    if node_type in ('Constant', 'NameConstant'):
+        return node.value
+    if node_type == 'Name' and node.id == 'None':  # For Python 2.
+        return None
+    raise _UntranslatableExpression(node_type)
+
+
+def _translate_literal(node):
+    """Return a 2-tuple containing an SQL literal and its kind."""
+    value = _get_literal(node)
+    if isinstance(value, bool):
+        raise _UntranslatableExpression('bool literal')
+
+    if isinstance(value, float):
+        if value != value or value in (float('inf'), float('-inf')):
+            raise _UntranslatableExpression('non-finite float')
+        return repr(value), 'numeric'
+
+    if isinstance(value, Number) and not isinstance(value, complex):
+        if not (isinstance(value, int) or value.__class__.__name__ == 'long'):
+            raise _UntranslatableExpression(repr(value))
+        if abs(value) >= 2 ** 63:
+            raise _UntranslatableExpression('integer out of range')
+        return str(value), 'numeric'
+
+    if isinstance(value, string_types):
+        if isinstance(value, bytes):
+            try:
+                value = value.decode('ascii')  # Byte strings (Python 2).
+            except UnicodeError:
+                raise _UntranslatableExpression('non-ascii byte string')
+        if '\x00' in value:
+            raise _UntranslatableExpression('string contains NUL')
+        return "'{0}'".format(value.replace("'", "''")), 'text'
+
+    raise _UntranslatableExpression(repr(value))
+
+
+def _resolve_kinds(kind_a, kind_b, required):
+    """Return the kind shared by two operands. If either operand is the
+    lambda argument itself ('arg'), the kind of the other operand is
+    added to the list of *required* argument kinds.
+    """
+    if kind_a == 'arg' and kind_b in ('numeric', 'text'):
+        required.append(kind_b)
+        return kind_b
+    if kind_b == 'arg' and kind_a in ('numeric', 'text'):
+        required.append(kind_a)
+        return kind_a
+    if kind_a == kind_b and kind_a in ('numeric', 'text'):
+        return kind_a
+    raise _UntranslatableExpression('incompatible operands')
+
+
+def _has_float_literal(node):
+    """Return True if the expression *node* contains a float literal."""
+    for child in ast.walk(node):
+        if child.__class__.__name__ in ('Num', 'Constant'):
+            value = getattr(child, 'n', getattr(child, 'value', None))
+            if isinstance(value, float):
+                return True
+    return False
+
+
+def _translate_node(node, argname, column, required, builtins_ok, checked):
+    """Return a 2-tuple containing the SQL and the result kind ('arg',
+    'numeric', 'text' or 'bool') for the given lambda body *node*.
+
+    The SQL of integer arithmetic is appended to the *checked* list
+    (SQLite converts results that overflow 64-bit integers to REAL
+    while Python returns an exact integer).
+    """
+    translate = lambda x: _translate_node(x, argname, column, required,
+                                          builtins_ok, checked)
+    is_arg = lambda x: x.__class__.__name__ == 'Name' and x.id == argname
+    node_type = node.__class__.__name__
+
+    if is_arg(node):
+        return column, 'arg'
+
+    if node_type in ('Num', 'Str', 'Constant', 'NameConstant'):
+        return _translate_literal(node)
+
+    if node_type == 'Compare':
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            op_type = op.__class__.__name__
+            if op_type in ('Is', 'IsNot'):
+                if not is_arg(left) or _get_literal(right) is not None:
+                    raise _UntranslatableExpression('identity test')
+                sql = 'IS NULL' if op_type == 'Is' else 'IS NOT NULL'
+                parts.append('{0} {1}'.format(column, sql))
+            elif op_type in ('In', 'NotIn'):
+                left_sql, left_kind = translate(left)
+                if right.__class__.__name__ not in ('Tuple', 'List', 'Set'):
+                    raise _UntranslatableExpression('membership test')
+                items = [_translate_literal(x) for x in right.elts]
+                if not items:
+                    raise _UntranslatableExpression('empty container')
+                kind = items[0][1]
+                for _, item_kind in items:
+                    kind = _resolve_kinds(kind, item_kind, required)
+                _resolve_kinds(left_kind, kind, required)
+                sql = 'IN' if op_type == 'In' else 'NOT IN'
+                items = ', '.join(x[0] for x in items)
+                parts.append('{0} {1} ({2})'.format(left_sql, sql, items))
+            elif op_type in _sql_comparison_ops:
+                left_sql, left_kind = translate(left)
+                right_sql, right_kind = translate(right)
+                _resolve_kinds(left_kind, right_kind, required)
+                sql_op = _sql_comparison_ops[op_type]
+                parts.append('{0} {1} {2}'.format(left_sql, sql_op, right_sql))
+            else:
+                raise _UntranslatableExpression(op_type)
+            left = right
+        return '({0})'.format(' AND '.join(parts)), 'bool'
+
+    if node_type == 'BoolOp':
+        sql_op = {'And': ' AND ', 'Or': ' OR '}[node.op.__class__.__name__]
+        values = [translate(x) for x in node.values]
+        if any(kind != 'bool' for _, kind in values):
+            raise _UntranslatableExpression('non-boolean operand')
+        return '({0})'.format(sql_op.join(x[0] for x in values)), 'bool'
+
+    if node_type == 'UnaryOp':
+        op_type = node.op.__class__.__name__
+        sql, kind = translate(node.operand)
+        if op_type == 'Not' and kind == 'bool':
+            return '(NOT {0})'.format(sql), 'bool'
+        if op_type == 'USub' and kind in ('arg', 'numeric'):
+            _resolve_kinds(kind, 'numeric', required)
+            sql = '(-{0})'.format(sql)
+            if not _has_float_literal(node):
+                checked.append(sql)
+            return sql, 'numeric'
+        raise _UntranslatableExpression(op_type)
+
+    if node_type == 'BinOp':
+        op_type = node.op.__class__.__name__
+        if op_type not in _sql_arithmetic_ops:
+            raise _UntranslatableExpression(op_type)
+        left_sql, left_kind = translate(node.left)
+        right_sql, right_kind = translate(node.right)
+        kind = _resolve_kinds(left_kind, right_kind, required)
+        if kind == 'text':
+            if op_type != 'Add':
+                raise _UntranslatableExpression(op_type)
+            sql_op = '||'  # <- String concatenation.
+        else:
+            sql_op = _sql_arithmetic_ops[op_type]
+        sql = '({0} {1} {2})'.format(left_sql, sql_op, right_sql)
+        if kind == 'numeric' and not _has_float_literal(node):
+            checked.append(sql)
+        return sql, kind
+
+    if node_type == 'Call':
+        if (getattr(node, 'keywords', None) or getattr(node, 'starargs', None)
+                or getattr(node, 'kwargs', None) or len(node.args) != 1):
+            raise _UntranslatableExpression('call signature')
+        func = node.func
+        func_type = func.__class__.__name__
+        if func_type == 'Name' and func.id == 'len' and builtins_ok:
+            sql, kind = translate(node.args[0])
+            _resolve_kinds(kind, 'text', required)
+            return 'length({0})'.format(sql), 'numeric'
+        if (func_type == 'Attribute'
+                and func.attr in ('startswith', 'endswith')
+                and is_arg(func.value)):
+            affix_sql, affix_kind = _translate_literal(node.args[0])
+            affix = _get_literal(node.args[0])
+            if affix_kind != 'text' or not affix:
+                raise _UntranslatableExpression('affix')
+            _resolve_kinds('arg', 'text', required)
+            if func.attr == 'startswith':
+                sql = '(substr({0}, 1, {1}) = {2})'
+            else:
+                sql = '(substr({0}, -{1}) = {2})'
+            return sql.format(column, len(affix), affix_sql), 'bool'
+        raise _UntranslatableExpression('unsupported call')
+
+    raise _UntranslatableExpression(node_type)
+
+
+_lambda_cache = {}
+
+_column_reference_regex = re.compile(r'^(?:\w+|"(?:[^"]|"")+")$', re.UNICODE)
+
+
+def _get_lambda_parts(function):
+    """Return a 2-tuple containing the argument name and the body node
+    of a one-argument *function* defined with a lambda expression.
+    Returns None if the expression can not be found.
+    """
+    code = getattr(function, '__code__', None)
+    if code is None or getattr(function, '__name__', None) != '<lambda>':
+        return None  # <- EXIT!
+
+    if code in _lambda_cache:
+        return _lambda_cache[code]  # <- EXIT!
+
+    def code_matches(node):
+        expression = ast.Expression(body=node)
+        try:
+            module_code = compile(expression, '<lambda>', 'eval')
+        except Exception:
+            return False
+        for const in module_code.co_consts:
+            if (getattr(const, 'co_code', None) == code.co_code
+                    and const.co_consts == code.co_consts
+                    and const.co_names == code.co_names
+                    and const.co_varnames == code.co_varnames):
+                return True
+        return False
+
+    def find_lambda(source):
+        start = source.find('lambda')
+        while start != -1:
+            candidate = source[start:]
+            ends = [i for i, c in enumerate(candidate) if c in ',)]};\n']
+            for end in reversed(ends + [len(candidate)]):
+                try:
+                    tree = ast.parse(candidate[:end].strip(), mode='eval')
+                except SyntaxError:
+                    continue
+                for node in ast.walk(tree):
+                    if isinstance(node, ast.Lambda) and code_matches(node):
+                        return node  # <- EXIT!
+            start = source.find('lambda', start + 1)
+        return None
+
+    parts = None
+    if not code.co_freevars and code.co_argcount == 1:
+        try:
+            source = ''.join(inspect.getsourcelines(function)[0])
+        except (IOError, OSError, TypeError):
+            source = ''
+        node = find_lambda(source[:2000])
+        if node is not None:
+            args = node.args
+            if not (args.vararg or args.kwarg or args.defaults
+                        or getattr(args, 'kwonlyargs', None)):
+                arg = args.args[0]
+                argname = getattr(arg, 'arg', getattr(arg, 'id', None))
+                parts = (argname, node.body)
+
+    _lambda_cache[code] = parts
+    return parts
+
+
+def _translate_function(function, column, fallback, context='filter'):
+    """Return an SQL expression that evaluates *function* for the given
+    *column* or return None if the function can not be translated.
+
+    Only simple lambdas (comparisons, arithmetic, ``in`` tests with
+    literals, ``len()``, ``str.startswith()`` and ``str.endswith()``)
+    are translated. Because the translated expression assumes the
+    argument has a specific type (numeric or text), it is guarded with
+    ``typeof()`` and falls back to the *fallback* SQL (usually a
+    user-defined function call) for values of other types so results
+    match Python behavior. Integer arithmetic is also guarded and falls
+    back if a result overflows (SQLite returns a REAL instead).
+
+    The *column* must be a plain column reference (a name or a quoted
+    identifier). Other expressions are not translated because the
+    translation repeats *column* several times and SQLite would
+    evaluate the expression once for each repetition.
+    """
+    if not _column_reference_regex.match(column):
+        return None  # <- EXIT!
+
+    parts = _get_lambda_parts(function)
+    if not parts:
+        return None  # <- EXIT!
+
+    argname, body = parts
+    builtins_ok = 'len' not in getattr(function, '__globals__', {})
+    required = []
+    checked = []
+    try:
+        sql, kind = _translate_node(body, argname, column, required,
+                                    builtins_ok, checked)
+    except (_UntranslatableExpression, KeyError, AttributeError, IndexError):
+        return None
+
+    if kind == 'arg' or (context == 'filter' and kind == 'text'):
+        return None  # <- EXIT! (Truth values of text differ in SQL.)
+
+    required = set(required)
+    if len(required) > 1:
+        return None  # <- EXIT!
+
+    guards = []
+    if required:
+        guards.append(_sql_type_guards[required.pop()].format(column))
+    if checked:
+        integers = ' AND '.join("typeof({0}) = 'integer'".format(x) for x in checked)
+        guards.append("(typeof({0}) != 'integer' OR {1})".format(column, integers))
+    if guards:
+        sql = 'CASE WHEN {0} THEN {1} ELSE {2} END'.format(
+            ' AND '.join(guards), sql, fallback)
+    return sql
+
+
+###############################################
+# Predicate objects for where-clause values.
+###############################################
+
+_regex_type = type(re.compile(''))
+
+
+class _WherePredicate(object):
+    """A where-clause value that is executed as a native SQL
+    expression. Instances are created with :func:`between`,
+    :func:`gt`, :func:`ge`, :func:`lt`, :func:`le`, :func:`not_in`,
+    :func:`is_null`, :func:`not_null`, and :func:`regex`.
+
+    The *template* is an SQL expression where ``{0}`` is replaced
+    with the column name, *params* are the values for its ``?``
+    placeholders, and *function* implements the same test in Python
+    (values of different types are compared using SQLite's sort
+    order, see _sqlite_sortkey()).
+    Predicates that compare values with a column's stored value can
+    use an index created with :meth:`DataSource.create_index`
+    (*indexable* is True).
+    """
+    def __init__(self, name, args, template, params, function, indexable=True):
+        self.name = name
+        self.args = args
+        self.template = template
+        self.params = params
+        self.function = function
+        self.indexable = indexable
+
+    def sql(self, column):
+        """Return a 2-tuple of SQL clause and parameters for *column*."""
+        return self.template.format(column), list(self.params)
+
+    def __call__(self, value):
+        return self.function(value)
+
+    def __eq__(self, other):
+        if not isinstance(other, _WherePredicate):
+            return NotImplemented
+        return (self.name, self.args) == (other.name, other.args)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.__class__, self.name, self.args))
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.name, ', '.join(repr(x) for x in self.args))
+
+
+def between(low, high):
+    """Where-value that matches values from *low* to *high*
+    (inclusive)::
+
+        source('A', B=between('2017-01-01', '2017-12-31'))
+
+    Values are compared using SQLite's comparison rules so *low*
+    and *high* should have the same type as the stored values.
+    """
+    low_key, high_key = _sqlite_sortkey(low), _sqlite_sortkey(high)
+    function = lambda x: x is not None and low_key <= _sqlite_sortkey(x) <= high_key
+    return _WherePredicate('between', (low, high), '{0} BETWEEN ? AND ?',
+                           (low, high), function)
+
+
+def gt(value):
+    """Where-value that matches values greater than *value*."""
+    key = _sqlite_sortkey(value)
+    function = lambda x: x is not None and _sqlite_sortkey(x) > key
+    return _WherePredicate('gt', (value,), '{0} > ?', (value,), function)
+
+
+def ge(value):
+    """Where-value that matches values greater than or equal to
+    *value*.
+    """
+    key = _sqlite_sortkey(value)
+    function = lambda x: x is not None and _sqlite_sortkey(x) >= key
+    return _WherePredicate('ge', (value,), '{0} >= ?', (value,), function)
+
+
+def lt(value):
+    """Where-value that matches values less than *value*."""
+    key = _sqlite_sortkey(value)
+    function = lambda x: x is not None and _sqlite_sortkey(x) < key
+    return _WherePredicate('lt', (value,), '{0} < ?', (value,), function)
+
+
+def le(value):
+    """Where-value that matches values less than or equal to
+    *value*.
+    """
+    key = _sqlite_sortkey(value)
+    function = lambda x: x is not None and _sqlite_sortkey(x) <= key
+    return _WherePredicate('le', (value,), '{0} <= ?', (value,), function)
+
+
+def not_in(values):
+    """Where-value that matches values that are not in the given
+    collection of *values* (NULL values are not matched)::
+
+        source('A', B=not_in(['x', 'y']))
+    """
+    values = tuple(values)
+    function = lambda x: x is not None and x not in values
+    template = '{{0}} NOT IN ({0})'.format(', '.join('?' * len(values)))
+    return _WherePredicate('not_in', (values,), template, values,
+                           function, indexable=False)
+
+
+def is_null():
+    """Where-value that matches NULL (None) values."""
+    function = lambda x: x is None
+    return _WherePredicate('is_null', (), '{0} IS NULL', (), function)
+
+
+def not_null():
+    """Where-value that matches values that are not NULL (None)."""
+    function = lambda x: x is not None
+    return _WherePredicate('not_null', (), '{0} IS NOT NULL', (), function,
+                           indexable=False)
+
+
+_range_predicates = ('between', 'gt', 'ge', 'lt', 'le')
+
+
+_regex_inline_flags = [
+    ('IGNORECASE', 'i'),
+    ('LOCALE', 'L'),
+    ('MULTILINE', 'm'),
+    ('DOTALL', 's'),
+    ('UNICODE', 'u'),
+    ('VERBOSE', 'x'),
+    ('ASCII', 'a'),  # <- New in Python 3.0
+]
+
+
+def regex(pattern, flags=0):
+    """Where-value that matches values containing a match for the
+    regular expression *pattern* (using :py:func:`re.search`)::
+
+        source('A', B=regex(r'^[0-9]{5}$'))
+
+    Compiled regular expression objects can also be used directly
+    as where-values. Patterns are executed in SQLite using a REGEXP
+    function that caches compiled patterns. Values that are not
+    strings (like numbers) are converted with :py:class:`str` before
+    they are searched and NULL (None) values never match.
+    """
+    if isinstance(pattern, _regex_type):
+        implicit_flags = re.compile(pattern.pattern).flags  # <- Inline and default.
+        pattern, flags = pattern.pattern, (pattern.flags & ~implicit_flags) | flags
+
+    letters = ''.join(letter for name, letter in _regex_inline_flags
+                      if flags & getattr(re, name, 0))
+    sql_pattern = '(?{0}){1}'.format(letters, pattern) if letters else pattern
+
+    compiled = re.compile(pattern, flags)
+    function = lambda x: bool(_regex_search(compiled, x))
+    return _WherePredicate('regex', (pattern, flags), '{0} REGEXP ?',
+                           (sql_pattern,), function, indexable=False)
+
+
+def _is_indexable(value):
+    """Return True if a where-clause *value* can use an index."""
+    predicate = _get_predicate(value)
+    if predicate is not None:
+        return predicate.indexable
+    return not callable(value)
+
+
+def _is_range(value):
+    """Return True if a where-clause *value* matches a range of
+    values (instead of specific values).
+    """
+    predicate = _get_predicate(value)
+    return predicate is not None and predicate.name in _range_predicates
+
+
+def _get_predicate(value):
+    """Return a _WherePredicate for a where-clause *value* or None if
+    the value is not a predicate.
+    """
+    if isinstance(value, _WherePredicate):
+        return value
+    if isinstance(value, _regex_type):
+        return regex(value)
+    return None
+
+
+def _regex_search(compiled, value):
+    """Return True if *value* contains a match for the *compiled*
+    pattern or None if *value* is None. Values that are not strings
+    are converted with str() (used by both the SQL and the Python
+    implementations of the regex() predicate).
+    """
+    if value is None:
+        return None
+    if not isinstance(value, string_types):
+        value = str(value)
+    return compiled.search(value) is not None
+
+
+_regexp_cache = {}
+_regexp_cache_maxsize = 256
+def _sqlite_regexp(pattern, value):
+    """Implements SQLite's REGEXP operator (``value REGEXP pattern``).
+    Compiled patterns are cached.
+    """
+    try:
+        compiled = _regexp_cache[pattern]
+    except KeyError:
+        if len(_regexp_cache) >= _regexp_cache_maxsize:
+            _regexp_cache.clear()
+        compiled = _regexp_cache[pattern] = re.compile(pattern)
+    return _regex_search(compiled, value)
+
+
+#####################################
+# Functions for reproducible samples.
+#####################################
+
+_sqlite_has_window_functions = sqlite3.sqlite_version_info >= (3, 25, 0)
+
+
+def _sample_key(rowid, seed):
+    """Return a pseudo-random number from 0 to 1 for *rowid*. The
+    same *rowid* and *seed* always give the same number (uses the
+    SplitMix64 mixing function).
+    """
+    mask = 0xFFFFFFFFFFFFFFFF
+    z = (rowid + (seed + 1) * 0x9E3779B97F4A7C15) & mask
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+    z = z ^ (z >> 31)
+    return z / 18446744073709551616.0  # <- Divide by 2 ** 64.
+
+
+class _RowSample(object):
+    """Chooses a reproducible sample of *n* rows or a *fraction* of
+    rows. Rows are ranked by _sample_key() of their rowid (when
+    executed by SQLite) or their position (when executed in Python).
+    If *key_names* are given, *n* rows are chosen from each group.
+    """
+    def __init__(self, n=None, fraction=None, seed=0, key_names=()):
+        self.n = n
+        self.fraction = fraction
+        self.seed = seed
+        self.key_names = tuple(key_names)
+
+    def choose(self, iterable):
+        """Return a list of elements chosen from *iterable*."""
+        keyed = [(_sample_key(i, self.seed), x) for i, x in enumerate(iterable, 1)]
+        if self.fraction is not None:
+            return [x for key, x in keyed if key < self.fraction]
+        if len(keyed) <= self.n:
+            return [x for key, x in keyed]
+        threshold = sorted(key for key, x in keyed)[self.n - 1]
+        return [x for key, x in keyed if key <= threshold]
+
+    def _args(self):
+        return (self.n, self.fraction, self.seed, self.key_names)
+
+    def __eq__(self, other):
+        if not isinstance(other, _RowSample):
+            return NotImplemented
+        return self._args() == other._args()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.__class__, self._args()))
+
+    def __repr__(self):
+        if self.fraction is not None:
+            size_repr = 'fraction={0!r}'.format(self.fraction)
+        else:
+            size_repr = 'n={0!r}'.format(self.n)
+        return 'sample({0}, seed={1!r})'.format(size_repr, self.seed)
+
+
+def _sample_data(sample, iterable):
+    """Return a reproducible sample of elements from *iterable* (see
+    _RowSample). Groups of items are sampled separately.
+    """
+    def dosample(itr):
+        if isinstance(itr, BaseElement):
+            return itr
+        return DataResult(sample.choose(itr), _get_evaluation_type(itr))
+
+    if _is_collection_of_items(iterable):
+        result = DictItems((k, dosample(v)) for k, v in iterable)
+        return DataResult(result, _get_evaluation_type(iterable))
+    return dosample(iterable)
+
+
 ########################################################
 # Main data handling classes (DataQuery and DataSource).
 ########################################################
 
+def _parallel_kwds(workers, executor):
+    """Return keyword arguments for parallel map and apply steps."""
+    kwds = {}
+    if workers:
+        kwds['workers'] = workers
+    if executor is not None:
+        kwds['executor'] = executor
+    return kwds
+
+
 class DataQuery(object):
     """A class to query data from a source object. Queries can be
     created, modified, and passed around without actually computing
@@ -633,12 +2007,22 @@ class DataQuery(object):
         new_query._query_steps = new_steps
         return new_query
 
-    def map(self, function):
+    def map(self, function, workers=None, executor=None):
         """Apply *function* to each element, keeping the results.
         If the group of data is a set type, it will be converted
         to a list (as the results may not be distinct or hashable).
+
+        If *workers* is given, elements are sent (in chunks) to a
+        pool of worker processes. Alternatively, an *executor* can
+        be given (any object with a ``map()`` method like a
+        :py:class:`multiprocessing.pool.Pool` or an executor from
+        :py:mod:`concurrent.futures`). The data is split into chunks
+        based on the number of *workers*, give it with an *executor*
+        to match its size (defaults to the number of CPUs). When using
+        processes, the *function* and data must be picklable. The
+        order of results is preserved.
         """
-        return self._add_step('map', function)
+        return self._add_step('map', function, **_parallel_kwds(workers, executor))
 
     def filter(self, function=None):
         """Filter elements, keeping only those values for which
@@ -654,12 +2038,17 @@ class DataQuery(object):
         """
         return self._add_step('reduce', function)
 
-    def apply(self, function):
+    def apply(self, function, workers=None, executor=None):
         """Apply *function* to entire group keeping the resulting data.
         If element is not iterable, it will be wrapped as a single-item
         list.
+
+        When the data is grouped (a mapping select), the groups can
+        be processed in parallel by giving a number of *workers* or
+        an *executor* (see :meth:`map`). Each group is evaluated and
+        sent to a worker process as a list or set.
         """
-        return self._add_step('apply', function)
+        return self._add_step('apply', function, **_parallel_kwds(workers, executor))
 
     def sum(self):
         """Get the sum of non-None elements."""
@@ -683,10 +2072,80 @@ class DataQuery(object):
         """Get the maximum value from elements."""
         return self._add_step('max')
 
+    def median(self):
+        """Get the median of non-None elements (the average of the two
+        middle values when there is an even number of elements).
+        """
+        return self._add_step('median')
+
+    def stddev(self):
+        """Get the sample standard deviation of non-None elements."""
+        return self._add_step('stddev')
+
+    def variance(self):
+        """Get the sample variance of non-None elements."""
+        return self._add_step('variance')
+
+    def percentile(self, p):
+        """Get the *p*-th percentile (a number from 0 to 100) of
+        non-None elements using linear interpolation.
+        """
+        if not 0 <= p <= 100:
+            raise ValueError('p must be between 0 and 100, got {0!r}'.format(p))
+        return self._add_step('percentile', p)
+
+    def approx_count_distinct(self, error=0.01):
+        """Get an estimate of the number of distinct non-None elements
+        using a HyperLogLog sketch. The *error* is the target relative
+        standard error--smaller values use more memory.
+        """
+        _hll_precision(error)  # <- Validate error.
+        return self._add_step('approx_count_distinct', error)
+
+    def approx_quantile(self, q, error=0.01):
+        """Get an estimate of the *q*-th quantile (a number from 0 to
+        1) of non-None elements using a mergeable quantile sketch. The
+        *error* is the approximate rank error of the estimate--smaller
+        values use more memory.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1, got {0!r}'.format(q))
+        _quantile_sketch_k(error)  # <- Validate error.
+        return self._add_step('approx_quantile', q, error)
+
     def distinct(self):
         """Filter elements, removing duplicate values."""
         return self._add_step('distinct')
 
+    def sample(self, n=None, fraction=None, seed=0):
+        """Keep a reproducible sample of *n* elements or of a
+        *fraction* (greater than 0 and up to 1) of elements. The
+        same *seed* always selects the same elements::
+
+            source('A').sample(n=1000).sum()
+
+        When the data is grouped (a mapping select), each group is
+        sampled separately. If this is the first step of a query on
+        a :class:`DataSource`, the sample is chosen by SQLite (using
+        the rows' rowid) and unsampled rows are never processed.
+        """
+        if (n is None) == (fraction is None):
+            raise TypeError("must give exactly one of 'n' or 'fraction'")
+        if n is not None and (not isinstance(n, int) or n < 1):
+            raise ValueError('n must be a positive integer, got {0!r}'.format(n))
+        if fraction is not None and not 0 < fraction <= 1:
+            msg = 'fraction must be greater than 0 and up to 1, got {0!r}'
+            raise ValueError(msg.format(fraction))
+        if not isinstance(seed, int):
+            raise TypeError('seed must be an integer, got {0!r}'.format(seed))
+
+        kwds = {'seed': seed}
+        if n is not None:
+            kwds['n'] = n
+        else:
+            kwds['fraction'] = fraction
+        return self._add_step('sample', **kwds)
+
     @staticmethod
     def _translate_step(query_step):
         """Accept a query step and return a corresponding execution
@@ -694,9 +2153,11 @@ class DataQuery(object):
         """
         name, query_args, query_kwds = query_step
 
+        kwds = {}
         if name == 'map':
             function = _map_data
             args = (query_args[0], RESULT_TOKEN,)
+            kwds = dict(query_kwds)
         elif name == 'filter':
             function = _filter_data
             args = (query_args[0], RESULT_TOKEN,)
@@ -706,6 +2167,7 @@ class DataQuery(object):
         elif name == 'apply':
             function = _apply_data
             args = (query_args[0], RESULT_TOKEN,)
+            kwds = dict(query_kwds)
         elif name == 'sum':
             function = _apply_to_data
             args = (_sqlite_sum, RESULT_TOKEN)
@@ -721,19 +2183,46 @@ class DataQuery(object):
         elif name == 'max':
             function = _apply_to_data
             args = (_sqlite_max, RESULT_TOKEN)
+        elif name == 'median':
+            function = _apply_to_data
+            args = (_sqlite_median, RESULT_TOKEN)
+        elif name == 'stddev':
+            function = _apply_to_data
+            args = (_sqlite_stddev, RESULT_TOKEN)
+        elif name == 'variance':
+            function = _apply_to_data
+            args = (_sqlite_variance, RESULT_TOKEN)
+        elif name == 'percentile':
+            function = _apply_to_data
+            args = (_SqlitePercentile(query_args[0]), RESULT_TOKEN)
+        elif name == 'approx_count_distinct':
+            function = _apply_to_data
+            args = (_ApproxCountDistinct(query_args[0]), RESULT_TOKEN)
+        elif name == 'approx_quantile':
+            function = _apply_to_data
+            args = (_ApproxQuantile(*query_args), RESULT_TOKEN)
         elif name == 'distinct':
             function = _sqlite_distinct
             args = (RESULT_TOKEN,)
+        elif name == 'sample':
+            function = _sample_data
+            args = (_RowSample(**query_kwds), RESULT_TOKEN)
         elif name == 'select':
             raise ValueError("this method does not handle 'select' step")
         else:
             raise ValueError('unrecognized query function {0!r}'.format(name))
 
-        return _execution_step(function, args, {})
+        return _execution_step(function, args, kwds)
 
     def _get_execution_plan(self, source, query_steps):
         if isinstance(source, DataSource):
             args, kwds = self._data_args
+            if query_steps and query_steps[0][0] == 'sample':
+                # Sample rows using a where-clause condition on rowid.
+                key_names = _get_key_names(_parse_select(args[0])[0])
+                sample = _RowSample(key_names=key_names, **query_steps[0][2])
+                kwds = dict(kwds, _rowid_=sample)
+                query_steps = query_steps[1:]
             execution_plan = [
                 _execution_step(getattr, (RESULT_TOKEN, '_select'), {}),
                 _execution_step(RESULT_TOKEN, args, kwds),
@@ -752,44 +2241,37 @@ class DataQuery(object):
         try:
             step_0 = execution_plan[0]
             step_1 = execution_plan[1]
-            step_2 = execution_plan[2]
-            remaining_steps = execution_plan[3:]
+            execution_plan[2]
         except IndexError:
             return None  # <- EXIT!
 
         if step_0 != (getattr, (RESULT_TOKEN, '_select'), {}):
             return None  # <- EXIT!
 
-        if step_2[0] == _apply_to_data:
-            func_dict = {
-                _sqlite_sum: 'SUM',
-                _sqlite_count: 'COUNT',
-                _sqlite_avg: 'AVG',
-                _sqlite_min: 'MIN',
-                _sqlite_max: 'MAX',
-            }
-            py_function = step_2[1][0]
-            sqlite_function = func_dict.get(py_function, None)
-            if sqlite_function:
-                func_1, args_1, kwds_1 = step_1
-                args_1 = (sqlite_function,) + args_1  # <- Add SQL function
-                optimized_steps = (                   #    as 1st arg.
-                    (getattr, (RESULT_TOKEN, '_select_aggregate'), {}),
-                    (func_1, args_1, kwds_1),
-                )
-            else:
-                optimized_steps = ()
-        elif step_2 == (_sqlite_distinct, (RESULT_TOKEN,), {}):
+        func_1, args_1, kwds_1 = step_1
+        compiled, remaining_steps = _get_compiled_steps(args_1[0], execution_plan[2:])
+        if not compiled:
+            return None  # <- EXIT!
+
+        if compiled[0][0] == 'aggregate':
+            sqlite_function = compiled[0][1]
+            args_1 = (sqlite_function,) + args_1  # <- Add SQL function
+            optimized_steps = (                   #    as 1st arg.
+                (getattr, (RESULT_TOKEN, '_select_aggregate'), {}),
+                (func_1, args_1, kwds_1),
+            )
+        elif compiled[0][0] == 'distinct':
             optimized_steps = (
                 (getattr, (RESULT_TOKEN, '_select_distinct'), {}),
                 step_1,
             )
         else:
-            optimized_steps = ()
-
-        if optimized_steps:
-            return optimized_steps + remaining_steps
-        return None
+            args_1 = (compiled,) + args_1  # <- Add compiled steps as 1st arg.
+            optimized_steps = (
+                (getattr, (RESULT_TOKEN, '_select_compiled'), {}),
+                (func_1, args_1, kwds_1),
+            )
+        return optimized_steps + remaining_steps
 
     def fetch(self):
         """Executes query and returns an eagerly evaluated result."""
@@ -798,6 +2280,51 @@ class DataQuery(object):
             return result.fetch()
         return result
 
+    def afetch(self, executor=None):
+        """Return an :py:class:`asyncio.Future` for the result of
+        :meth:`fetch`. The query is executed in a thread of the given
+        *executor* (defaults to the event loop's default executor)
+        using its own connection to the data source's database::
+
+            result = await query.afetch()
+
+        Use :func:`afetch_many` to run several queries with bounded
+        parallelism. This method requires Python 3.4 or newer.
+        """
+        if asyncio is None:
+            raise ImportError(
+                "No module named 'asyncio'\n"
+                "\n"
+                "This method requires Python 3.4 or newer."
+            )
+        if not self._data_source:
+            raise ValueError("missing 'source' argument, none found")
+        source = self._data_source
+        if isinstance(source, DataSource):
+            # Lazy columns are loaded using the source's own connection
+            # which can only be used from this thread (see _get_worker).
+            source._load_columns(source.fieldnames)
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(executor, self._fetch_in_worker)
+
+    def _fetch_in_worker(self):
+        """Fetch result using a worker copy of the data source (so the
+        query runs on its own database connection).
+        """
+        source = self._data_source
+        if not isinstance(source, DataSource):
+            return self.fetch()  # <- EXIT!
+
+        worker = source._get_worker()
+        try:
+            query = self.__class__.__new__(self.__class__)
+            query._data_args = self._data_args
+            query._data_source = worker
+            query._query_steps = self._query_steps
+            return query.fetch()
+        finally:
+            source._release_worker(worker)
+
     def __call__(self, source=None, optimize=True):
         """A DataQuery can be called like a function to execute
         it and return a value or :class:`DataResult` appropriate
@@ -821,6 +2348,13 @@ class DataQuery(object):
                 raise ValueError("missing 'source' argument, none found")
             result = self._data_source
 
+        cache = getattr(result, '_cache', None)
+        if cache is not None:
+            cache_key = self._get_cache_key(optimize)
+            found, frozen = cache.get(cache_key, result._get_data_version())
+            if found:
+                return _thaw_result(frozen)  # <- EXIT!
+
         execution_plan = self._get_execution_plan(result, self._query_steps)
         if optimize:
             execution_plan = self._optimize(execution_plan) or execution_plan
@@ -833,15 +2367,38 @@ class DataQuery(object):
             keywords = dict((k, replace_token(v)) for k, v in keywords.items())
             result = function(*args, **keywords)
 
+        if cache is not None:
+            frozen = _freeze_result(result)
+            cache.set(cache_key, frozen)
+            result = _thaw_result(frozen)
+
         return result
 
-    def _explain(self, optimize=True, file=sys.stdout):
-        """A convenience method primarily intended to help when
-        debugging and developing execution plan optimizations.
+    def _get_cache_key(self, optimize=True):
+        """Return a hashable key that identifies the query's select,
+        where, and query step arguments. Unhashable arguments (like
+        some callable objects) are identified by their identity.
+        """
+        args, kwds = self._data_args
+        steps = tuple((name, _make_hashable(args), _make_hashable(kwds))
+                      for name, args, kwds in self._query_steps)
+        return (_make_hashable(args), _make_hashable(kwds), steps, bool(optimize))
+
+    def explain(self, optimize=True, file=sys.stdout, analyze=False):
+        """Print the query's execution plan to the text stream *file*
+        (defaults to stdout). If *optimize* is True, an optimized plan
+        will be printed if one can be constructed::
+
+            source('A').map(int).sum().explain()
+
+        If *analyze* is True, the query is executed and the time
+        taken and rows produced are printed for each step (results
+        are evaluated after each step so that lazy evaluation does
+        not hide their cost). Steps that run SQL statements also
+        print SQLite's query plan with full table scans and temporary
+        B-trees flagged::
 
-        Prints execution plan to the text stream *file* (defaults
-        to stdout). If *optimize* is True, an optimized plan will
-        be printed if one can be constructed.
+            source('A').map(int).sum().explain(analyze=True)
 
         If *file* is set to None, returns execution plan as a string.
         """
@@ -850,6 +2407,8 @@ class DataQuery(object):
             source_repr = repr(source)
             if len(source_repr) > 70:
                 source_repr = source_repr[:67] + '...'
+        elif analyze:
+            raise ValueError("missing data source, cannot analyze query")
         else:
             source = DataSource([], fieldnames=['dummy_source'])
             source_repr = '<none given> (assuming DataSource object)'
@@ -863,11 +2422,17 @@ class DataQuery(object):
                 execution_plan = optimized_plan
                 optimized_text = ' (optimized)'
 
-        steps = [_get_step_repr(step) for step in execution_plan]
-        steps = '\n'.join('  {0}'.format(step) for step in steps)
+        steps = ['  {0}'.format(_get_step_repr(step)) for step in execution_plan]
+        if analyze:
+            analysis, total_seconds = self._analyze(source, execution_plan)
+            steps = [step + ''.join('\n    ' + x for x in lines)
+                     for step, lines in zip(steps, analysis)]
+        steps = '\n'.join(steps)
 
         formatted = 'Data Source:\n  {0}\nExecution Plan{1}:\n{2}'
         formatted = formatted.format(source_repr, optimized_text, steps)
+        if analyze:
+            formatted = '{0}\nTotal Time:\n  {1:.6f} sec'.format(formatted, total_seconds)
 
         if file:
             file.write(formatted)
@@ -875,6 +2440,59 @@ class DataQuery(object):
         else:
             return formatted
 
+    _explain = explain  # <- Alias for earlier, private name.
+
+    @staticmethod
+    def _analyze(source, execution_plan):
+        """Execute *execution_plan* and return a 2-tuple containing a
+        list of analysis lines for each step and the total time (in
+        seconds) taken to execute all steps. SQL statements are only
+        reported for DataSource objects (other objects are just timed).
+        """
+        analysis = []
+        total_seconds = 0.0
+        result = source
+        replace_token = lambda x: result if x is RESULT_TOKEN else x
+        statements = []
+        log_statements = isinstance(source, DataSource)
+        if log_statements:
+            source._statement_log = statements
+        try:
+            for step in execution_plan:
+                function, args, keywords = step  # Unpack 3-tuple.
+                function = replace_token(function)
+                args = tuple(replace_token(x) for x in args)
+                keywords = dict((k, replace_token(v)) for k, v in keywords.items())
+
+                del statements[:]
+                start = _timer()
+                result = function(*args, **keywords)
+                if callable(result):
+                    rows = None
+                else:
+                    frozen = _freeze_result(result)  # <- Evaluates result.
+                    rows = _count_frozen_rows(frozen)
+                seconds = _timer() - start
+                total_seconds += seconds
+
+                if rows is None:
+                    lines = ['time: {0:.6f} sec'.format(seconds)]
+                else:
+                    lines = ['time: {0:.6f} sec, rows: {1}'.format(seconds, rows)]
+                    result = _thaw_result(frozen)
+                for statement, params in statements:
+                    lines.append('sql: {0}'.format(' '.join(statement.split())))
+                    if params:
+                        lines.append('params: {0!r}'.format(params))
+                    lines.append('query plan:')
+                    query_plan = _get_query_plan(source._connection, statement, params)
+                    lines.extend('  ' + x for x in query_plan)
+                analysis.append(lines)
+        finally:
+            if log_statements:
+                source._statement_log = None
+        return analysis, total_seconds
+
     def __repr__(self):
         name_or_repr = lambda x: getattr(x, '__name__', None) or repr(x)
 
@@ -900,52 +2518,619 @@ class DataQuery(object):
 
         all_steps_repr = []
         for step_name, step_args, step_kwds in self._query_steps:
-            if step_kwds:
-                step_kwds_repr = [(k, name_or_repr(v)) for k, v in step_kwds.items()]
-                step_kwds_repr = ['{0}={1}'.format(k, v) for k, v in step_kwds_repr]
-                step_kwds_repr = ', {0}'.format(', '.join(step_kwds_repr))
-            else:
-                step_kwds_repr = ''
-            step_args_repr = ', '.join(name_or_repr(arg) for arg in step_args)
-            step_repr = '{0}({1}{2})'.format(step_name, step_args_repr, step_kwds_repr)
+            step_kwds_repr = [(k, name_or_repr(v)) for k, v in sorted(step_kwds.items())]
+            step_kwds_repr = ['{0}={1}'.format(k, v) for k, v in step_kwds_repr]
+            step_args_repr = [name_or_repr(arg) for arg in step_args]
+            step_repr = '{0}({1})'.format(step_name, ', '.join(step_args_repr + step_kwds_repr))
             all_steps_repr.append(step_repr)
 
-        if all_steps_repr:
-            query_steps_repr = '.' + ('.'.join(all_steps_repr))
-        else:
-            query_steps_repr = ''
+        if all_steps_repr:
+            query_steps_repr = '.' + ('.'.join(all_steps_repr))
+        else:
+            query_steps_repr = ''
+
+        return '{0}{1}({2}{3}{4}){5}'.format(class_repr,
+                                             method_repr,
+                                             source_repr,
+                                             args_repr,
+                                             kwds_repr,
+                                             query_steps_repr)
+
+
+def afetch_many(queries, max_workers=4):
+    """Return an :py:class:`asyncio.Future` for a list of results
+    from the given *queries* (in the same order). The queries are
+    executed in a pool of *max_workers* threads, each using its own
+    database connection (see :meth:`DataQuery.afetch`)::
+
+        results = await datatest.afetch_many([query1, query2, query3])
+
+    This function requires Python 3.4 or newer.
+    """
+    if asyncio is None:
+        raise ImportError(
+            "No module named 'asyncio'\n"
+            "\n"
+            "This function requires Python 3.4 or newer."
+        )
+    executor = ThreadPoolExecutor(max_workers)
+    futures = [query.afetch(executor) for query in queries]
+    gathered = asyncio.gather(*futures)
+    gathered.add_done_callback(lambda future: executor.shutdown(wait=False))
+    return gathered
+
+
+_connection_registries = weakref.WeakKeyDictionary()
+def _get_registry(connection):
+    """Return a dictionary of the functions registered with SQLite
+    *connection* (used to prevent registering the same function more
+    than once). Registries are keyed by weak references so they are
+    discarded, along with the functions they hold, when the connection
+    is garbage collected.
+    """
+    registry = _connection_registries.get(connection)
+    if registry is None:
+        registry = _connection_registries[connection] = {}
+    return registry
+
+
+def _register_function(connection, func_list):
+    """Register user-defined functions with SQLite connection.
+
+    This uses the connection's registry to prevent from registering
+    the same function multiple times with the same connection.
+    """
+    registered = _get_registry(connection).setdefault('functions', set())
+    for func in func_list:
+        func_id = id(func)
+        if func_id in registered:
+            continue  # <- Skip if already registered.
+
+        registered.add(func_id)
+
+        name = 'FUNC{0}'.format(func_id)
+        if isinstance(func, collections.Hashable):
+            connection.create_function(name, 1, func)  # <- Register!
+        else:
+            @functools.wraps(func)
+            def wrapper(x):
+                return func(x)
+            connection.create_function(name, 1, wrapper)  # <- Register!
+
+
+def _register_aggregates(connection):
+    """Register MEDIAN, PERCENTILE, VARIANCE, STDDEV, and the
+    APPROX_COUNT_DISTINCT and APPROX_QUANTILE aggregate functions
+    with SQLite connection.
+    """
+    registry = _get_registry(connection)
+    if 'aggregates' not in registry:
+        for name, num_params, aggregate_class in _sqlite_aggregate_classes:
+            connection.create_aggregate(name, num_params, aggregate_class)
+        registry['aggregates'] = True
+
+
+def _register_regexp(connection):
+    """Register the REGEXP function with SQLite connection."""
+    registry = _get_registry(connection)
+    if 'regexp' not in registry:
+        connection.create_function('REGEXP', 2, _sqlite_regexp)  # <- Register!
+        registry['regexp'] = True
+
+
+def _register_sample_key(connection):
+    """Register the SAMPLE_KEY function with SQLite connection."""
+    registry = _get_registry(connection)
+    if 'sample_key' not in registry:
+        connection.create_function('SAMPLE_KEY', 2, _sample_key)  # <- Register!
+        registry['sample_key'] = True
+
+
+try:
+    _sqlite_native_types = (type(None), int, long, float, basestring, buffer)
+except NameError:
+    _sqlite_native_types = (type(None), int, float, str, bytes, Binary)
+
+
+_compiled_value_alias = '_compiled_value'  # <- Name of values computed in subqueries.
+
+
+class _UnsupportedStepResult(TypeError):
+    """Raised when a compiled map step returns a value that SQLite
+    cannot store.
+    """
+
+
+_sqlite_integer_range = (-9223372036854775808, 9223372036854775807)  # <- 64-bit.
+
+
+class _StepFunction(object):
+    """Callable wrapper for a map or filter step function registered
+    with SQLite. Exceptions raised while the function is called by
+    SQLite are appended to the current list of *errors* so they can
+    be inspected after execution.
+    """
+    def __init__(self, kind, func):
+        if kind == 'filter' and func is None:
+            func = bool
+        self.kind = kind
+        self.func = func
+        self.errors = []
+        self.memo = None  # <- When a dict, results are memoized by value.
+
+    def __call__(self, x):
+        memo = self.memo
+        if memo is None:
+            return self._call(x)  # <- EXIT!
+
+        key = (x.__class__, x)
+        try:
+            return memo[key]
+        except KeyError:
+            result = memo[key] = self._call(x)
+            return result
+        except TypeError:  # <- Unhashable value.
+            return self._call(x)
+
+    def _call(self, x):
+        try:
+            result = self.func(x)
+        except Exception:
+            self.errors.append(sys.exc_info()[1])
+            raise
+
+        if self.kind == 'filter':
+            return bool(result)
+        if isinstance(result, _sqlite_numeric_types) and not isinstance(result, float):
+            low, high = _sqlite_integer_range
+            if low <= result <= high:
+                return result
+            error = _UnsupportedStepResult('integer result out of range: {0}'.format(result))
+        elif isinstance(result, _sqlite_native_types):
+            return result
+        else:
+            error = _UnsupportedStepResult(
+                'unsupported result type: {0}'.format(result.__class__.__name__))
+        self.errors.append(error)
+        raise error
+
+
+def _register_step_function(connection, kind, func, errors, memoize=False):
+    """Register a map or filter step *func* with SQLite *connection*
+    and return the name of the registered function. Exceptions raised
+    when SQLite calls the function are appended to *errors*. If
+    *memoize* is True, *func* is called only once for each distinct
+    value (until _clear_step_memos() is called).
+
+    Like _register_function(), this uses the connection's registry to
+    prevent registering the same function multiple times with the
+    same connection (functions can not be replaced while statements
+    that use them are still active).
+    """
+    name = '{0}{1}'.format(kind.upper(), id(func))
+    step_functions = _get_registry(connection).setdefault('steps', {})
+    step_function = step_functions.get(name)
+    if step_function is None:
+        step_function = _StepFunction(kind, func)
+        connection.create_function(name, 1, step_function)  # <- Register!
+        step_functions[name] = step_function
+    step_function.errors = errors
+    step_function.memo = {} if memoize else None
+    return name
+
+
+def _clear_step_memos(connection):
+    """Discard memoized results of the step functions registered with
+    *connection* (called when a compiled query finishes).
+    """
+    step_functions = _get_registry(connection).get('steps', {})
+    for step_function in step_functions.values():
+        step_function.memo = None
+
+
+def _iter_batches(cursor, batch_size):
+    """Return an iterator of rows from a DBAPI2-compliant *cursor*
+    that fetches *batch_size* rows at a time. If *cursor* has no
+    fetchmany() method, it is iterated over directly.
+    """
+    fetchmany = getattr(cursor, 'fetchmany', None)
+    if fetchmany is None:
+        return iter(cursor)  # <- EXIT!
+
+    def generate_rows():
+        while True:
+            rows = fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+    return generate_rows()
+
+
+def _reraise_step_errors(cursor, errors, connection):
+    """Iterate over *cursor* and re-raise the original exception when a
+    compiled step function fails. Memoized step results are cleared
+    once iteration ends.
+    """
+    try:
+        for row in cursor:
+            yield row
+    except sqlite3.OperationalError:
+        if errors:
+            raise errors[-1]
+        raise
+    finally:
+        _clear_step_memos(connection)
+
+
+class _IdentityKey(object):
+    """Wraps an object so it can be used as part of a dictionary key
+    using its identity (for unhashable callables, etc.). The wrapper
+    keeps a reference to the object so its id() can not be reused.
+    """
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _IdentityKey) and other.obj is self.obj
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+def _make_hashable(obj):
+    """Return a hashable representation of *obj* for use as a cache
+    key. Container types are included so that, for example, a list
+    and a set selection produce different keys.
+    """
+    if isinstance(obj, collections.Mapping):
+        items = [(_make_hashable(k), _make_hashable(v)) for k, v in obj.items()]
+        return (obj.__class__, tuple(sorted(items, key=repr)))
+    if _is_nsiterable(obj) and not callable(obj):
+        if isinstance(obj, collections.Set):
+            items = tuple(sorted((_make_hashable(x) for x in obj), key=repr))
+        else:
+            items = tuple(_make_hashable(x) for x in obj)
+        return (obj.__class__, items)
+    if isinstance(obj, collections.Hashable):
+        try:
+            hash(obj)
+            return (obj.__class__, obj)
+        except TypeError:
+            pass
+    return _IdentityKey(obj)
+
+
+def _estimate_size(obj):
+    """Return approximate memory used by *obj* and its contents."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, BaseElement) and not isinstance(obj, collections.Mapping):
+        return size
+    if isinstance(obj, collections.Mapping):
+        for key, value in obj.items():
+            size += _estimate_size(key) + _estimate_size(value)
+    elif isinstance(obj, _Iterable):
+        for value in obj:
+            size += _estimate_size(value)
+    return size
+
+
+_CacheInfo = collections.namedtuple(
+    typename='CacheInfo',
+    field_names=('hits', 'misses', 'maxbytes', 'currbytes'),
+)
+
+
+class _QueryCache(object):
+    """A least-recently-used cache of evaluated query results limited
+    to approximately *maxbytes* of memory.
+
+    The cache is cleared whenever the given *version* changes (see
+    :meth:`DataSource._get_data_version`).
+    """
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.currbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = {}  # <- Maps keys to [last_used, size, value].
+        self._counter = itertools.count()
+
+    def clear(self):
+        self._entries.clear()
+        self.currbytes = 0
+
+    def get(self, key, version):
+        """Return a 2-tuple of (found, value) for the given *key*."""
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None  # <- EXIT!
+
+        self.hits += 1
+        entry[0] = next(self._counter)
+        return True, entry[2]
+
+    def set(self, key, value):
+        size = _estimate_size(value)
+        if size > self.maxbytes:
+            return  # <- EXIT! (Too large to cache.)
+
+        if key in self._entries:
+            self.currbytes -= self._entries[key][1]
+        self._entries[key] = [next(self._counter), size, value]
+        self.currbytes += size
+
+        while self.currbytes > self.maxbytes:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            self.currbytes -= self._entries.pop(oldest)[1]
+
+    def info(self):
+        return _CacheInfo(self.hits, self.misses, self.maxbytes, self.currbytes)
+
+
+def _freeze_result(result):
+    """Return a cacheable, fully-evaluated copy of a query *result*."""
+    if not isinstance(result, DataResult):
+        return ('value', result)  # <- EXIT!
+
+    evaluation_type = result.evaluation_type
+    if issubclass(evaluation_type, collections.Mapping):
+        items = []
+        for key, value in result:
+            if isinstance(value, DataResult):
+                items.append((key, value.evaluation_type, value.evaluation_type(value)))
+            else:
+                items.append((key, None, value))
+        return ('mapping', evaluation_type, tuple(items))
+    return ('result', evaluation_type, evaluation_type(result))
+
+
+def _count_frozen_rows(frozen):
+    """Return the number of values in a result made by
+    _freeze_result() (values in grouped results are counted
+    for every group).
+    """
+    if frozen[0] == 'value':
+        return 1  # <- EXIT!
+
+    if frozen[0] == 'mapping':
+        items = frozen[2]
+        return sum((len(val) if typ else 1) for _, typ, val in items)
+
+    return len(frozen[2])
+
+
+def _get_query_plan(connection, statement, params):
+    """Return a list of lines describing the query plan SQLite uses
+    for *statement*. Full table scans and temporary B-trees (used to
+    sort or group results) are flagged.
+    """
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, params)
+
+    depths = {0: -1}
+    lines = []
+    for row in cursor.fetchall():
+        node_id, parent_id, detail = row[0], row[1], row[-1]
+        depth = depths.get(parent_id, -1) + 1
+        depths[node_id] = depth
+
+        flags = []
+        if detail.startswith('SCAN') and 'INDEX' not in detail:
+            flags.append('full scan')
+        if 'TEMP B-TREE' in detail:
+            flags.append('temp b-tree')
+        if flags:
+            detail = '{0}  <- {1}'.format(detail, ', '.join(flags))
+        lines.append('{0}{1}'.format('  ' * depth, detail))
+    return lines
+
+
+def _thaw_result(frozen):
+    """Rebuild a query result from a value made by _freeze_result()."""
+    if frozen[0] == 'value':
+        return frozen[1]  # <- EXIT!
+
+    if frozen[0] == 'mapping':
+        _, evaluation_type, items = frozen
+        rebuild = lambda typ, val: DataResult(iter(val), typ) if typ else val
+        items = DictItems((k, rebuild(typ, val)) for k, typ, val in items)
+        return DataResult(items, evaluation_type)
+
+    _, evaluation_type, value = frozen
+    return DataResult(iter(value), evaluation_type)
+
+
+_ColumnStats = collections.namedtuple(
+    typename='ColumnStats',
+    field_names=('rows', 'distinct', 'nulls', 'min', 'max', 'type'),
+)
+
+
+_stats_type_names = ('INTEGER', 'REAL', 'TEXT', 'BLOB')
+
+
+def _infer_stats_type(type_counts):
+    """Return the inferred type name for a column given a sequence
+    of counts for each type in _stats_type_names.
+    """
+    present = [name for name, count in zip(_stats_type_names, type_counts) if count]
+    if not present:
+        return None
+    if len(present) == 1:
+        return present[0]
+    if set(present) == set(['INTEGER', 'REAL']):
+        return 'REAL'
+    return 'MIXED'
+
+
+try:
+    _timer = time.perf_counter  # New in Python 3.3
+except AttributeError:
+    _timer = time.time
+
+
+_IndexRecommendation = collections.namedtuple(
+    typename='IndexRecommendation',
+    field_names=('columns', 'queries', 'seconds'),
+)
 
-        return '{0}{1}({2}{3}{4}){5}'.format(class_repr,
-                                             method_repr,
-                                             source_repr,
-                                             args_repr,
-                                             kwds_repr,
-                                             query_steps_repr)
 
+_IndexBenefit = collections.namedtuple(
+    typename='IndexBenefit',
+    field_names=('columns', 'queries_before', 'seconds_before',
+                 'queries_after', 'seconds_after', 'seconds_saved'),
+)
 
-_registered_function_ids = collections.defaultdict(set)
-def _register_function(connection, func_list):
-    """Register user-defined functions with SQLite connection.
 
-    This uses a global defaultdict to prevent from registering
-    the same function multiple times with the same connection.
+class _TimedCursor(object):
+    """Wraps a DBAPI2 *cursor* and passes the time spent fetching
+    rows to *add_seconds* (SQLite does most of the work for a query
+    while rows are fetched, not when the statement is executed).
     """
-    connection_id = id(connection)
-    for func in func_list:
-        func_id = id(func)
-        if func_id in _registered_function_ids[connection_id]:
-            return  # <- EXIT! (if already registered)
+    def __init__(self, cursor, add_seconds):
+        self._cursor = cursor
+        self._add_seconds = add_seconds
 
-        _registered_function_ids[connection_id].add(func_id)
+    def _timed(self, method, *args):
+        start = _timer()
+        try:
+            return method(*args)
+        finally:
+            self._add_seconds(_timer() - start)
 
-        name = 'FUNC{0}'.format(func_id)
-        if isinstance(func, collections.Hashable):
-            connection.create_function(name, 1, func)  # <- Register!
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def next(self):  # <- For Python 2.
+        return self.__next__()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _IndexAdvisor(object):
+    """Records the columns used in WHERE, GROUP BY, and ORDER BY
+    clauses (with the number of queries and the time spent executing
+    them) and suggests indexes that could speed up these queries.
+
+    A candidate index is made from a query's equality where-columns
+    followed by its grouping or ordering columns. When a query also
+    has a range condition (like :func:`gt` or :func:`between`), its
+    column is used last instead of the grouping or ordering columns
+    (an index can not help with either after a range). Once a
+    candidate has been used by *threshold* or more queries, it is
+    recommended.
+    """
+    def __init__(self, threshold, auto_index):
+        self.threshold = threshold
+        self.auto_index = auto_index
+        self.usage = {}       # <- Maps (clause, column) to [queries, seconds].
+        self.candidates = {}  # <- Maps columns to [queries, seconds].
+        self.built = {}       # <- Maps columns to [before, seconds, after, seconds].
+        self.pending = []     # <- Candidates waiting to be built.
+
+    def record(self, where_columns, range_columns, key_columns, key_clause):
+        """Record a query and return a function that adds a number
+        of seconds to the time spent executing it (the time is added
+        as results are fetched).
+        """
+        timed = []  # <- List of (stats, index) to add seconds to.
+        for column in tuple(where_columns) + tuple(range_columns):
+            timed.append((self._add(self.usage, ('WHERE', column)), 1))
+        for column in key_columns:
+            timed.append((self._add(self.usage, (key_clause, column)), 1))
+
+        columns = tuple(where_columns)
+        if range_columns:
+            columns += tuple(range_columns[:1])  # <- Only one range is usable.
         else:
-            @functools.wraps(func)
-            def wrapper(x):
-                return func(x)
-            connection.create_function(name, 1, wrapper)  # <- Register!
+            columns += tuple(x for x in key_columns if x not in columns)
+
+        if columns in self.built:
+            self.built[columns][2] += 1
+            timed.append((self.built[columns], 3))
+        elif columns:
+            stats = self._add(self.candidates, columns)
+            timed.append((stats, 1))
+            if (self.auto_index
+                    and stats[0] >= self.threshold
+                    and columns not in self.pending):
+                self.pending.append(columns)
+
+        def add_seconds(seconds):
+            for stats, index in timed:
+                stats[index] += seconds
+        return add_seconds
+
+    @staticmethod
+    def _add(dictionary, key):
+        stats = dictionary.setdefault(key, [0, 0.0])
+        stats[0] += 1
+        return stats
+
+    def mark_built(self, columns):
+        """Start tracking the benefit of an index on *columns*."""
+        columns = tuple(columns)
+        if columns in self.pending:
+            self.pending.remove(columns)
+        if columns not in self.built:
+            queries, seconds = self.candidates.pop(columns, (0, 0.0))
+            self.built[columns] = [queries, seconds, 0, 0.0]
+
+    def recommendations(self, is_indexed):
+        """Return a list of recommended indexes ordered by the total
+        time spent executing the queries that would use them.
+        """
+        recommended = []
+        for columns, (queries, seconds) in self.candidates.items():
+            if queries >= self.threshold and not is_indexed(columns):
+                recommended.append(_IndexRecommendation(columns, queries, seconds))
+        recommended.sort(key=lambda x: (-x.seconds, x.columns))
+        return recommended
+
+    def report(self):
+        """Return a list of benefits delivered by indexes built while
+        the advisor was enabled.
+        """
+        report = []
+        for columns, stats in self.built.items():
+            queries_before, seconds_before, queries_after, seconds_after = stats
+            if queries_before and queries_after:
+                average_before = seconds_before / queries_before
+                saved = average_before * queries_after - seconds_after
+            else:
+                saved = None
+            report.append(_IndexBenefit(columns, queries_before, seconds_before,
+                                        queries_after, seconds_after, saved))
+        report.sort(key=lambda x: x.columns)
+        return report
 
 
 class DataSource(object):
@@ -974,20 +3159,91 @@ class DataSource(object):
             {'A': 'z', 'B': 300},
         ]
         source = datatest.DataSource(data)
+
+    Each data source loads its data into its own in-memory database
+    (configured with :attr:`pragmas`). To load data into the same
+    database as another source (so that both tables can be used in
+    the same SQL statement), give the other source as *database*::
+
+        source2 = datatest.DataSource(data2, fieldnames, database=source)
+
+    To load only some of the columns, give their names as *usecols*.
+    When *lazy* is True, no data is loaded until it is first queried
+    and then only the columns used by each query are loaded::
+
+        source = datatest.DataSource(data, fieldnames, lazy=True)
+
+    Lazy sources keep a reference to *data* (iterators are read into
+    a list) so that columns can be loaded later.
+
+    The :meth:`from_csv` and :meth:`from_excel` constructors also
+    accept *database*, *usecols*, and *lazy* keyword arguments.
     """
-    def __init__(self, data, fieldnames=None):
+    #: The number of rows to fetch from the database at a time when
+    #: iterating over query results (larger values use more memory
+    #: but make fewer calls to the database).
+    batch_size = 1024
+
+    #: Where-value collections with more items than this are loaded
+    #: into an indexed temporary table (and matched with a subquery)
+    #: instead of being passed as one SQL parameter per item.
+    in_table_threshold = 500
+
+    #: A mapping of SQLite pragmas (like ``cache_size``, ``temp_store``,
+    #: ``mmap_size``, or ``page_size``) to use for the database of each
+    #: new data source. For example, ``{'cache_size': -65536}`` sets a
+    #: 64 MiB page cache.
+    pragmas = None
+
+    def __init__(self, data, fieldnames=None, database=None, lazy=False,
+                 usecols=None):
         """Initialize self."""
-        temptable = TemporarySqliteTable(data, fieldnames)
-        self._connection = temptable.connection
-        self._table = temptable.name
+        database = self._get_database(database)
+        self._database = database
+        self._connection = database.connection
+        data_class_name = data.__class__.__name__
+
+        if lazy:
+            if not isinstance(data, collections.Sequence):
+                data = list(data)
+            if not fieldnames:
+                fieldnames, _ = _get_columns_from_data(data)
+            _, selected = _select_columns([], fieldnames, usecols)
+
+            def load_table(columns):
+                rows, columns = _select_columns(data, fieldnames, columns)
+                return TemporarySqliteTable(rows, columns, database.connection).name
+            self._lazy_table = _LazyTable(selected, load_table, database.connection)
+        else:
+            data, fieldnames = _select_columns(data, fieldnames, usecols)
+            temptable = TemporarySqliteTable(data, fieldnames, database.connection)
+            self._table = temptable.name
 
         repr_string = '{0}(<{1} of records>, fieldnames={2})'
         self._repr_string = repr_string.format(self.__class__.__name__,
-                                               data.__class__.__name__,
+                                               data_class_name,
                                                repr(self.fieldnames))
 
     @classmethod
-    def from_csv(cls, file, encoding=None, **fmtparams):
+    def _get_database(cls, database):
+        """Return the TemporaryDatabase to load data into. When
+        *database* is None, a new database is created using the
+        class's :attr:`pragmas`. When *database* is a DataSource, its
+        database is used (the sources are co-located).
+        """
+        if database is None:
+            return TemporaryDatabase(cls.pragmas)
+        if isinstance(database, DataSource):
+            return database._database
+        if isinstance(database, TemporaryDatabase):
+            return database
+        msg = 'database must be a DataSource or TemporaryDatabase, got {0!r}'
+        raise TypeError(msg.format(database))
+
+    @classmethod
+    def from_csv(cls, file, encoding=None, database=None, cache_dir=None,
+                 processes=1, types=None, usecols=None, lazy=False,
+                 **fmtparams):
         """Create a DataSource from a CSV *file* (a path or file-like
         object)::
 
@@ -998,14 +3254,96 @@ class DataSource(object):
 
             files = ['mydata1.csv', 'mydata2.csv']
             source = datatest.DataSource.from_csv(files)
+
+        Files compressed with gzip, bzip2, or xz are decompressed as
+        they are read. Zip archives are loaded as if each file in the
+        archive was given (aligned by column name)::
+
+            source = datatest.DataSource.from_csv('mydata.csv.gz')
+            source = datatest.DataSource.from_csv('mydata.zip')
+
+        If *cache_dir* is given, the loaded data is saved as a SQLite
+        file in this directory. Later calls with the same *encoding*
+        and *fmtparams* use the saved file instead of reloading the
+        data (as long as the CSV files have the same size, modification
+        time, and content fingerprint)::
+
+            source = datatest.DataSource.from_csv('mydata.csv', cache_dir='.cache')
+
+        The saved file is attached (read-only where SQLite supports
+        it, see :meth:`from_sqlite`) and queried in place. It is copied
+        into memory only when an index is created or when
+        :meth:`analyze` is called (so the saved file is never changed).
+        When the files change, older cache files for the same paths are
+        removed. Cached data can only be used with file paths and can
+        not be co-located with another *database*.
+
+        Large files can be parsed using multiple worker *processes*
+        (use None for one process per CPU). Files are split on record
+        boundaries and rows are loaded in their original order::
+
+            source = datatest.DataSource.from_csv('mydata.csv', processes=None)
+
+        By default, all values are loaded as text. Use *types* to load
+        numeric columns as INTEGER or REAL values. This can be 'infer'
+        to detect types from a sample of rows or a dictionary of column
+        names and types (INTEGER, REAL, TEXT or int, float, str)::
+
+            source = datatest.DataSource.from_csv('mydata.csv', types='infer')
+            source = datatest.DataSource.from_csv('mydata.csv', types={'A': int})
+
+        Numbers are converted once, as they are loaded, and empty
+        strings in numeric columns are loaded as None. Values that are
+        not numbers are kept as text.
+
+        To load only some of the columns, give their names as *usecols*.
+        When *lazy* is True, files are not read until the source is first
+        queried and then only the columns used by each query are loaded
+        (each load reads the files again)::
+
+            source = datatest.DataSource.from_csv('mydata.csv', lazy=True)
+
+        Lazy sources can only be used with file paths and can not be
+        combined with *cache_dir*.
         """
-        if isinstance(file, string_types) or isinstance(file, IOBase):
-            file = [file]
+        if isinstance(file, string_types) or hasattr(file, 'read'):
+            file = [file]  # <- A path or file object (not always an IOBase).
 
         new_cls = cls.__new__(cls)
-        temptable = _from_csv(file, encoding, **fmtparams)
-        new_cls._connection = temptable.connection
-        new_cls._table = temptable.name
+        if lazy:
+            if not all(isinstance(x, string_types) for x in file):
+                raise ValueError("'lazy' can only be used with file paths")
+            if cache_dir:
+                raise ValueError("cannot use 'lazy' with 'cache_dir'")
+            database = cls._get_database(database)
+            fieldnames = _get_csv_fieldnames(file, encoding, **fmtparams)
+            _, fieldnames = _select_columns([], fieldnames, usecols)
+            detected = {}  # <- Encodings are detected once per source.
+
+            def load_table(columns):
+                return _from_csv(file, encoding, database.connection, processes,
+                                 types, columns, detected, **fmtparams).name
+            new_cls._lazy_table = _LazyTable(fieldnames, load_table, database.connection)
+        elif cache_dir:
+            if not all(isinstance(x, string_types) for x in file):
+                raise ValueError("'cache_dir' can only be used with file paths")
+            if database is not None:
+                raise ValueError("cannot use 'database' with 'cache_dir'")
+            path, table = _from_csv_cached(cache_dir, file, encoding,
+                                           cls.pragmas, processes, types,
+                                           usecols, **fmtparams)
+            database = cls._get_database(None)
+            schema = database.attach(path)
+            new_cls._table = '{0}."{1}"'.format(schema, table.replace('"', '""'))
+            new_cls._attached_table = (schema, table)
+            new_cls._copy_on_write = True  # <- Copy before indexing.
+        else:
+            database = cls._get_database(database)
+            table = _from_csv(file, encoding, database.connection,
+                              processes, types, usecols, **fmtparams).name
+            new_cls._table = table
+        new_cls._database = database
+        new_cls._connection = database.connection
 
         repr_string = '{0}.from_csv({1}{2}{3})'.format(
             new_cls.__class__.__name__,
@@ -1018,12 +3356,15 @@ class DataSource(object):
         return new_cls
 
     @classmethod
-    def from_excel(cls, path, worksheet=0):
+    def from_excel(cls, path, worksheet=0, database=None, usecols=None,
+                   lazy=False, processes=1):
         """Create a DataSource from an Excel worksheet. The *path*
         must specify to an XLSX or XLS file and the *worksheet* must
         specify the index or name of the worksheet to load (defaults
-        to the first worksheet). This constructor requires the optional,
-        third-party library `xlrd <https://pypi.python.org/pypi/xlrd>`_.
+        to the first worksheet). XLSX files are read incrementally,
+        without loading the whole workbook into memory. XLS files
+        require the optional, third-party library
+        `xlrd <https://pypi.python.org/pypi/xlrd>`_.
 
         Load first worksheet::
 
@@ -1033,6 +3374,59 @@ class DataSource(object):
         index (an integer)::
 
             source = datatest.DataSource.from_excel('mydata.xlsx', 'Sheet 2')
+
+        If *worksheet* is a list, a list of sources is returned (one
+        for each worksheet, all in the same database). The worksheets
+        of an XLSX file are loaded in parallel when *processes* is not
+        1 (use None for one process per CPU)::
+
+            sources = datatest.DataSource.from_excel('mydata.xlsx', [0, 1], processes=None)
+
+        The *usecols* and *lazy* arguments work the same as they do
+        for the :class:`DataSource` constructor.
+        """
+        many = isinstance(worksheet, (list, tuple))
+        worksheets = list(worksheet) if many else [worksheet]
+        database = cls._get_database(database)
+
+        if not zipfile.is_zipfile(path):  # <- Not XLSX, use xlrd.
+            sources = [cls._from_xls(path, x, database, usecols, lazy)
+                       for x in worksheets]
+            return sources if many else sources[0]
+
+        if lazy:
+            tables = [None] * len(worksheets)
+        else:
+            tables = _from_xlsx(path, worksheets, database.connection,
+                                processes, usecols)
+
+        sources = []
+        for sheet, temptable in zip(worksheets, tables):
+            new_cls = cls.__new__(cls)
+            new_cls._database = database
+            new_cls._connection = database.connection
+            if lazy:
+                with XlsxReader(path, sheet) as reader:
+                    fieldnames = next(reader)  # Header row.
+                _, fieldnames = _select_columns([], fieldnames, usecols)
+
+                def load_table(columns, sheet=sheet):
+                    return _from_xlsx(path, [sheet], database.connection,
+                                      usecols=columns)[0].name
+                new_cls._lazy_table = _LazyTable(fieldnames, load_table,
+                                                 database.connection)
+            else:
+                new_cls._table = temptable.name
+            new_cls._repr_string = '{0}.from_excel({1!r}, {2!r})'.format(
+                new_cls.__class__.__name__, path, sheet)
+            sources.append(new_cls)
+
+        return sources if many else sources[0]
+
+    @classmethod
+    def _from_xls(cls, path, worksheet, database, usecols, lazy):
+        """Create a DataSource from a worksheet in an XLS file (using
+        xlrd).
         """
         try:
             import xlrd
@@ -1053,18 +3447,88 @@ class DataSource(object):
             data = (sheet.row(i) for i in range(sheet.nrows))  # Build *data*
             data = ([x.value for x in row] for row in data)    # and *fields*
             fieldnames = next(data)                            # from rows.
-            new_instance = cls(data, fieldnames)  # <- Create instance.
+            new_instance = cls(data, fieldnames, database,   # <- Create
+                               lazy=lazy, usecols=usecols)   #    instance.
         finally:
             book.release_resources()
 
         return new_instance
 
+    @classmethod
+    def from_sqlite(cls, path_or_connection, table_or_query, database=None,
+                    mmap_size=None):
+        """Create a DataSource from a table (or query) in an existing
+        SQLite database file. The file is attached and queried in
+        place---rows are not copied::
+
+            source = datatest.DataSource.from_sqlite('mydata.db', 'mytable')
+
+        The *path_or_connection* can be a file path or a
+        :class:`sqlite3.Connection` to a database file (the file is
+        opened again, the connection itself is not used). The
+        *table_or_query* can be a table name or a SELECT statement::
+
+            source = datatest.DataSource.from_sqlite(
+                'mydata.db',
+                'SELECT * FROM mytable WHERE year >= 2010',
+            )
+
+        A table name always refers to the attached file. But SQLite
+        resolves unqualified names in a query by searching the
+        ``temp`` and ``main`` schemas before attached files, so a query
+        reads a temporary table of the same name (like the ``tbl0``
+        tables created by other sources in the same *database*) when
+        one exists. Avoid such names or use a table name instead of a
+        query.
+
+        If *mmap_size* is given, up to this many bytes of the file are
+        read using memory-mapped I/O. Indexes in the file are used by
+        queries but new indexes cannot be created and sources based on
+        a query do not support :meth:`sample() <DataQuery.sample>`.
+
+        DataSource never writes to the file. But SQLite itself only
+        enforces this when the file can be opened with a URI filename
+        (an in-memory *database* on Python 3.4 or newer). Otherwise,
+        the file is attached normally and SQL statements run directly
+        against the connection can still modify it.
+        """
+        if isinstance(path_or_connection, sqlite3.Connection):
+            cursor = path_or_connection.execute('PRAGMA database_list')
+            path = dict((row[1], row[2]) for row in cursor).get('main')
+            if not path:
+                msg = 'connection must be to a database file, not in-memory'
+                raise ValueError(msg)
+        else:
+            path = path_or_connection
+
+        database = cls._get_database(database)
+        schema = database.attach(path, mmap_size)
+
+        new_cls = cls.__new__(cls)
+        new_cls._database = database
+        new_cls._connection = database.connection
+        if re.match(r'\s*(SELECT|WITH)\b', table_or_query, re.IGNORECASE):
+            new_cls._table = '({0})'.format(table_or_query)
+            new_cls._attached_table = (schema, None)
+        else:
+            escaped = table_or_query.replace('"', '""')
+            new_cls._table = '{0}."{1}"'.format(schema, escaped)
+            new_cls._attached_table = (schema, table_or_query)
+        new_cls._assert_fields_exist(())  # <- Fail early on bad table/query.
+
+        new_cls._repr_string = '{0}.from_sqlite({1!r}, {2!r})'.format(
+            new_cls.__class__.__name__, path, table_or_query)
+        return new_cls
+
     @property
     def fieldnames(self):
         """A tuple of field names used by the data source."""
+        lazy_table = getattr(self, '_lazy_table', None)
+        if lazy_table is not None:
+            return lazy_table.fieldnames
         cursor = self._connection.cursor()
-        cursor.execute('PRAGMA table_info(' + self._table + ')')
-        return tuple(x[1] for x in cursor)
+        cursor.execute('SELECT * FROM ' + self._table + ' LIMIT 0')
+        return tuple(x[0] for x in cursor.description)
 
     def __repr__(self):
         """Return a string representation of the data source."""
@@ -1075,12 +3539,44 @@ class DataSource(object):
 
     def __iter__(self):
         """Return iterable of dictionary rows (like csv.DictReader)."""
-        cursor = self._connection.cursor()
-        cursor.execute('SELECT * FROM ' + self._table)
+        return self.iterrows()
 
-        fieldnames = self.fieldnames
-        dict_row = lambda x: dict(zip(fieldnames, x))
-        return (dict_row(row) for row in cursor.fetchall())
+    def iterrows(self, row_type=dict):
+        """Return an iterator of rows. Rows are read from the database
+        in batches of :attr:`batch_size` so that the entire data set
+        is never held in memory at once::
+
+            for row in source.iterrows():
+                ...
+
+        By default, rows are dictionaries (like csv.DictReader). If
+        *row_type* is :py:class:`tuple`, rows are returned as plain
+        tuples in :attr:`fieldnames` order (avoiding the cost of
+        building a dictionary for every row). A :py:func:`namedtuple
+        <collections.namedtuple>` class can also be given::
+
+            Row = collections.namedtuple('Row', source.fieldnames)
+            for row in source.iterrows(Row):
+                ...
+        """
+        if getattr(self, '_lazy_table', None) is not None:
+            self._load_columns(self.fieldnames)
+            columns = ', '.join(self._escape_field_name(x) for x in self.fieldnames)
+        else:
+            columns = '*'
+        cursor = self._connection.cursor()
+        cursor.execute('SELECT {0} FROM {1}'.format(columns, self._table))
+        rows = _iter_batches(cursor, self.batch_size)
+
+        if row_type is dict:
+            fieldnames = self.fieldnames
+            return (dict(zip(fieldnames, row)) for row in rows)
+        if row_type is tuple:
+            return rows
+        if issubclass(row_type, tuple) and hasattr(row_type, '_fields'):
+            return (row_type._make(row) for row in rows)
+        msg = 'row_type must be dict, tuple, or a namedtuple class, got {0!r}'
+        raise TypeError(msg.format(row_type))
 
     def __call__(self, select, **where):
         """Calling a DataSource like a function returns a DataQuery
@@ -1095,22 +3591,134 @@ class DataSource(object):
         """
         return DataQuery.from_object(self, select, **where)
 
+    def enable_cache(self, maxbytes=64 * 1024 * 1024):
+        """Cache query results for this data source so that repeated
+        queries are not re-executed. Results are evaluated and stored
+        in memory, least-recently-used results are discarded when the
+        cache exceeds approximately *maxbytes*::
+
+            source.enable_cache()
+
+        The cache is cleared automatically when the underlying data
+        changes. Queries that use unhashable arguments (like some
+        callable objects) are cached using the argument's identity.
+        """
+        self._cache = _QueryCache(maxbytes)
+
+    def disable_cache(self):
+        """Disable the query result cache and discard stored results."""
+        self._cache = None
+
+    def _get_worker(self):
+        """Return a copy of the data source that uses a pooled,
+        read-only connection to the same database (so it can be used
+        from another thread). Return workers with _release_worker().
+
+        Workers share public settings (like batch_size) but not the
+        query cache, index advisor, or column statistics. Workers can
+        not load lazy columns (the source's connection belongs to the
+        thread that created it) so lazy sources must be fully loaded
+        before workers are used.
+        """
+        worker = self.__class__.__new__(self.__class__)
+        for key, value in self.__dict__.items():
+            if not key.startswith('_') or key in ('_table', '_repr_string',
+                                                  '_database', '_lazy_table',
+                                                  '_attached_table'):
+                worker.__dict__[key] = value
+        worker._connection = self._database.acquire_reader()
+        return worker
+
+    def _release_worker(self, worker):
+        """Return the connection of a *worker* from _get_worker()."""
+        self._database.release_reader(worker._connection)
+
+    def cache_info(self):
+        """Return a named tuple of *hits*, *misses*, *maxbytes*, and
+        *currbytes* for the query result cache (returns None if the
+        cache is not enabled).
+        """
+        cache = getattr(self, '_cache', None)
+        if cache is None:
+            return None
+        return cache.info()
+
+    def _get_data_version(self):
+        """Return a value that changes whenever data in the source's
+        database is modified (by this or any other connection). Rows
+        written while loading tables (new co-located sources, lazily
+        loaded columns, and temporary tables for where-values) are not
+        counted as modifications.
+        """
+        cursor = self._connection.cursor()
+        data_version = cursor.execute('PRAGMA data_version').fetchone()
+        total_changes = self._connection.total_changes
+        total_changes -= getattr(self._connection, 'internal_changes', 0)
+        return (total_changes, data_version)
+
     def _execute_query(self, select_clause, trailing_clause=None, **kwds_filter):
         """Execute query and return cursor object."""
+        return self._execute_filtered(select_clause, trailing_clause, kwds_filter)
+
+    def _execute_filtered(self, select_clause, trailing_clause, where,
+                          conditions=(), key_names=(), outer=()):
+        """Execute query using *where* keyword constraints and optional
+        *conditions* (additional SQL expressions that must be true) and
+        return cursor object. The *key_names* are the unescaped columns
+        used in the *trailing_clause* (used by the index advisor).
+
+        If *outer* is given, it must be a sequence of 2-tuples of
+        select clauses and conditions for queries that are wrapped
+        around the filtered query (innermost first). The subqueries
+        use "LIMIT -1 OFFSET 0" so SQLite does not flatten them or
+        push conditions into them (which would repeat any function
+        calls they contain).
+        """
+        advisor = getattr(self, '_index_advisor', None)
+        if advisor is not None and advisor.pending:
+            self._build_pending_indexes(advisor)
+
+        self._load_columns(where.keys())
+
+        stmnt, params = None, None
         try:
+            # Load large collections into temporary tables.
+            where = dict((k, self._get_in_table(v)) for k, v in where.items())
+
+            # Build rowid conditions for sampled rows.
+            for key, value in list(where.items()):
+                if isinstance(value, _RowSample):
+                    where[key] = self._get_sample_predicate(value, where)
+                    _register_sample_key(self._connection)
+
             # Register where-clause functions with SQLite connection.
-            func_list = [x for x in kwds_filter.values() if callable(x)]
+            predicates = [_get_predicate(x) for x in where.values()]
+            func_list = [x for x, predicate in zip(where.values(), predicates)
+                         if callable(x) and not predicate]
             _register_function(self._connection, func_list)
+            if any(x and x.name == 'regex' for x in predicates):
+                _register_regexp(self._connection)
+            _register_aggregates(self._connection)
 
             # Build selecct-query.
             stmnt = 'SELECT {0} FROM {1}'.format(select_clause, self._table)
-            where_clause, params = self._build_where_clause(kwds_filter)
-            if where_clause:
-                stmnt = '{0} WHERE {1}'.format(stmnt, where_clause)
+            where_clause, params = self._build_where_clause(where)
+            conditions = ([where_clause] if where_clause else []) + list(conditions)
+            if conditions:
+                stmnt = '{0} WHERE {1}'.format(stmnt, ' AND '.join(conditions))
+            for outer_clause, outer_conditions in outer:
+                stmnt = 'SELECT {0} FROM ({1} LIMIT -1 OFFSET 0)'.format(
+                    outer_clause, stmnt)
+                if outer_conditions:
+                    stmnt = '{0} WHERE {1}'.format(stmnt, ' AND '.join(outer_conditions))
             if trailing_clause:
                 stmnt = '{0}\n{1}'.format(stmnt, trailing_clause)
 
             # Execute query.
+            statement_log = getattr(self, '_statement_log', None)
+            if statement_log is not None:
+                statement_log.append((stmnt, params))
+            start = _timer()
             cursor = self._connection.cursor()
             cursor.execute(stmnt, params)
 
@@ -1119,8 +3727,121 @@ class DataSource(object):
             msg = '{0}\n  query: {1}\n  params: {2}'.format(e, stmnt, params)
             raise exc_cls(msg)
 
+        if advisor is not None:
+            indexable = sorted(k for k, v in where.items() if _is_indexable(v))
+            range_names = [k for k in indexable if _is_range(where[k])]
+            where_names = [k for k in indexable if k not in range_names]
+            if trailing_clause and trailing_clause.startswith('GROUP BY'):
+                key_clause = 'GROUP BY'
+            else:
+                key_clause = 'ORDER BY'
+            add_seconds = advisor.record(where_names, range_names,
+                                         key_names, key_clause)
+            add_seconds(_timer() - start)
+            cursor = _TimedCursor(cursor, add_seconds)
+
         return cursor
 
+    def _get_in_table(self, value):
+        """Return a predicate that matches values from an indexed
+        temporary table if *value* is a collection larger than
+        :attr:`in_table_threshold`. Other values are returned
+        unchanged.
+
+        Tables are kept for reuse (the least-recently created are
+        dropped when more than eight tables exist).
+        """
+        if (not _is_nsiterable(value)
+                or not isinstance(value, collections.Sized)
+                or len(value) <= self.in_table_threshold
+                or _get_predicate(value) is not None):
+            return value  # <- EXIT!
+
+        try:
+            values = frozenset(value)
+        except TypeError:
+            return value  # <- EXIT! (Contains unhashable items.)
+
+        in_tables = self.__dict__.setdefault('_in_tables', [])
+        for key, predicate in in_tables:
+            if key == values:
+                return predicate  # <- EXIT!
+
+        try:
+            temptable = TemporarySqliteTable(((x,) for x in values), ['value'],
+                                             connection=self._connection)
+        except sqlite3.OperationalError:
+            return value  # <- EXIT! (Read-only connection.)
+        cursor = self._connection.cursor()
+        cursor.execute('CREATE INDEX idx_{0}_value ON {0} (value)'.format(temptable.name))
+
+        template = '{{0}} IN (SELECT value FROM {0})'.format(temptable.name)
+        function = lambda x: x in values
+        predicate = _WherePredicate('in_table', (temptable.name,), template,
+                                    (), function)
+        in_tables.append((values, predicate))
+
+        while len(in_tables) > 8:
+            table_name = in_tables.pop(0)[1].args[0]
+            try:
+                cursor.execute('DROP TABLE IF EXISTS {0}'.format(table_name))
+            except sqlite3.OperationalError:
+                pass  # <- Table is still in use, leave it in place.
+        return predicate
+
+    def _get_sample_predicate(self, sample, where):
+        """Return a predicate that matches the rowids of a *sample*
+        (a _RowSample) of the rows selected by the other *where*
+        values.
+        """
+        args = (sample.n, sample.fraction, sample.seed)
+        if sample.fraction is not None:
+            template = 'SAMPLE_KEY({{0}}, {0}) < {1!r}'.format(
+                int(sample.seed), float(sample.fraction))
+            return _WherePredicate('sample', args, template, (), None,
+                                   indexable=False)  # <- EXIT!
+
+        other_where = dict((k, v) for k, v in where.items()
+                           if not isinstance(v, _RowSample))
+        where_clause, params = self._build_where_clause(other_where)
+        sample_key = 'SAMPLE_KEY(_rowid_, {0})'.format(int(sample.seed))
+        key_columns = [self._escape_field_name(x) for x in sample.key_names]
+
+        if not key_columns:
+            inner = 'SELECT _rowid_ FROM {0}{1} ORDER BY {2} LIMIT {3}'.format(
+                self._table,
+                ' WHERE ' + where_clause if where_clause else '',
+                sample_key,
+                int(sample.n),
+            )
+        elif _sqlite_has_window_functions:
+            inner = ('SELECT sample_rowid FROM (SELECT _rowid_ AS sample_rowid, '
+                     'ROW_NUMBER() OVER (PARTITION BY {0} ORDER BY {1}) AS sample_rank '
+                     'FROM {2}{3}) WHERE sample_rank <= {4}').format(
+                ', '.join(key_columns),
+                sample_key,
+                self._table,
+                ' WHERE ' + where_clause if where_clause else '',
+                int(sample.n),
+            )
+        else:
+            # Without window functions, use a correlated subquery.
+            conditions = ['sample.{0} IS {1}.{0}'.format(x, self._table)
+                          for x in key_columns]
+            if where_clause:
+                conditions.append(where_clause)
+            inner = ('SELECT sample._rowid_ FROM {0} AS sample WHERE {1} '
+                     'ORDER BY SAMPLE_KEY(sample._rowid_, {2}) LIMIT {3}').format(
+                self._table,
+                ' AND '.join(conditions),
+                int(sample.seed),
+                int(sample.n),
+            )
+        inner = inner.replace('{', '{{').replace('}', '}}')
+        template = '{0} IN (' + inner + ')'
+        return _WherePredicate('sample', args, template, params, None,
+                               indexable=False)
+
     @staticmethod
     def _build_where_clause(where_dict):
         """Return 'WHERE' clause that implements *where* keyword
@@ -1131,10 +3852,16 @@ class DataSource(object):
         items = where_dict.items()
         items = sorted(items, key=lambda x: x[0])  # Ordered by key.
         for key, val in items:
+            predicate = _get_predicate(val)
+            # If value is a predicate object (or regex).
+            if predicate is not None:
+                predicate_clause, predicate_params = predicate.sql(key)
+                clause.append(predicate_clause)
+                params.extend(predicate_params)
             # If value is a function.
-            if callable(val):
-                func_name = 'FUNC{0}'.format(id(val))
-                clause.append('{0}({1})'.format(func_name, key))
+            elif callable(val):
+                func_call = 'FUNC{0}({1})'.format(id(val), key)
+                clause.append(_translate_function(val, key, func_call) or func_call)
             # If value is a collection of strings.
             elif _is_nsiterable(val):
                 clause.append('{key} IN ({qmarks})'.format(
@@ -1169,6 +3896,7 @@ class DataSource(object):
         The *select* can be a string, sequence, set or mapping--see
         the _select() method for details.
         """
+        cursor = _iter_batches(cursor, self.batch_size)
         if isinstance(select, (collections.Sequence, collections.Set)):
             return self._format_result_group(select, cursor)
 
@@ -1197,7 +3925,8 @@ class DataSource(object):
 
     def _assert_fields_exist(self, fieldnames):
         """Assert that given fieldnames are present in data source,
-        raises LookupError if fields are missing.
+        raises LookupError if fields are missing. For lazy sources,
+        the fields are loaded if they have not been already.
         """
         #assert not isinstance(fieldnames, BaseElement)
         available = self.fieldnames
@@ -1205,6 +3934,15 @@ class DataSource(object):
             if name not in available:
                 msg = '{0!r} not in {1!r}'.format(name, self)
                 raise LookupError(msg)
+        self._load_columns(fieldnames)
+
+    def _load_columns(self, columns):
+        """Load *columns* into the source's table if the source is
+        lazy and the columns are not loaded yet.
+        """
+        lazy_table = getattr(self, '_lazy_table', None)
+        if lazy_table is not None:
+            self._table = lazy_table.load(columns)
 
     def _escape_field_name(self, name):
         """Escape field names for SQLite."""
@@ -1234,7 +3972,8 @@ class DataSource(object):
             order_by = 'ORDER BY {0}'.format(', '.join(key_columns))
         else:
             order_by = None
-        cursor = self._execute_query(select_clause, order_by, **where)
+        cursor = self._execute_filtered(select_clause, order_by, where,
+                                        key_names=_get_key_names(key))
         return self._format_results(select, cursor)
 
     def _select_distinct(self, select, **where):
@@ -1247,25 +3986,43 @@ class DataSource(object):
             order_by = 'ORDER BY {0}'.format(', '.join(key_columns))
         else:
             order_by = None
-        cursor = self._execute_query(select_clause, order_by, **where)
+        cursor = self._execute_filtered(select_clause, order_by, where,
+                                        key_names=_get_key_names(key))
         return self._format_results(select, cursor)
 
     def _select_aggregate(self, sqlfunc, select, **where):
         key, value = _parse_select(select)
         key_columns, value_columns = self._parse_key_value(key, value)
 
+        # Answer unfiltered COUNT, MIN, and MAX from column statistics.
+        if (not key and not where and len(value_columns) == 1
+                and not isinstance(value, collections.Set)):
+            stats = self._get_current_stats(tuple(value)[0])
+            if stats is not None:
+                known_values = {'COUNT': stats.rows - stats.nulls,
+                                'MIN': stats.min,
+                                'MAX': stats.max}
+                if (isinstance(sqlfunc, string_types)
+                        and sqlfunc.upper() in known_values):
+                    rows = [(known_values[sqlfunc.upper()],)]
+                    return self._format_aggregate(select, rows)  # <- EXIT!
+
         if isinstance(value, collections.Set):
             func = lambda col: 'DISTINCT {0}'.format(col)
             value_columns = tuple(func(col) for col in value_columns)
 
-        sqlfunc = sqlfunc.upper()
-        value_columns = tuple('{0}({1})'.format(sqlfunc, x) for x in value_columns)
+        value_columns = tuple(_sql_aggregate_call(sqlfunc, x) for x in value_columns)
         select_clause = ', '.join(key_columns + value_columns)
         if key:
             group_by = 'GROUP BY {0}'.format(', '.join(key_columns))
         else:
             group_by = None
-        cursor = self._execute_query(select_clause, group_by, **where)
+        cursor = self._execute_filtered(select_clause, group_by, where,
+                                        key_names=_get_key_names(key))
+        return self._format_aggregate(select, cursor)
+
+    def _format_aggregate(self, select, cursor):
+        """Return aggregate results formatted by *select* types."""
         results =  self._format_results(select, cursor)
 
         if isinstance(select, collections.Mapping):
@@ -1273,6 +4030,299 @@ class DataSource(object):
             return DataResult(results, evaluation_type=dict)
         return next(results)
 
+    def _select_compiled(self, steps, select, **where):
+        """Execute a sequence of compiled *steps* (see
+        :func:`_get_compiled_steps`) as a single SELECT statement.
+        Map and filter functions are registered with SQLite so that
+        they are evaluated in the same pass as the aggregation.
+        """
+        key, value = _parse_select(select)
+        key_columns, value_columns = self._parse_key_value(key, value)
+
+        # When there are many repeated values, call Python step
+        # functions once per distinct value instead of once per row.
+        column = tuple(value)[0]
+        stats = self._get_current_stats(column)
+        if stats is not None and stats.distinct is None:
+            stats = self._collect_stats([column])[column]  # <- Count distinct.
+        memoize = bool(stats and stats.distinct is not None
+                       and stats.distinct * 4 <= stats.rows)
+
+        errors = []
+        layers, sqlfunc, distinct = \
+            self._compile_steps(steps, value_columns[0], errors, memoize)
+
+        # Each mapped value is computed once, in its own subquery,
+        # so later steps refer to it by name instead of repeating
+        # the function call.
+        inner_layers = []
+        for inner_expression, inner_conditions in layers[:-1]:
+            inner_clause = ', '.join(key_columns + (
+                '{0} AS {1}'.format(inner_expression, _compiled_value_alias),))
+            inner_layers.append((inner_clause, inner_conditions))
+        expression, conditions = layers[-1]
+
+        if sqlfunc:
+            if key and conditions:
+                # Filter inside the aggregate so that groups without any
+                # matching values are kept (as they are in Python).
+                expression = 'CASE WHEN {0} THEN {1} END'.format(
+                    ' AND '.join(conditions), expression)
+                conditions = []
+            expression = _sql_aggregate_call(sqlfunc, expression)
+
+        select_clause = ', '.join(key_columns + (expression,))
+        if distinct:
+            select_clause = 'DISTINCT ' + select_clause
+        if key:
+            group_by = 'GROUP BY {0}'.format(', '.join(key_columns))
+        else:
+            group_by = None
+
+        if inner_layers:
+            outer = inner_layers[1:] + [(select_clause, conditions)]
+            select_clause, conditions = inner_layers[0]
+        else:
+            outer = ()
+
+        try:
+            cursor = self._execute_filtered(select_clause, group_by, where, conditions,
+                                            key_names=_get_key_names(key),
+                                            outer=outer)
+            if not sqlfunc:
+                cursor = _iter_batches(cursor, self.batch_size)
+                cursor = _reraise_step_errors(cursor, errors, self._connection)
+                return self._format_results(select, cursor)  # <- EXIT!
+            try:
+                rows = cursor.fetchall()  # <- One row per group.
+            finally:
+                _clear_step_memos(self._connection)
+        except sqlite3.OperationalError:
+            _clear_step_memos(self._connection)
+            if not errors:
+                raise
+            if not isinstance(errors[-1], _UnsupportedStepResult):
+                raise errors[-1]
+            # Map results can not be stored by SQLite, use Python instead.
+            return self._select_compiled_fallback(steps, select, **where)
+
+        return self._format_aggregate(select, rows)
+
+    def _compile_steps(self, steps, column, errors, memoize=False):
+        """Return a 3-tuple containing a list of layers, the aggregate
+        function name (or None), and a distinct flag for the given
+        compiled *steps*. If *memoize* is True, Python step functions
+        are called once per distinct value.
+
+        Each layer is a 2-tuple of an SQL expression for the mapped
+        value and a list of filter conditions. The first layer reads
+        *column* and each following layer reads the value computed by
+        the layer before it (see :data:`_compiled_value_alias`). A new
+        layer is started after every map step so the expression for a
+        mapped value is never repeated.
+        """
+        layers = []
+        source = column  # <- Value read by the current layer.
+        expression = column
+        conditions = []
+        sqlfunc = None
+        distinct = False
+        for name, arg in steps:
+            if name in ('map', 'filter'):
+                if expression != source:  # <- Start a new layer.
+                    layers.append((expression, conditions))
+                    source = expression = _compiled_value_alias
+                    conditions = []
+                func_name = _register_step_function(self._connection, name, arg,
+                                                    errors, memoize)
+                func_call = '{0}({1})'.format(func_name, source)
+                if arg is not None:
+                    func_call = _translate_function(arg, source, func_call, name) or func_call
+                if name == 'map':
+                    expression = func_call
+                else:
+                    conditions.append(func_call)
+            elif name == 'aggregate':
+                sqlfunc = arg
+            elif name == 'distinct':
+                distinct = True
+            else:
+                raise ValueError('unrecognized compiled step {0!r}'.format(name))
+        layers.append((expression, conditions))
+        return layers, sqlfunc, distinct
+
+    def _select_compiled_fallback(self, steps, select, **where):
+        """Execute compiled *steps* using Python functions."""
+        python_functions = dict((v, k) for k, v in _sqlite_aggregate_names.items())
+        result = self._select(select, **where)
+        for name, arg in steps:
+            if name == 'map':
+                result = _map_data(arg, result)
+            elif name == 'filter':
+                result = _filter_data(arg, result)
+            elif name == 'aggregate':
+                result = _apply_to_data(python_functions.get(arg, arg), result)
+            elif name == 'distinct':
+                result = _sqlite_distinct(result)
+        return result
+
+    def execute_many(self, queries):
+        """Execute several *queries* and return a list of their results
+        (in the same order). Aggregate queries that use the same
+        grouping and *where* constraints are combined and run as a
+        single SELECT statement::
+
+            results = source.execute_many([
+                source({'A': 'C'}).sum(),
+                source({'A': 'C'}).count(),
+                source({'A': 'D'}).max(),
+            ])
+
+        Queries that can not be combined are executed individually.
+        """
+        queries = list(queries)
+        results = [None] * len(queries)
+        cache = getattr(self, '_cache', None)
+        batches = collections.defaultdict(list)
+        for index, query in enumerate(queries):
+            if query._data_source not in (None, self):
+                raise ValueError((
+                    'query is associated with a different data source: {0!r}'
+                ).format(query._data_source))
+
+            if cache is not None:
+                found, frozen = cache.get(query._get_cache_key(), self._get_data_version())
+                if found:
+                    results[index] = _thaw_result(frozen)
+                    continue
+
+            plan = query._get_execution_plan(self, query._query_steps)
+            plan = DataQuery._optimize(plan) or plan
+            batch_args = self._get_batch_args(plan)
+            if batch_args is None:
+                results[index] = self._execute_single(query)
+                continue
+
+            steps, select, where = batch_args
+            key_columns = self._parse_key_value(*_parse_select(select))[0]
+            batch_key = (key_columns, _make_hashable(where))
+            batches[batch_key].append((index, steps, select, where))
+
+        for (key_columns, _), members in batches.items():
+            if len(members) == 1:
+                index = members[0][0]
+                results[index] = self._execute_single(queries[index])
+                continue
+
+            batch_results = self._execute_batch(key_columns, members)
+            if batch_results is None:  # <- Could not run as a batch.
+                for member in members:
+                    results[member[0]] = self._execute_single(queries[member[0]])
+                continue
+
+            for member, result in zip(members, batch_results):
+                index = member[0]
+                if cache is not None:
+                    frozen = _freeze_result(result)
+                    cache.set(queries[index]._get_cache_key(), frozen)
+                    result = _thaw_result(frozen)
+                results[index] = result
+
+        return results
+
+    def _execute_single(self, query):
+        if query._data_source is None:
+            return query(self)
+        return query()
+
+    @staticmethod
+    def _get_batch_args(execution_plan):
+        """Return a 3-tuple of compiled steps, select, and where if
+        the optimized *execution_plan* is a single aggregation (that
+        can be combined with others). Otherwise, returns None.
+        """
+        if len(execution_plan) != 2:
+            return None  # <- EXIT!
+
+        method, (func, args, kwds) = execution_plan[0][1][1], execution_plan[1]
+        if func is not RESULT_TOKEN:
+            return None  # <- EXIT!
+
+        if method == '_select_aggregate':
+            sqlfunc, select = args
+            return (('aggregate', sqlfunc),), select, kwds
+        if method == '_select_compiled':
+            steps, select = args
+            if steps[-1][0] == 'aggregate':
+                return steps, select, kwds
+        return None
+
+    def _execute_batch(self, key_columns, members):
+        """Execute a batch of aggregations as a single statement and
+        return a list of formatted results. Returns None if any step
+        function fails or if any query computes mapped values in
+        subqueries (so queries can be run individually instead).
+        """
+        errors = []
+        expressions = []
+        slices = []
+        for index, steps, select, where in members:
+            key, value = _parse_select(select)
+            value_columns = self._parse_key_value(key, value)[1]
+            if isinstance(value, collections.Set):
+                value_columns = tuple('DISTINCT {0}'.format(x) for x in value_columns)
+
+            start = len(expressions)
+            for column in value_columns:
+                layers, sqlfunc, _ = self._compile_steps(steps, column, errors)
+                if len(layers) > 1:
+                    return None  # <- EXIT! Needs subqueries, run individually.
+                expression, conditions = layers[0]
+                if conditions:
+                    expression = 'CASE WHEN {0} THEN {1} END'.format(
+                        ' AND '.join(conditions), expression)
+                expressions.append(_sql_aggregate_call(sqlfunc, expression))
+            slices.append((start, len(expressions)))
+
+        where = members[0][3]
+        select_clause = ', '.join(key_columns + tuple(expressions))
+        if key_columns:
+            group_by = 'GROUP BY {0}'.format(', '.join(key_columns))
+        else:
+            group_by = None
+
+        try:
+            key_names = _get_key_names(_parse_select(members[0][2])[0])
+            cursor = self._execute_filtered(select_clause, group_by, where,
+                                            key_names=key_names)
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            if errors:
+                return None
+            raise
+
+        num_keys = len(key_columns)
+        results = []
+        for (index, steps, select, where), (start, stop) in zip(members, slices):
+            query_rows = [row[:num_keys] + row[num_keys + start:num_keys + stop]
+                          for row in rows]
+            results.append(self._format_aggregate(select, query_rows))
+        return results
+
+    def _copy_cached_table(self):
+        """Copy a table that is attached read-only (like the cache file
+        used by :meth:`from_csv`) into the source's own database so it
+        can be indexed and analyzed. Other attached tables (like those
+        from :meth:`from_sqlite`) are not copied.
+        """
+        if not getattr(self, '_copy_on_write', False):
+            return  # <- EXIT!
+        schema, table = self._attached_table
+        escaped = '"{0}"'.format(table.replace('"', '""'))
+        self._table = _copy_table(self._connection, schema, escaped).name
+        self._attached_table = None
+        self._copy_on_write = False
+
     def create_index(self, *columns):
         """Create an index for specified columns---can speed up
         testing in many cases.
@@ -1299,6 +4349,10 @@ class DataSource(object):
                   lead to longer run times so use indexes with care.
         """
         self._assert_fields_exist(columns)
+        self._copy_cached_table()
+        if getattr(self, '_attached_table', None):
+            msg = 'cannot create index, attached SQLite files are read-only'
+            raise sqlite3.OperationalError(msg)
 
         # Build index name.
         whitelist = lambda col: ''.join(x for x in col if x.isalnum())
@@ -1306,13 +4360,535 @@ class DataSource(object):
         idx_name = 'idx_{0}_{1}'.format(self._table, idx_name)
 
         # Build column names.
-        columns = tuple(self._escape_field_name(x) for x in columns)
+        escaped = tuple(self._escape_field_name(x) for x in columns)
 
         # Prepare statement.
         statement = 'CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'
-        statement = statement.format(idx_name, self._table, ', '.join(columns))
+        statement = statement.format(idx_name, self._table, ', '.join(escaped))
 
         # Create index.
         cursor = self._connection.cursor()
         cursor.execute('PRAGMA synchronous=OFF')
         cursor.execute(statement)
+
+        # Track index benefit.
+        advisor = getattr(self, '_index_advisor', None)
+        if advisor is not None:
+            advisor.mark_built(columns)
+
+    def enable_index_advisor(self, auto_index=False, threshold=3):
+        """Record the columns used to filter, group, and order queries
+        (and the time spent executing them) so that useful indexes can
+        be recommended::
+
+            source.enable_index_advisor()
+            ...  # <- Run queries.
+            for recommendation in source.index_recommendations():
+                print(recommendation)
+
+        An index is recommended once *threshold* or more queries could
+        have used it. When *auto_index* is True, recommended indexes
+        are created automatically (before the next query executes).
+        Use :meth:`index_report` to see the benefit these indexes
+        delivered.
+        """
+        self._index_advisor = _IndexAdvisor(threshold, auto_index)
+
+    def disable_index_advisor(self):
+        """Disable the index advisor and discard recorded usage
+        (indexes that were already created are not removed).
+        """
+        self._index_advisor = None
+
+    def index_recommendations(self):
+        """Return a list of named tuples of *columns*, *queries*, and
+        *seconds* for recommended indexes that have not been created.
+        Recommendations are ordered by the total time spent executing
+        the queries that could have used them (largest first).
+        """
+        advisor = getattr(self, '_index_advisor', None)
+        if advisor is None:
+            return []
+        return advisor.recommendations(self._is_indexed)
+
+    def index_report(self):
+        """Return a list of named tuples describing indexes created
+        while the index advisor was enabled. Each tuple contains the
+        index *columns*, the number of queries and time spent before
+        the index was created (*queries_before* and *seconds_before*),
+        the same measures afterwards (*queries_after* and
+        *seconds_after*), and an estimate of *seconds_saved* (None if
+        there are not enough measurements).
+        """
+        advisor = getattr(self, '_index_advisor', None)
+        if advisor is None:
+            return []
+        return advisor.report()
+
+    def _is_indexed(self, columns):
+        """Return True if an existing index begins with *columns*."""
+        columns = tuple(columns)
+        schema, table = getattr(self, '_attached_table', None) or ('', self._table)
+        if table is None:
+            return False  # <- EXIT! Queries have no indexes of their own.
+        prefix = schema + '.' if schema else ''
+        cursor = self._connection.cursor()
+        index_list = cursor.execute('PRAGMA {0}index_list("{1}")'.format(
+            prefix, table.replace('"', '""')))
+        for index_name in [row[1] for row in index_list.fetchall()]:
+            escaped = index_name.replace('"', '""')
+            cursor.execute('PRAGMA {0}index_info("{1}")'.format(prefix, escaped))
+            index_columns = tuple(row[2] for row in cursor.fetchall())
+            if index_columns[:len(columns)] == columns:
+                return True
+        return False
+
+    def _build_pending_indexes(self, advisor):
+        """Create indexes that the *advisor* has queued for building."""
+        for columns in list(advisor.pending):
+            if self._is_indexed(columns):
+                advisor.mark_built(columns)
+                continue
+            try:
+                self.create_index(*columns)
+            except sqlite3.OperationalError:
+                pass  # <- Table is busy, try again before the next query.
+
+    def analyze(self):
+        """Gather statistics for all columns (see :meth:`column_stats`)
+        and run SQLite's ANALYZE command so the query planner can make
+        better use of existing indexes::
+
+            source.analyze()
+
+        Once gathered, statistics are used to answer simple queries
+        (like an unfiltered :meth:`count() <DataQuery.count>`,
+        :meth:`min() <DataQuery.min>`, or :meth:`max() <DataQuery.max>`)
+        without scanning the data and to choose how map and filter
+        functions are executed. Statistics are discarded when data
+        changes.
+
+        All columns are gathered in a single pass except for their
+        *distinct* counts (which need to sort each column). These are
+        counted one column at a time when they are first needed.
+        """
+        self._load_columns(self.fieldnames)
+        self._copy_cached_table()
+        if not getattr(self, '_attached_table', None):
+            cursor = self._connection.cursor()
+            cursor.execute('ANALYZE ' + self._table)
+        self._collect_stats(self.fieldnames, distinct=False)
+
+    def column_stats(self, column):
+        """Return a named tuple of statistics for the given *column*:
+        *rows* (the number of rows), *distinct* (the number of distinct
+        non-NULL values), *nulls* (the number of NULL values), *min*
+        and *max* values, and the inferred *type* of stored values
+        ('INTEGER', 'REAL', 'TEXT', 'BLOB', 'MIXED', or None if all
+        values are NULL). Statistics are gathered if they are not
+        already available.
+        """
+        self._assert_fields_exist([column])
+        stats = self._get_current_stats(column)
+        if stats is None or stats.distinct is None:
+            stats = self._collect_stats([column])[column]
+        return stats
+
+    def _get_current_stats(self, column):
+        """Return statistics for *column* if they have been gathered
+        and the data has not changed since, else return None.
+        """
+        column_stats = getattr(self, '_column_stats', None)
+        if not column_stats or column not in column_stats[1]:
+            return None
+        if column_stats[0] != self._get_data_version():
+            self._column_stats = None
+            return None
+        return column_stats[1][column]
+
+    def _collect_stats(self, columns, distinct=True):
+        """Gather statistics for *columns* using a single pass over
+        the data and return a dictionary of results. If *distinct* is
+        False, distinct values are not counted (the *distinct* field
+        is None).
+        """
+        expressions = ['COUNT(*)']
+        for column in columns:
+            col = self._escape_field_name(column)
+            expressions.extend([
+                'COUNT({0})'.format(col),
+                'COUNT(DISTINCT {0})'.format(col) if distinct else 'NULL',
+                'MIN({0})'.format(col),
+                'MAX({0})'.format(col),
+            ])
+            for type_name in _stats_type_names:
+                expressions.append("SUM(typeof({0}) = '{1}')".format(
+                    col, type_name.lower()))
+
+        cursor = self._connection.cursor()
+        statement = 'SELECT {0} FROM {1}'.format(', '.join(expressions), self._table)
+        row = cursor.execute(statement).fetchone()
+
+        rows = row[0]
+        values = iter(row[1:])
+        collected = {}
+        for column in columns:
+            count, distinct, min_value, max_value = [next(values) for _ in range(4)]
+            type_counts = [next(values) for _ in _stats_type_names]
+            collected[column] = _ColumnStats(
+                rows, distinct, rows - count, min_value, max_value,
+                _infer_stats_type(type_counts))
+
+        version = self._get_data_version()
+        column_stats = getattr(self, '_column_stats', None)
+        if column_stats and column_stats[0] == version:
+            column_stats[1].update(collected)
+        else:
+            self._column_stats = (version, collected)
+        return collected
+
+
+class DataFrameSource(DataSource):
+    """A data source that queries a pandas DataFrame in place (rows
+    are not copied into a SQLite database)::
+
+        source = datatest.DataFrameSource(df)
+
+    Selections, distinct values, and aggregates are executed using
+    pandas operations on the given frame and return the same results
+    as :class:`DataSource`: missing values (like NaN or None) are
+    returned as None, grouped results are ordered by key (None first,
+    then numbers, then text), and other results keep the row order of
+    the frame. Numeric columns are aggregated with vectorized pandas
+    methods while other columns use the same conversions as SQLite
+    (e.g., the SUM of text values).
+
+    If the frame has a named index, its levels are used as columns.
+    Frames are not indexed so :meth:`create_index` and the index
+    advisor do nothing and :meth:`analyze` only gathers column
+    statistics. The frame should not be modified while the query
+    cache is enabled or after statistics are gathered.
+
+    This data source requires the optional, third-party library
+    `pandas <https://pypi.python.org/pypi/pandas>`_.
+    """
+    def __init__(self, df):
+        """Initialize self."""
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError(
+                "No module named 'pandas'\n"
+                "\n"
+                "This is an optional data source that requires the "
+                "third-party library 'pandas'."
+            )
+
+        if list(df.index.names) != [None]:
+            df = df.reset_index()
+        self._df = df
+        self._pandas = pandas
+        self._repr_string = '{0}(<pandas.DataFrame object at {1}>)'.format(
+            self.__class__.__name__, hex(id(df)))
+
+    @property
+    def fieldnames(self):
+        """A tuple of field names used by the data source."""
+        return tuple(self._df.columns)
+
+    def iterrows(self, row_type=dict):
+        """Return an iterator of rows (see :meth:`DataSource.iterrows`)."""
+        rows = iter(self._get_rows(self._df))
+
+        if row_type is dict:
+            fieldnames = self.fieldnames
+            return (dict(zip(fieldnames, row)) for row in rows)
+        if row_type is tuple:
+            return rows
+        if issubclass(row_type, tuple) and hasattr(row_type, '_fields'):
+            return (row_type._make(row) for row in rows)
+        msg = 'row_type must be dict, tuple, or a namedtuple class, got {0!r}'
+        raise TypeError(msg.format(row_type))
+
+    def _get_worker(self):
+        return self  # <- Frames can be read from any thread.
+
+    def _release_worker(self, worker):
+        pass
+
+    def _get_data_version(self):
+        return None  # <- Changes to the frame are not detected.
+
+    def _get_rows(self, frame):
+        """Return a list of row tuples from *frame* with missing values
+        as None.
+        """
+        frame = frame.astype(object).where(frame.notnull(), None)
+        return list(frame.itertuples(index=False, name=None))
+
+    def _get_values(self, series):
+        """Return a list of values from *series* with missing values
+        as None.
+        """
+        return series.astype(object).where(series.notnull(), None).tolist()
+
+    def _get_scalar(self, value):
+        """Return *value* as a Python object (None if missing)."""
+        if self._pandas.isnull(value):
+            return None
+        item = getattr(value, 'item', None)  # <- NumPy scalars.
+        return item() if callable(item) else value
+
+    def _get_select_columns(self, key, value):
+        """Return a 2-tuple of key and value column names for the
+        parts of a select returned by _parse_select().
+        """
+        key_names = _get_key_names(key)
+        value_names = _get_key_names(tuple(value)[0])
+        self._assert_fields_exist(key_names + value_names)
+        return key_names, value_names
+
+    def _filter_frame(self, where):
+        """Return the rows of the frame that match the *where*
+        constraints (using the same NULL handling as SQLite).
+        """
+        df = self._df
+        samples = [v for v in where.values() if isinstance(v, _RowSample)]
+        where = dict((k, v) for k, v in where.items()
+                     if not isinstance(v, _RowSample))
+        self._assert_fields_exist(where.keys())
+
+        mask = self._pandas.Series(True, index=df.index)
+        for key, value in where.items():
+            column = df[key]
+            predicate = _get_predicate(value)
+            if predicate is not None or callable(value):
+                function = predicate.function if predicate is not None else value
+                matches = [bool(function(x)) for x in self._get_values(column)]
+                mask &= self._pandas.Series(matches, index=df.index, dtype=bool)
+            elif _is_nsiterable(value):
+                mask &= column.isin(list(value)) & column.notnull()
+            else:
+                mask &= (column == value)
+
+        for sample in samples:
+            mask &= self._get_sample_mask(sample, mask)
+
+        if mask.all():
+            return df
+        return df[mask]
+
+    def _get_sample_mask(self, sample, mask):
+        """Return a mask of the rows chosen by *sample* (a _RowSample)
+        from the rows selected by *mask*. Rows are ranked using their
+        position (the same as the rowid used by DataSource).
+        """
+        df = self._df
+        sample_keys = [_sample_key(i, sample.seed) for i in range(1, len(df) + 1)]
+        if sample.fraction is not None:
+            chosen = [x < sample.fraction for x in sample_keys]
+            return self._pandas.Series(chosen, index=df.index, dtype=bool)
+
+        if sample.key_names:
+            groups = zip(*[self._get_values(df[x]) for x in sample.key_names])
+        else:
+            groups = itertools.repeat(())
+        members = collections.defaultdict(list)
+        for position, (selected, group) in enumerate(zip(mask, groups)):
+            if selected:
+                members[group].append((sample_keys[position], position))
+
+        chosen = [False] * len(df)
+        for group in members.values():
+            for _, position in sorted(group)[:sample.n]:
+                chosen[position] = True
+        return self._pandas.Series(chosen, index=df.index, dtype=bool)
+
+    def _sort_frame(self, frame, names):
+        """Return *frame* sorted by the columns in *names* using the
+        same order as SQLite's ORDER BY (equal rows keep their order).
+        """
+        try:
+            return frame.sort_values(list(names), kind='mergesort',
+                                     na_position='first')
+        except TypeError:
+            # Columns with mixed types can not be sorted by pandas.
+            values = list(zip(*[self._get_values(frame[x]) for x in names]))
+            sortkey = lambda i: tuple(_sqlite_sortkey(x) for x in values[i])
+            return frame.iloc[sorted(range(len(values)), key=sortkey)]
+
+    def _select_rows(self, select, where, distinct):
+        key, value = _parse_select(select)
+        key_names, value_names = self._get_select_columns(key, value)
+
+        frame = self._filter_frame(where)
+        if key:
+            frame = self._sort_frame(frame, key_names)
+        frame = frame[list(key_names + value_names)]
+        if distinct:
+            frame = frame.drop_duplicates()
+        return self._get_rows(frame)
+
+    def _select(self, select, **where):
+        value = _parse_select(select)[1]
+        distinct = isinstance(value, collections.Set)
+        rows = self._select_rows(select, where, distinct)
+        return self._format_results(select, rows)
+
+    def _select_distinct(self, select, **where):
+        rows = self._select_rows(select, where, distinct=True)
+        return self._format_results(select, rows)
+
+    @staticmethod
+    def _sum_may_overflow(series):
+        """Return True if the SUM of an integer *series* could exceed
+        the range of a 64-bit integer.
+        """
+        count = int(series.count())
+        if not count:
+            return False
+        largest = max(abs(int(series.min())), abs(int(series.max())))
+        return largest * count > 9223372036854775807
+
+    def _aggregate_series(self, sqlfunc, series, column):
+        """Apply *sqlfunc* to a Series or SeriesGroupBy object made
+        from the Series *column*. Numeric columns use vectorized
+        pandas methods, other columns (and integer sums that could
+        overflow) use the Python implementation of the SQLite function.
+        """
+        name = sqlfunc.upper() if isinstance(sqlfunc, string_types) else None
+        dtype = column.dtype
+        vectorized = dtype.kind in 'biuf'
+        if name == 'SUM' and dtype.kind in 'iu' and self._sum_may_overflow(column):
+            vectorized = False
+        if vectorized:
+            if name == 'SUM':
+                return series.sum(min_count=1)
+            if name == 'COUNT':
+                return series.count()
+            if name == 'AVG':
+                return series.mean()
+            if name == 'MIN':
+                return series.min()
+            if name == 'MAX':
+                return series.max()
+            if name == 'MEDIAN':
+                return series.median()
+            if name == 'VARIANCE':
+                return series.var(ddof=1)
+            if name == 'STDDEV':
+                return series.std(ddof=1)
+
+        if name is not None:
+            python_functions = dict((v, k) for k, v in _sqlite_aggregate_names.items())
+            try:
+                function = python_functions[name]
+            except KeyError:
+                raise ValueError('unknown aggregate function {0!r}'.format(sqlfunc))
+        else:
+            function = sqlfunc  # <- A callable object like _SqlitePercentile.
+
+        if isinstance(series, self._pandas.Series):
+            return function(self._get_values(series))
+        return series.agg(lambda x: function(self._get_values(x)))
+
+    def _select_aggregate(self, sqlfunc, select, **where):
+        key, value = _parse_select(select)
+        key_names, value_names = self._get_select_columns(key, value)
+        distinct = isinstance(value, collections.Set)
+
+        frame = self._filter_frame(where)
+        if key:
+            frame = self._sort_frame(frame, key_names)
+
+        results = []
+        for name in value_names:
+            series = frame[name]
+            keys = [frame[x] for x in key_names]
+            if distinct:
+                columns = _unique_everseen(key_names + (name,))
+                keep = ~frame[list(columns)].duplicated()
+                series = series[keep]
+                keys = [x[keep] for x in keys]
+            column = series
+            if key:
+                series = series.groupby(keys, sort=False, dropna=False)
+            results.append(self._aggregate_series(sqlfunc, series, column))
+
+        if not key:
+            rows = [tuple(self._get_scalar(x) for x in results)]
+            return self._format_aggregate(select, rows)  # <- EXIT!
+
+        # Groups are in key order because the frame was sorted first.
+        group_keys = results[0].index.tolist()
+        if len(key_names) == 1:
+            group_keys = [(x,) for x in group_keys]
+        columns = [self._get_values(x) for x in results]
+        rows = []
+        for group_key, values in zip(group_keys, zip(*columns)):
+            group_key = tuple(self._get_scalar(x) for x in group_key)
+            rows.append(group_key + values)
+        return self._format_aggregate(select, rows)
+
+    def _select_compiled(self, steps, select, **where):
+        return self._select_compiled_fallback(steps, select, **where)
+
+    def _execute_batch(self, key_columns, members):
+        return None  # <- Queries are executed individually.
+
+    def create_index(self, *columns):
+        """Check that *columns* exist but do not create an index
+        (frames are not indexed so queries always scan the frame).
+        """
+        self._assert_fields_exist(columns)
+
+    def enable_index_advisor(self, auto_index=False, threshold=3):
+        """Do nothing (frames are not indexed so there is nothing to
+        recommend, :meth:`index_recommendations` returns an empty list).
+        """
+        self._index_advisor = None
+
+    def analyze(self):
+        """Gather statistics for all columns (see :meth:`column_stats`).
+        Statistics are not used to answer queries and are not updated
+        if the frame is modified.
+        """
+        self._collect_stats(self.fieldnames, distinct=False)
+
+    def _collect_stats(self, columns, distinct=True):
+        """Gather statistics for *columns* and return a dictionary of
+        results (see DataSource._collect_stats()).
+        """
+        df = self._df
+        collected = {}
+        for column in columns:
+            series = df[column]
+            values = [x for x in self._get_values(series) if x is not None]
+            if values:
+                min_value = min(values, key=_sqlite_sortkey)
+                max_value = max(values, key=_sqlite_sortkey)
+            else:
+                min_value = max_value = None
+            type_counts = [0] * len(_stats_type_names)
+            for value in values:
+                group = _sqlite_sortkey(value)[0]
+                if group == 1:
+                    index = 1 if isinstance(value, float) else 0  # <- REAL or INTEGER
+                    type_counts[index] += 1
+                elif group in (2, 3):
+                    type_counts[group] += 1  # <- TEXT or BLOB
+            collected[column] = _ColumnStats(
+                len(df),
+                len(set(values)) if distinct else None,
+                len(df) - len(values),
+                min_value,
+                max_value,
+                _infer_stats_type(type_counts),
+            )
+
+        column_stats = getattr(self, '_column_stats', None)
+        if column_stats:
+            column_stats[1].update(collected)
+        else:
+            self._column_stats = (None, collected)
+        return collected
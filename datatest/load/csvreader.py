@@ -1,9 +1,115 @@
 # -*- coding: utf-8 -*-
 """Unicode CSV Reader (Python 3 and Python 2 compatible)."""
 from __future__ import absolute_import
+import bz2
+import codecs
+import collections
 import csv
+import gzip
 import io
+import multiprocessing
+import os
+import re
 import sys
+import zipfile
+
+
+########################################################################
+# Compressed files.
+########################################################################
+_buffer_size = 1048576  # <- Read buffer for compressed files.
+
+_magic_numbers = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+]
+
+
+class _ZipMember(object):
+    """A file stored in a zip *archive* (a path) under the given
+    member *name*. Used in place of a file path.
+    """
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+
+    def __repr__(self):
+        return '{0}({1!r}, {2!r})'.format(self.__class__.__name__,
+                                         self.archive, self.name)
+
+
+def _get_compression(path):
+    """Return the compression format of the file at *path* ('gzip',
+    'bz2', 'xz', or 'zip') identified by its magic number or None if
+    the file is not compressed.
+    """
+    if isinstance(path, _ZipMember):
+        return 'zip'
+    with open(path, 'rb') as fh:
+        header = fh.read(6)
+    for magic, compression in _magic_numbers:
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def _expand_archives(files):
+    """Return a list of *files* with the paths of zip archives replaced
+    by a _ZipMember for each file in the archive (in archive order).
+    """
+    expanded = []
+    for f in files:
+        if isinstance(f, str) and _get_compression(f) == 'zip':
+            with zipfile.ZipFile(f) as archive:
+                names = [x.filename for x in archive.infolist()
+                         if not x.filename.endswith('/')]
+            expanded.extend(_ZipMember(f, x) for x in names)
+        else:
+            expanded.append(f)
+    return expanded
+
+
+def _open_binary(path):
+    """Open the file at *path* (a path or _ZipMember) for reading
+    bytes. Compressed files are decompressed as they are read.
+    """
+    compression = _get_compression(path)
+    if compression is None:
+        return open(path, 'rb')  # <- EXIT!
+
+    if compression == 'gzip':
+        fileobj = gzip.GzipFile(path, 'rb')
+    elif compression == 'bz2':
+        fileobj = bz2.BZ2File(path, 'rb')
+    elif compression == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            raise ImportError(
+                "No module named 'lzma'\n"
+                "\n"
+                "Reading XZ compressed files requires the 'lzma' "
+                "module (Python 3.3 or newer)."
+            )
+        fileobj = lzma.LZMAFile(path, 'rb')
+    else:
+        if not isinstance(path, _ZipMember):
+            members = _expand_archives([path])
+            if len(members) != 1:
+                msg = 'zip archive {0!r} contains {1} files, expected 1'
+                raise ValueError(msg.format(path, len(members)))
+            path = members[0]
+        archive = zipfile.ZipFile(path.archive)
+        try:
+            fileobj = archive.open(path.name)
+        finally:
+            archive.close()  # <- Member stays readable until closed.
+
+    if not (hasattr(fileobj, 'readable') and hasattr(fileobj, 'readinto')):
+        return fileobj  # <- Not an io object (like BZ2File on Python 2).
+    return io.BufferedReader(fileobj, _buffer_size)
 
 
 class UnicodeCsvReader:
@@ -21,6 +127,10 @@ class UnicodeCsvReader:
     requires them to be opened in text-mode ('r') while Python 2
     requires them to be opened in binary-mode ('rb').  UnicodeCsvReader
     manages these differences automatically when given a file path.
+
+    Files compressed with gzip, bzip2, or xz (and zip archives that
+    contain a single file) are decompressed as they are read. The
+    format is identified by the file's contents, not its extension.
     """
     def __init__(self, csvfile, encoding='utf-8', dialect='excel', **fmtparams):
         self.encoding = encoding
@@ -49,9 +159,12 @@ class UnicodeCsvReader:
 
     @staticmethod
     def _get_file_object(csvfile, encoding=None):
-        if isinstance(csvfile, str):
+        if isinstance(csvfile, (str, _ZipMember)):
             assert encoding, 'encoding required for file path'
-            return open(csvfile, 'rt', encoding=encoding, newline='')  # <- EXIT!
+            if _get_compression(csvfile) is None:
+                return open(csvfile, 'rt', encoding=encoding, newline='')  # <- EXIT!
+            return io.TextIOWrapper(_open_binary(csvfile), encoding=encoding,
+                                    newline='')  # <- EXIT!
 
         if hasattr(csvfile, 'mode'):
             assert 'b' not in csvfile.mode, "File must be open in text mode ('rt')."
@@ -70,8 +183,8 @@ class UnicodeCsvReader:
 if sys.version < '3':
     @staticmethod
     def _py2_get_file_object(csvfile, encoding):
-        if isinstance(csvfile, str):
-            return open(csvfile, 'rb')  # <- EXIT!
+        if isinstance(csvfile, (str, _ZipMember)):
+            return _open_binary(csvfile)  # <- EXIT!
 
         if hasattr(csvfile, 'mode'):
             assert 'b' in csvfile.mode, ("When using Python 2, file must "
@@ -91,3 +204,269 @@ if sys.version < '3':
     def _py2_next(self):
         return self.__next__()
     UnicodeCsvReader.next = _py2_next
+
+
+########################################################################
+# Encoding detection.
+########################################################################
+_non_ascii_regex = re.compile(b'[\x80-\xff]')
+
+
+def _sniff_encoding(csvfile, blocksize=65536, limit=1048576):
+    """Return 'utf-8' if the first *limit* bytes of the file at path
+    *csvfile* are valid UTF-8 or 'iso8859-1' if they are not
+    (compressed files are decompressed). Returns None if *csvfile* is
+    not a path (file objects are already decoded by their own
+    encoding).
+
+    The prefix is read in blocks of *blocksize* bytes but only blocks
+    that contain non-ASCII bytes are decoded. An incremental decoder
+    is used so that multi-byte characters can span block boundaries.
+    Only the start of the file is checked so callers must still fall
+    back to ISO-8859-1 if UTF-8 fails to decode later in the file.
+    """
+    if not isinstance(csvfile, (str, _ZipMember)):
+        return None
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remaining = limit
+    with _open_binary(csvfile) as fh:
+        while remaining > 0:
+            block = fh.read(min(blocksize, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            if not _non_ascii_regex.search(block) and not decoder.getstate()[0]:
+                continue  # <- Skip all-ASCII blocks.
+            try:
+                decoder.decode(block)
+            except UnicodeDecodeError:
+                return 'iso8859-1'  # <- EXIT!
+    if remaining > 0:
+        try:
+            decoder.decode(b'', final=True)  # <- Check for truncated character.
+        except UnicodeDecodeError:
+            return 'iso8859-1'
+    return 'utf-8'
+
+
+########################################################################
+# Parallel CSV parsing.
+########################################################################
+_range_sentinel = 'DATATESTENDOFRANGE'
+
+
+def _find_record_boundaries(path, chunksize, quotechar=None, blocksize=8388608):
+    """Return a list of byte offsets that split the file at *path*
+    into ranges of roughly *chunksize* bytes. Offsets fall just after
+    a newline that is not inside a quoted field (tracked by counting
+    *quotechar* bytes). The first offset is 0 and the last is the file
+    size.
+
+    Quote counting can be fooled by malformed data or by quote
+    characters inside unquoted fields so parsed ranges must still be
+    checked (see _parse_csv_range()).
+    """
+    boundaries = [0]
+    target = chunksize
+    in_quotes = False
+    offset = 0
+    with open(path, 'rb') as fh:
+        while True:
+            block = fh.read(blocksize)
+            if not block:
+                break
+            end = len(block)
+            i = 0  # <- Quotes in block[:i] have been counted.
+            while True:
+                start = max(target - offset, i)
+                if start >= end:
+                    break
+                if quotechar:
+                    in_quotes ^= (block.count(quotechar, i, start) % 2 == 1)
+                i = start
+                j = block.find(b'\n', i)
+                if j == -1:
+                    break
+                if quotechar:
+                    in_quotes ^= (block.count(quotechar, i, j) % 2 == 1)
+                i = j + 1
+                if not in_quotes:
+                    boundaries.append(offset + i)
+                    target = offset + i + chunksize
+            if quotechar:
+                in_quotes ^= (block.count(quotechar, i, end) % 2 == 1)
+            offset += end
+
+    if boundaries[-1] != offset:
+        boundaries.append(offset)
+    return boundaries
+
+
+def _parse_csv_range(args):
+    """Parse the bytes from *start* to *end* of the file at *path* and
+    return a list of rows. Returns None if the range does not end on
+    a record boundary (the last record is unterminated).
+    """
+    path, encoding, start, end, dialect, fmtparams = args
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+
+    # A sentinel record is appended to the data. If the range ends on
+    # a record boundary, the sentinel is parsed as its own row.
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    data += _range_sentinel.encode('ascii') + b'\n'
+
+    if sys.version < '3':
+        reader = csv.reader(io.BytesIO(data), dialect=dialect, **fmtparams)
+        rows = [[s.decode(encoding) for s in row] for row in reader]
+    else:
+        text = io.StringIO(data.decode(encoding), newline='')
+        rows = list(csv.reader(text, dialect=dialect, **fmtparams))
+
+    if not rows or rows[-1] != [_range_sentinel]:
+        return None
+    rows.pop()
+    return rows
+
+
+class ParallelCsvReader(object):
+    """ParallelCsvReader reads a CSV file using multiple processes
+    and returns rows in the same order as UnicodeCsvReader::
+
+        with ParallelCsvReader('myfile.csv', encoding='utf-8') as reader:
+            for row in reader:
+                process(row)
+
+    The file is split into ranges of about *chunksize* bytes (on
+    record boundaries) which are parsed by a pool of *processes*
+    workers. Rows are returned in order from the current process so
+    the caller remains the only writer.
+
+    Parsing falls back to UnicodeCsvReader (in the current process)
+    if *csvfile* is not an uncompressed file path, if the file is
+    smaller than *chunksize*, or if the *encoding* is not
+    ASCII-compatible. If a range turns out not to end on a record
+    boundary, the rest of the file is read in the current process.
+    """
+    def __init__(self, csvfile, encoding='utf-8', processes=None,
+                 chunksize=16777216, dialect='excel', **fmtparams):
+        self.encoding = encoding
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.dialect = dialect
+        self._csvfile = csvfile
+        self._fmtparams = fmtparams
+        self._fileobj = None
+        self._rows = self._iter_rows()
+
+    def _get_boundaries(self):
+        """Return list of record boundaries or None if the file can
+        not be parsed in parallel.
+        """
+        if not isinstance(self._csvfile, str):
+            return None
+
+        if os.path.getsize(self._csvfile) <= self.chunksize:
+            return None
+
+        if _get_compression(self._csvfile):
+            return None
+
+        if sys.version < '3':
+            resolved = csv.reader(io.BytesIO(), self.dialect, **self._fmtparams).dialect
+        else:
+            resolved = csv.reader(io.StringIO(), self.dialect, **self._fmtparams).dialect
+
+        if resolved.delimiter in _range_sentinel:
+            return None
+
+        quotechar = resolved.quotechar
+        if resolved.quoting == csv.QUOTE_NONE:
+            quotechar = None
+
+        # Record boundaries are found by searching for newline and
+        # quote bytes so these must be encoded as single ASCII bytes.
+        try:
+            for char in ['\n', resolved.delimiter, quotechar or '']:
+                if not isinstance(char, type(u'')):
+                    char = char.decode('ascii')
+                if char.encode(self.encoding) != char.encode('ascii'):
+                    return None
+        except (LookupError, UnicodeError):
+            return None
+
+        if quotechar:
+            quotechar = quotechar.encode('ascii')
+        return _find_record_boundaries(self._csvfile, self.chunksize, quotechar)
+
+    def _iter_rows(self):
+        boundaries = self._get_boundaries()
+        start = 0
+        if boundaries and len(boundaries) > 2:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                ranges = iter(zip(boundaries, boundaries[1:]))
+                pending = collections.deque()
+                while True:
+                    # Keep a limited number of ranges in progress so
+                    # parsed rows don't pile up faster than they are
+                    # consumed.
+                    while len(pending) < self.processes * 2:
+                        try:
+                            range_start, range_end = next(ranges)
+                        except StopIteration:
+                            break
+                        args = (self._csvfile, self.encoding, range_start,
+                                range_end, self.dialect, self._fmtparams)
+                        pending.append((range_start, pool.apply_async(_parse_csv_range, (args,))))
+
+                    if not pending:
+                        return  # <- EXIT! All ranges parsed.
+
+                    start, result = pending.popleft()
+                    rows = result.get()
+                    if rows is None:
+                        break  # <- Read rest of file in current process.
+                    for row in rows:
+                        yield row
+            finally:
+                pool.terminate()
+                pool.join()
+
+        if start:
+            self._fileobj = open(self._csvfile, 'rb')
+            self._fileobj.seek(start)
+            if sys.version >= '3':
+                self._fileobj = io.TextIOWrapper(self._fileobj,
+                                                 encoding=self.encoding,
+                                                 newline='')
+        else:
+            self._fileobj = self._csvfile
+
+        with UnicodeCsvReader(self._fileobj, self.encoding, self.dialect,
+                              **self._fmtparams) as reader:
+            for row in reader:
+                yield row
+
+    def close(self):
+        self._rows.close()
+        if self._fileobj is not None and self._fileobj != self._csvfile:
+            self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+    def next(self):  # <- For Python 2.
+        return self.__next__()
@@ -1,14 +1,287 @@
 # -*- coding: utf-8 -*-
 """Temporary SQLite table loader and manager."""
 from __future__ import absolute_import
+import hashlib
 import itertools
+import multiprocessing
+import os
+import re
+import shutil
 import sqlite3
+import sys
+import tempfile
+import warnings
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url  # <- For Python 2.
 from .csvreader import UnicodeCsvReader
+from .csvreader import ParallelCsvReader
+from .csvreader import _sniff_encoding
+from .csvreader import _expand_archives
+from .xlsxreader import XlsxReader
 from ..utils.misc import _is_nsiterable
 
 
-# Default connection shared by TemporarySqliteTable instances.
-_sqltemp_shared_connection = sqlite3.connect('')
+class _Connection(sqlite3.Connection):
+    """A sqlite3.Connection with a *connection_id* that is never
+    reused (unlike id() values which can be reused after a connection
+    is garbage collected). TemporarySqliteTable creates TEMPORARY
+    tables unless *temporary_tables* is False.
+
+    The number of rows changed by internal loading (inside
+    _TransactionSyncOff transactions) is kept in *internal_changes*
+    so that loading new tables is not mistaken for a change in the
+    data of existing tables.
+    """
+    _counter = itertools.count()
+
+    def __init__(self, *args, **kwds):
+        super(_Connection, self).__init__(*args, **kwds)
+        self.connection_id = 'connection{0}'.format(next(self._counter))
+        self.temporary_tables = True
+        self.internal_changes = 0
+
+
+_pragma_value_regex = re.compile(r'^-?\w+$')
+
+
+class TemporaryDatabase(object):
+    """A temporary SQLite database for TemporarySqliteTable instances.
+
+    The *pragmas* (a mapping of names and values like ``cache_size``,
+    ``temp_store``, ``mmap_size``, or ``page_size``) are applied to
+    every connection to the database. The main :attr:`connection` is
+    used to load and query data. For use in other threads, read-only
+    connections can be borrowed with :meth:`acquire_reader` (requires
+    Python 3.4 or newer for in-memory databases) and returned with
+    :meth:`release_reader`.
+
+    The database is held in memory unless a file *path* is given
+    (used for cached data that is kept between runs). Existing SQLite
+    files can be added to the database with :meth:`attach`.
+    """
+    _counter = itertools.count()
+
+    def __init__(self, pragmas=None, path=None):
+        """Initialize self."""
+        pragmas = dict(pragmas or {})
+        for name, value in pragmas.items():
+            if (not _pragma_value_regex.match(str(name))
+                    or not _pragma_value_regex.match(str(value))):
+                msg = 'invalid pragma {0!r} with value {1!r}'
+                raise ValueError(msg.format(name, value))
+        self.pragmas = pragmas
+        self.path = path
+
+        if path:
+            self.uri = None
+        elif sys.version_info[:2] >= (3, 4):  # <- Supports "uri" argument.
+            # Readers can only connect to named in-memory databases
+            # (with a shared cache).
+            self.uri = 'file:datatest{0}_{1}?mode=memory&cache=shared'.format(
+                os.getpid(), next(self._counter))
+        else:
+            self.uri = None
+        self._readers = []
+        self._attached = []
+        self.connection = self._connect()
+
+    def _connect(self, read_only=False):
+        if self.path:
+            connection = sqlite3.connect(self.path,
+                                         check_same_thread=not read_only,
+                                         factory=_Connection)
+        elif self.uri:
+            connection = sqlite3.connect(self.uri, uri=True,
+                                         check_same_thread=not read_only,
+                                         factory=_Connection)
+        else:
+            connection = sqlite3.connect('', factory=_Connection)
+
+        # In-memory databases are already temporary. Their tables are
+        # not created as TEMPORARY tables so they can be read using
+        # other connections.
+        connection.temporary_tables = bool(self.path)
+
+        # The page_size must be set before any tables are created.
+        names = sorted(self.pragmas, key=lambda x: x != 'page_size')
+        for name in names:
+            connection.execute('PRAGMA {0} = {1}'.format(name, self.pragmas[name]))
+
+        for attached in self._attached:
+            self._attach(connection, *attached)
+
+        if read_only:
+            connection.execute('PRAGMA query_only = 1')
+            connection.execute('PRAGMA read_uncommitted = 1')
+        return connection
+
+    def attach(self, path, mmap_size=None):
+        """Attach the SQLite file at *path* to the database (and to
+        any reader connections) and return its schema name. The file
+        is opened read-only (when supported, see below) and its tables
+        are queried in place. If *mmap_size* is given, up to this many
+        bytes of the file are read using memory-mapped I/O.
+
+        Read-only access requires the database to accept URI filenames
+        (in-memory databases on Python 3.4 or newer). Otherwise, the
+        file is attached normally.
+        """
+        if not os.path.isfile(path):
+            raise IOError('no such file: {0!r}'.format(path))
+        mmap_size = int(mmap_size) if mmap_size else None
+        schema = 'attached{0}'.format(len(self._attached))
+        attached = (schema, os.path.abspath(path), mmap_size)
+        for connection in [self.connection] + self._readers:
+            self._attach(connection, *attached)
+        self._attached.append(attached)
+        return schema
+
+    def _attach(self, connection, schema, path, mmap_size):
+        if self.uri:
+            filename = 'file:{0}?mode=ro'.format(pathname2url(path))
+        else:
+            filename = path
+        connection.execute('ATTACH DATABASE ? AS {0}'.format(schema), (filename,))
+        if mmap_size:
+            connection.execute('PRAGMA {0}.mmap_size = {1}'.format(schema, mmap_size))
+
+    def acquire_reader(self):
+        """Return a read-only connection to the database that can be
+        used from any thread (by one thread at a time). Reader
+        connections are pooled, return them with release_reader().
+        """
+        if not (self.path or self.uri):
+            raise sqlite3.NotSupportedError(
+                'reader connections to in-memory databases require '
+                'Python 3.4 or newer')
+        try:
+            return self._readers.pop()
+        except IndexError:
+            return self._connect(read_only=True)
+
+    def release_reader(self, connection):
+        """Return a *connection* from acquire_reader() to the pool."""
+        self._readers.append(connection)
+
+    def close(self):
+        """Close the main connection and all pooled reader connections."""
+        while self._readers:
+            self._readers.pop().close()
+        self.connection.close()
+
+
+# Default database shared by TemporarySqliteTable instances.
+_sqltemp_shared_database = TemporaryDatabase()
+_sqltemp_shared_connection = _sqltemp_shared_database.connection
+
+
+_numeric_types = ('INTEGER', 'REAL')
+
+
+def _normalize_type(type_name):
+    """Return SQLite type name (INTEGER, REAL, or TEXT) for given
+    *type_name* (a type name or the Python type int, float, or str).
+    """
+    if type_name is None:
+        return None
+    python_types = {int: 'INTEGER', float: 'REAL', str: 'TEXT', type(u''): 'TEXT'}
+    if type_name in python_types:
+        return python_types[type_name]
+    normalized = str(type_name).upper()
+    if normalized not in ('INTEGER', 'REAL', 'TEXT'):
+        msg = 'type must be INTEGER, REAL, or TEXT, got {0!r}'
+        raise ValueError(msg.format(type_name))
+    return normalized
+
+
+# Patterns for numeric text that can be converted without losing
+# information. Values with leading zeros (like "00501") and integers
+# too large for 64 bits are kept as text.
+_integer_regex = re.compile(r'^[+-]?(?:0|[1-9][0-9]{0,17})$')
+_real_regex = re.compile(r'^[+-]?(?:(?:0|[1-9][0-9]*)(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?$')
+
+_type_sample_size = 1000
+
+
+def _infer_column_types(columns, rows):
+    """Return a dictionary of column names and type names (INTEGER,
+    REAL, or TEXT) inferred from the non-empty values in *rows*.
+    """
+    candidates = [set(['INTEGER', 'REAL']) for _ in columns]
+    for row in rows:
+        for value, candidate in zip(row, candidates):
+            if not value or not candidate:
+                continue
+            if _integer_regex.match(value):
+                continue
+            candidate.discard('INTEGER')
+            if not _real_regex.match(value) or value.lstrip('+-').isdigit():
+                candidate.discard('REAL')
+
+    seen = set(i for row in rows for i, value in enumerate(row) if value)
+    types = {}
+    for i, (column, candidate) in enumerate(zip(columns, candidates)):
+        if i not in seen:
+            types[column] = 'TEXT'  # <- No values to infer from.
+        elif 'INTEGER' in candidate:
+            types[column] = 'INTEGER'
+        elif 'REAL' in candidate:
+            types[column] = 'REAL'
+        else:
+            types[column] = 'TEXT'
+    return types
+
+
+def _get_column_types(reader, columns, types):
+    """Return a 2-tuple of rows and column types for the CSV data
+    in *reader*. The given *types* can be None (for untyped columns),
+    a dictionary of column names and types, or the string 'infer' to
+    infer types from a sample of rows.
+    """
+    if types is None:
+        return reader, None
+
+    if types == 'infer':
+        sample = list(itertools.islice(reader, _type_sample_size))
+        types = _infer_column_types(columns, sample)
+        reader = itertools.chain(sample, reader)
+    return reader, dict((k, _normalize_type(v)) for k, v in types.items())
+
+
+def _select_columns(data, columns, usecols, fill=False):
+    """Return a 2-tuple of *data* rows and *columns* narrowed to the
+    columns in *usecols* (in the order given). If *fill* is True,
+    columns missing from *columns* are filled with empty strings,
+    otherwise a LookupError is raised.
+    """
+    if usecols is None:
+        return data, columns  # <- EXIT!
+
+    if not columns:
+        columns, data = _get_columns_from_data(data)
+    columns = list(columns)
+
+    indexes = []
+    for name in usecols:
+        if name in columns:
+            indexes.append(columns.index(name))
+        elif fill:
+            indexes.append(None)
+        else:
+            raise LookupError('{0!r} not in {1!r}'.format(name, columns))
+
+    data = iter(data)
+    try:
+        first_row = next(data)
+    except StopIteration:
+        return [], list(usecols)  # <- EXIT! No rows.
+    data = itertools.chain([first_row], data)
+
+    if not hasattr(first_row, 'keys'):  # Sequence rows (not dict-like).
+        data = ([('' if i is None else row[i]) for i in indexes] for row in data)
+    return data, list(usecols)
 
 
 def _get_columns_from_data(data):
@@ -44,12 +317,16 @@ class _TransactionSyncOff(object):
         long-term integrity is not a concern. In the unlikely event of
         data corruption, it is entirely acceptable to simply rebuild
         the temporary table.
+
+    Rows changed inside the transaction are added to the connection's
+    *internal_changes* count (see _Connection).
     """
     def __init__(self, connection):
         self.connection = connection
         self._cursor = None
         self._isolation_level = None
         self._synchronous = None
+        self._total_changes = None
 
     def __enter__(self):
         cursor = self.connection.cursor()
@@ -64,6 +341,7 @@ class _TransactionSyncOff(object):
         cursor.execute('PRAGMA synchronous=OFF')
 
         cursor.execute('BEGIN TRANSACTION')
+        self._total_changes = self.connection.total_changes
         return cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -72,13 +350,22 @@ class _TransactionSyncOff(object):
         else:
             self.connection.rollback()  # <- ROLLBACK!
 
+        if hasattr(self.connection, 'internal_changes'):
+            changes = self.connection.total_changes - self._total_changes
+            self.connection.internal_changes += changes
+
         self._cursor.execute('PRAGMA synchronous={0}'.format(self._synchronous))
         self.connection.isolation_level = self._isolation_level
 
 
 class TemporarySqliteTable(object):
-    """Creates a temporary SQLite table and inserts given data."""
-    def __init__(self, data, columns=None, connection=None):
+    """Creates a temporary SQLite table and inserts given data.
+
+    If given, *types* is a dictionary of column names and SQLite
+    type names (INTEGER, REAL, or TEXT) used to declare the column
+    affinity. Columns not in *types* are created without a type.
+    """
+    def __init__(self, data, columns=None, connection=None, types=None):
         """Initialize self."""
         global _sqltemp_shared_connection
         if not connection:
@@ -87,9 +374,11 @@ class TemporarySqliteTable(object):
         if not columns:
             columns, data = _get_columns_from_data(data)
 
+        temporary = getattr(connection, 'temporary_tables', True)
+
         with _TransactionSyncOff(connection) as cursor:
             table = self._get_new_table_name(cursor)
-            self._create_table(cursor, table, columns)
+            self._create_table(cursor, table, columns, temporary, types)
             self._insert_data(cursor, table, columns, data)
 
         # Assign class properties.
@@ -120,11 +409,11 @@ class TemporarySqliteTable(object):
 
     @staticmethod
     def _get_existing_tables(cursor):
-        """Takes sqlite3 *cursor*, returns existing temporary table
-        names.
+        """Takes sqlite3 *cursor*, returns existing table names
+        (including temporary tables).
         """
-        #cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        cursor.execute("SELECT name FROM sqlite_temp_master WHERE type='table'")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                       "UNION SELECT name FROM sqlite_temp_master WHERE type='table'")
         return [x[0] for x in cursor]
 
     @staticmethod
@@ -148,18 +437,27 @@ class TemporarySqliteTable(object):
         return name
 
     @classmethod
-    def _create_table_statement(cls, table, columns):
-        """Return 'CREATE TEMPORARY TABLE' statement."""
+    def _column_definition(cls, column, types=None):
+        """Return column name with declared type (if in *types*)."""
+        type_name = _normalize_type((types or {}).get(column))
+        column = cls._normalize_column(column)
+        return '{0} {1}'.format(column, type_name) if type_name else column
+
+    @classmethod
+    def _create_table_statement(cls, table, columns, temporary=True, types=None):
+        """Return 'CREATE TEMPORARY TABLE' statement (or 'CREATE
+        TABLE' if *temporary* is False).
+        """
         #cls._assert_unique(columns)
-        columns = [cls._normalize_column(x) for x in columns]
-        #return 'CREATE TABLE %s (%s)' % (table, ', '.join(columns))
-        return 'CREATE TEMPORARY TABLE %s (%s)' % (table, ', '.join(columns))
+        columns = [cls._column_definition(x, types) for x in columns]
+        create = 'CREATE TEMPORARY TABLE' if temporary else 'CREATE TABLE'
+        return '%s %s (%s)' % (create, table, ', '.join(columns))
 
     @classmethod
-    def _create_table(cls, cursor, table, columns):
+    def _create_table(cls, cursor, table, columns, temporary=True, types=None):
         cls._assert_unique(columns)
         try:
-            statement = cls._create_table_statement(table, columns)
+            statement = cls._create_table_statement(table, columns, temporary, types)
             cursor.execute(statement)
         except Exception as e:
             if isinstance(e, UnicodeDecodeError):
@@ -183,10 +481,15 @@ class TemporarySqliteTable(object):
         statement = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
             table,
             ', '.join(cls._normalize_column(col) for col in columns),
-            ', '.join(['?'] * len(columns)),
+            ', '.join(cls._get_placeholders(cursor, table, columns)),
         )
         cursor.executemany(statement, data_iter)
 
+    @classmethod
+    def _get_placeholders(cls, cursor, table, columns):
+        """Return list of parameter placeholders for INSERT statement."""
+        return ['?'] * len(columns)
+
     @staticmethod
     def _normalize_column(name):
         """Normalize value for use as SQLite column name."""
@@ -221,16 +524,43 @@ class TemporarySqliteTable(object):
 
 
 class TemporarySqliteTableForCsv(TemporarySqliteTable):
-    """."""
+    """Creates a temporary SQLite table for CSV data. Missing values
+    default to empty strings. When INTEGER or REAL *types* are given,
+    values in these columns are converted by the column affinity as
+    they are inserted and empty strings are loaded as NULL.
+    """
+    @classmethod
+    def _column_definition(cls, column, types=None):
+        """Includes added default-to-empty-string clause for columns
+        that are not numeric.
+        """
+        definition = super(TemporarySqliteTableForCsv, cls)._column_definition(column, types)
+        if _normalize_type((types or {}).get(column)) in _numeric_types:
+            return definition
+        return "{0} DEFAULT ''".format(definition)
+
     @classmethod
-    def _create_table_statement(cls, table, columns):
+    def _create_table_statement(cls, table, columns, temporary=True, types=None):
         """Includes added default-to-empty-string clause for columns."""
         cls._assert_unique(columns)
-        columns = [cls._normalize_column(x) for x in columns]
-        columns = ["{0} DEFAULT ''".format(col) for col in columns]
-        return 'CREATE TEMPORARY TABLE %s (%s)' % (table, ', '.join(columns))
+        columns = [cls._column_definition(x, types) for x in columns]
+        create = 'CREATE TEMPORARY TABLE' if temporary else 'CREATE TABLE'
+        return '%s %s (%s)' % (create, table, ', '.join(columns))
 
-    def _concatenate_data(self, data, columns):
+    @classmethod
+    def _get_placeholders(cls, cursor, table, columns):
+        """Load empty strings as NULL in numeric columns."""
+        cursor.execute('PRAGMA table_info(' + table + ')')
+        declared = dict((x[1], x[2].upper()) for x in cursor.fetchall())
+        placeholders = []
+        for column in columns:
+            if declared.get(column.strip() or '_empty_') in _numeric_types:
+                placeholders.append("NULLIF(?, '')")
+            else:
+                placeholders.append('?')
+        return placeholders
+
+    def _concatenate_data(self, data, columns, types=None):
         if not columns:
             columns, data = _get_columns_from_data(data)
 
@@ -238,78 +568,413 @@ class TemporarySqliteTableForCsv(TemporarySqliteTable):
             existing_cols = self.columns
             missing_cols = [x for x in columns if x not in existing_cols]
             for column in missing_cols:
-                statement = "ALTER TABLE {0} ADD COLUMN {1} DEFAULT ''"
+                if types and column in types:
+                    column = self._column_definition(column, types)
+                else:
+                    column = "{0} DEFAULT ''".format(column)
+                statement = 'ALTER TABLE {0} ADD COLUMN {1}'
                 cursor.execute(statement.format(self._name, column))
 
             self._insert_data(cursor, self._name, columns, data)
 
 
-def _from_csv(file, encoding=None, **fmtparams):
-    """Loads one or more CSV files as a temporary SQLite table."""
-    # TODO: Need to refactor!!! Encoding fallback is included twice
-    # (copied from old CsvSource class).
-
+def _get_csv_reader(file, encoding, processes, fmtparams):
+    """Return a UnicodeCsvReader or, if *processes* is not 1, a
+    ParallelCsvReader.
+    """
+    if processes == 1:
+        return UnicodeCsvReader(file, encoding=encoding, **fmtparams)
+    return ParallelCsvReader(file, encoding=encoding, processes=processes, **fmtparams)
+
+
+def _from_csv(file, encoding=None, connection=None, processes=1,
+              types=None, usecols=None, detected=None, **fmtparams):
+    """Loads one or more CSV files as a temporary SQLite table. Files
+    are parsed using the given number of worker *processes* (None to
+    use one per CPU). Column *types* can be a dictionary of column
+    names and types or 'infer' (see _get_column_types()). If *usecols*
+    is given, only these columns are loaded (in the given order). Zip
+    archives are loaded as if each file they contain was given. The
+    *detected* dictionary is used to remember encodings between loads
+    (see _load_csv_file()).
+    """
     if not _is_nsiterable(file):
         file = [file]
-    files = iter(file)
+    file = _expand_archives(file)
+
+    temptable = None
+    found = set()
+    for f in file:
+        temptable, columns = _load_csv_file(temptable, f, encoding, connection,
+                                            processes, types, usecols, fmtparams,
+                                            detected)
+        found.update(columns)
+
+    if usecols is not None:
+        missing = [x for x in usecols if x not in found]
+        if missing:
+            temptable.drop()
+            msg = 'columns not found in CSV data: {0}'
+            raise LookupError(msg.format(', '.join(repr(x) for x in missing)))
+
+    return temptable
 
-    first_file = next(files)
 
-    #with UnicodeCsvReader(first_file, encoding, **fmtparams) as reader:
-    #    columns = next(reader)  # Header row.
-    #    temptable = TemporarySqliteTableForCsv(reader, columns)
+def _warn_encoding_fallback(file):
+    """Warn that *file* was loaded using ISO-8859-1 as a fallback."""
+    try:
+        filename = os.path.basename(file)
+    except (AttributeError, TypeError):
+        filename = repr(file)
+    msg = ('\nData in file {0!r} does not appear to be encoded '
+           'as UTF-8 (used ISO-8859-1 as fallback). To assure '
+           'correct operation, please specify a text encoding.')
+    warnings.warn(msg.format(filename))
+
+
+def _load_csv_file(temptable, file, encoding, connection, processes, types,
+                   usecols, fmtparams, detected=None):
+    """Load CSV *file* into a new table (if *temptable* is None) or
+    add its rows to an existing *temptable*. Returns a 2-tuple of the
+    table and the file's header row. If no *encoding* is given, it is
+    detected from the start of the file (see _sniff_encoding()) and
+    ISO-8859-1 is used as a fallback if UTF-8 fails to decode later
+    in the file (or for file objects, where nothing is detected).
+
+    If a *detected* dictionary is given, the encoding used for the
+    file is saved in it and later calls with the same dictionary use
+    the saved encoding instead of detecting it again.
+    """
+    def load(encoding):
+        with _get_csv_reader(file, encoding, processes, fmtparams) as reader:
+            header = next(reader)  # Header row.
+            data, columns = _select_columns(reader, header, usecols, fill=True)
+            data, column_types = _get_column_types(data, columns, types)
+            if temptable is None:
+                table = TemporarySqliteTableForCsv(data, columns, connection, column_types)
+            else:
+                table = temptable
+                table._concatenate_data(data, columns, column_types)
+        return table, header
+
     if encoding:
-        with UnicodeCsvReader(first_file, encoding=encoding, **fmtparams) as reader:
-            columns = next(reader)  # Header row.
-            temptable = TemporarySqliteTableForCsv(reader, columns)
-    else:
-        try:
-            with UnicodeCsvReader(first_file, encoding='utf-8', **fmtparams) as reader:
-                columns = next(reader)  # Header row.
-                temptable = TemporarySqliteTableForCsv(reader, columns)
+        return load(encoding)
+
+    key = repr(file)
+    if detected is not None and key in detected:
+        return load(detected[key])  # <- EXIT!
 
+    result = None
+    if _sniff_encoding(file) != 'iso8859-1':
+        try:
+            encoding = 'utf-8'
+            result = load(encoding)
         except UnicodeDecodeError:
-            with UnicodeCsvReader(first_file, encoding='iso8859-1', **fmtparams) as reader:
-                columns = next(reader)  # Header row.
-                temptable = TemporarySqliteTableForCsv(reader, columns)
+            pass  # <- Invalid UTF-8 after the detected prefix.
+    if result is None:
+        encoding = 'iso8859-1'
+        result = load(encoding)
+        _warn_encoding_fallback(file)
+
+    if detected is not None:
+        detected[key] = encoding
+    return result
 
-            # Prepare message and raise as warning.
-            try:
-                filename = os.path.basename(first_file)
-            except AttributeError:
-                filename = repr(first_file)
-            msg = ('\nData in file {0!r} does not appear to be encoded '
-                   'as UTF-8 (used ISO-8859-1 as fallback). To assure '
-                   'correct operation, please specify a text encoding.')
-            warnings.warn(msg.format(filename))
-
-    for f in files:
-        #with UnicodeCsvReader(f, encoding, **fmtparams) as reader:
-        #    columns = next(reader)  # Header row.
-        #    temptable._concatenate_data(reader, columns)
-        if encoding:
-            with UnicodeCsvReader(f, encoding=encoding, **fmtparams) as reader:
-                columns = next(reader)  # Header row.
-                temptable._concatenate_data(reader, columns)
-        else:
-            try:
-                with UnicodeCsvReader(f, encoding='utf-8', **fmtparams) as reader:
-                    columns = next(reader)  # Header row.
-                    temptable._concatenate_data(reader, columns)
 
+def _get_csv_fieldnames(file, encoding=None, **fmtparams):
+    """Return the column names of one or more CSV files (aligned by
+    name in the same order used by _from_csv()).
+    """
+    if not _is_nsiterable(file):
+        file = [file]
+    file = _expand_archives(file)
+
+    fieldnames = []
+    for f in file:
+        sniffed = encoding or _sniff_encoding(f)
+        for fallback in ([sniffed] if sniffed else ['utf-8', 'iso8859-1']):
+            try:
+                with UnicodeCsvReader(f, encoding=fallback, **fmtparams) as reader:
+                    header = next(reader)
+                break
             except UnicodeDecodeError:
-                with UnicodeCsvReader(f, encoding='iso8859-1', **fmtparams) as reader:
-                    columns = next(reader)  # Header row.
-                    temptable._concatenate_data(reader, columns)
-
-                # Prepare message and raise as warning.
-                try:
-                    filename = os.path.basename(f)
-                except AttributeError:
-                    filename = repr(f)
-                msg = ('\nData in file {0!r} does not appear to be encoded '
-                       'as UTF-8 (used ISO-8859-1 as fallback). To assure '
-                       'correct operation, please specify a text encoding.')
-                warnings.warn(msg.format(filename))
+                continue
+        fieldnames.extend(x for x in header if x not in fieldnames)
+    return fieldnames
+
+
+class _LazyTable(object):
+    """A table whose columns are loaded when they are first used.
+
+    The *load_table* argument is a function that takes a list of
+    column names, loads these columns (for all rows, in the same row
+    order every time) into a new table, and returns the table's name.
+    The first call to load() creates the table and later calls add
+    any missing columns to it.
+    """
+    def __init__(self, fieldnames, load_table, connection):
+        self.fieldnames = tuple(fieldnames)
+        self.loaded = []
+        self.name = None
+        self._load_table = load_table
+        self._connection = connection
+
+    def load(self, columns):
+        """Load *columns* (if they are not already loaded) and return
+        the name of the table.
+        """
+        columns = set(columns)
+        missing = [x for x in self.fieldnames
+                   if x in columns and x not in self.loaded]
+
+        if self.name is None:
+            missing = missing or list(self.fieldnames[:1])
+            self.name = self._load_table(missing)
+        elif missing:
+            other = self._load_table(missing)
+            self._merge_columns(other, missing)
+        self.loaded.extend(missing)
+        return self.name
+
+    def _merge_columns(self, other, columns):
+        """Add *columns* from *other* table to this table (matching
+        rows by rowid) and drop the *other* table.
+        """
+        with _TransactionSyncOff(self._connection) as cursor:
+            cursor.execute('PRAGMA table_info(' + other + ')')
+            definitions = dict((x[1], (x[2], x[4])) for x in cursor.fetchall())
+
+            assignments = []
+            for column in columns:
+                name = TemporarySqliteTable._normalize_column(column)
+                type_name, default = definitions[name[1:-1].replace('""', '"')]
+                definition = name
+                if type_name:
+                    definition += ' ' + type_name
+                if default is not None:
+                    definition += ' DEFAULT ' + default
+                cursor.execute('ALTER TABLE {0} ADD COLUMN {1}'.format(self.name, definition))
+                assignments.append('{0} = (SELECT {0} FROM {1} WHERE {1}.rowid = {2}.rowid)'
+                                   .format(name, other, self.name))
+
+            cursor.execute('UPDATE {0} SET {1}'.format(self.name, ', '.join(assignments)))
+            cursor.execute('DROP TABLE ' + other)
+
+
+def _load_xlsx_worksheet(path, worksheet, connection, usecols=None):
+    """Load an XLSX *worksheet* into a new TemporarySqliteTable (the
+    first row is used as the header). Rows are streamed into the table
+    as the worksheet is parsed.
+    """
+    with XlsxReader(path, worksheet) as reader:
+        header = next(reader)  # Header row.
+        data, columns = _select_columns(reader, header, usecols)
+        return TemporarySqliteTable(data, columns, connection)
+
 
+def _load_xlsx_worksheet_file(args):
+    """Load a worksheet into a new SQLite file at *db_path* and return
+    the table name (runs in a worker process, see _from_xlsx()).
+    """
+    path, worksheet, usecols, db_path = args
+    connection = sqlite3.connect(db_path, factory=_Connection)
+    connection.temporary_tables = False
+    try:
+        return _load_xlsx_worksheet(path, worksheet, connection, usecols).name
+    finally:
+        connection.close()
+
+
+def _copy_table(connection, schema, table):
+    """Copy *table* from the attached *schema* into a new
+    TemporarySqliteTable in *connection* and return the new table
+    (declared column types are kept).
+    """
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA {0}.table_info({1})'.format(schema, table))
+    table_info = cursor.fetchall()
+    columns = [x[1] for x in table_info]
+    types = dict((x[1], x[2]) for x in table_info if x[2])
+    temptable = TemporarySqliteTable([], columns, connection, types)
+    with _TransactionSyncOff(connection) as cursor:
+        cursor.execute('INSERT INTO {0} SELECT * FROM {1}.{2}'
+                       .format(temptable.name, schema, table))
     return temptable
+
+
+def _copy_attached_table(connection, db_path, table):
+    """Copy *table* from the SQLite file at *db_path* into a new
+    TemporarySqliteTable in *connection* and return the new table.
+    """
+    connection.execute('ATTACH DATABASE ? AS datatest_attached', (db_path,))
+    try:
+        return _copy_table(connection, 'datatest_attached', table)
+    finally:
+        connection.execute('DETACH DATABASE datatest_attached')
+
+
+def _from_xlsx(path, worksheets, connection=None, processes=1, usecols=None):
+    """Load each of the given *worksheets* of an XLSX file into its own
+    temporary SQLite table and return a list of the tables.
+
+    When there are several worksheets and *processes* is not 1, the
+    worksheets are loaded in parallel by worker processes (None to
+    use one per CPU). Each worker writes its worksheet to a SQLite
+    file which is then copied into *connection* (so parsed rows never
+    pile up in memory).
+    """
+    connection = connection or _sqltemp_shared_connection
+    if processes == 1 or len(worksheets) < 2:
+        return [_load_xlsx_worksheet(path, x, connection, usecols)
+                for x in worksheets]  # <- EXIT!
+
+    processes = min(processes or multiprocessing.cpu_count(), len(worksheets))
+    temp_dir = tempfile.mkdtemp()
+    try:
+        args = [(path, x, usecols, os.path.join(temp_dir, 'sheet{0}.sqlite3'.format(i)))
+                for i, x in enumerate(worksheets)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.imap(_load_xlsx_worksheet_file, args)
+            temptables = []
+            for (_, _, _, db_path), table in zip(args, results):
+                temptables.append(_copy_attached_table(connection, db_path, table))
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shutil.rmtree(temp_dir)
+    return temptables
+
+
+_cache_format_version = 1
+
+
+def _get_file_fingerprint(path, blocksize=1048576):
+    """Return a hex digest of the first, middle, and last *blocksize*
+    bytes of the file at *path* (a quick check for changed contents
+    that does not read the entire file).
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for offset in sorted(set([0, max(size // 2 - blocksize // 2, 0),
+                                  max(size - blocksize, 0)])):
+            fh.seek(offset)
+            digest.update(fh.read(blocksize))
+    return digest.hexdigest()
+
+
+def _get_csv_file_state(files):
+    """Return a string that identifies CSV *files* by path, size,
+    modification time, and content fingerprint.
+    """
+    parts = []
+    for path in files:
+        stat = os.stat(path)
+        parts.extend([
+            repr(os.path.abspath(path)),
+            repr(stat.st_size),
+            repr(stat.st_mtime),
+            _get_file_fingerprint(path),
+        ])
+    return '\n'.join(parts)
+
+
+def _get_csv_cache_key(files, encoding, fmtparams, types=None, usecols=None):
+    """Return a string that identifies CSV *files* (see
+    _get_csv_file_state()) and the *encoding*, *fmtparams*, column
+    *types*, and *usecols* used to load them. The key ends with the
+    state of the files.
+    """
+    if isinstance(types, dict):
+        types = sorted((k, _normalize_type(v)) for k, v in types.items())
+    if usecols is not None:
+        usecols = list(usecols)
+    parts = [repr(_cache_format_version), repr(encoding),
+             repr(sorted(fmtparams.items())), repr(types), repr(usecols),
+             _get_csv_file_state(files)]
+    return '\n'.join(parts)
+
+
+def _read_cache_key(path):
+    """Return the key saved in the cache file at *path*."""
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT key FROM datatest_cache').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def _remove_stale_cache_files(cache_dir, prefix, file_state):
+    """Remove cache files in *cache_dir* that begin with *prefix* (the
+    files were made from the same paths) but whose keys do not end
+    with the current *file_state* (the files have changed since).
+    """
+    for name in os.listdir(cache_dir):
+        if not (name.startswith(prefix) and name.endswith('.sqlite3')):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            if _read_cache_key(path).endswith(file_state):
+                continue
+            os.remove(path)
+        except (sqlite3.Error, TypeError, OSError):
+            pass  # <- Unreadable or in use, leave it in place.
+
+
+def _from_csv_cached(cache_dir, files, encoding=None, pragmas=None,
+                     processes=1, types=None, usecols=None, **fmtparams):
+    """Loads CSV *files* (a list of paths) into a SQLite file in
+    *cache_dir* or uses the file from a previous call if the files,
+    *encoding*, *fmtparams*, *types*, and *usecols* are unchanged.
+    Returns a 2-tuple of the cache file's path and the name of the
+    table (the file should be attached read-only and queried in place,
+    see TemporaryDatabase.attach()).
+
+    When a new cache file is saved, older files made from the same
+    paths are removed if the files have changed since.
+    """
+    file_state = _get_csv_file_state(files)
+    key = _get_csv_cache_key(files, encoding, fmtparams, types, usecols)
+    paths = repr([os.path.abspath(x) for x in files])
+    prefix = 'datatest-{0}-'.format(hashlib.sha1(paths.encode('utf-8')).hexdigest()[:16])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    path = os.path.join(cache_dir, '{0}{1}.sqlite3'.format(prefix, digest))
+
+    if not os.path.exists(path):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        database = TemporaryDatabase(pragmas, path=temp_path)
+        database.connection.temporary_tables = False  # <- Keep loaded table.
+        try:
+            temptable = _from_csv(files, encoding, database.connection,
+                                  processes, types, usecols, **fmtparams)
+            with _TransactionSyncOff(database.connection) as cursor:
+                cursor.execute('CREATE TABLE datatest_cache (key TEXT, table_name TEXT)')
+                cursor.execute('INSERT INTO datatest_cache VALUES (?, ?)',
+                               (key, temptable.name))
+        except Exception:
+            database.close()
+            os.remove(temp_path)  # <- Remove incomplete file.
+            raise
+        database.close()
+
+        try:
+            os.rename(temp_path, path)  # <- Complete files only.
+        except OSError:
+            os.remove(temp_path)  # <- Another process created the file.
+            if not os.path.exists(path):
+                raise
+        _remove_stale_cache_files(cache_dir, prefix, file_state)
+
+    connection = sqlite3.connect(path)
+    try:
+        cursor = connection.execute('SELECT key, table_name FROM datatest_cache')
+        cached_key, table_name = cursor.fetchone()
+    finally:
+        connection.close()
+    if cached_key != key:
+        raise ValueError('cache file {0!r} does not match files'.format(path))
+    return path, table_name
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Streaming XLSX worksheet reader (no third-party libraries)."""
+from __future__ import absolute_import
+import posixpath
+import re
+import zipfile
+from xml.etree import ElementTree
+
+
+_cell_ref_regex = re.compile(r'^([A-Z]+)(\d*)$')
+
+
+def _local_name(tag):
+    """Return *tag* without its XML namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column_index(ref):
+    """Return the zero-based column index of a cell reference like
+    'C7' (returns None if *ref* is not a valid reference).
+    """
+    match = _cell_ref_regex.match(ref or '')
+    if not match:
+        return None
+    index = 0
+    for char in match.group(1):
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index - 1
+
+
+def _get_text(element):
+    """Return the text of a shared or inline string *element* (rich
+    text runs are joined, phonetic runs are ignored).
+    """
+    parts = []
+    for child in element:
+        name = _local_name(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            parts.extend(x.text or '' for x in child
+                         if _local_name(x.tag) == 't')
+    return ''.join(parts)
+
+
+def _get_worksheets(archive):
+    """Return a list of (name, member path) tuples for the worksheets
+    in an open XLSX *archive* (in workbook order).
+    """
+    targets = {}
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels:
+        target = rel.get('Target', '')
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+
+    worksheets = []
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    for element in workbook.iter():
+        if _local_name(element.tag) != 'sheet':
+            continue
+        rel_id = [v for k, v in element.attrib.items() if _local_name(k) == 'id']
+        worksheets.append((element.get('name'), targets.get(rel_id[0] if rel_id else None)))
+    return worksheets
+
+
+def get_worksheet_names(path):
+    """Return a list of worksheet names in the XLSX file at *path*."""
+    with zipfile.ZipFile(path) as archive:
+        return [name for name, _ in _get_worksheets(archive)]
+
+
+class XlsxReader(object):
+    """XlsxReader returns the rows of an XLSX worksheet as lists of
+    values without loading the whole workbook into memory::
+
+        with XlsxReader('mydata.xlsx', 'Sheet 2') as reader:
+            for row in reader:
+                process(row)
+
+    The *worksheet* can be an index (an integer) or a name (a string).
+    Values follow the same conventions as xlrd: numbers are floats,
+    booleans are 1 or 0, and empty cells are empty strings. Dates are
+    returned as their serial numbers and errors as their text (like
+    '#N/A'). Empty rows are included and rows are padded to the width
+    of the worksheet (taken from its dimension or, if it has none,
+    from the first row). Dimensions are not always accurate so cells
+    beyond this width are never dropped: the width grows to include
+    them and later rows are padded to the new width.
+
+    The worksheet XML is parsed incrementally so memory use does not
+    grow with the number of rows (shared strings are kept in memory).
+    """
+    def __init__(self, path, worksheet=0):
+        self.path = path
+        self._archive = zipfile.ZipFile(path)
+        try:
+            worksheets = _get_worksheets(self._archive)
+            if isinstance(worksheet, int):
+                try:
+                    self.name, member = worksheets[worksheet]
+                except IndexError:
+                    raise LookupError('no worksheet at index {0!r}'.format(worksheet))
+            else:
+                members = dict(worksheets)
+                if worksheet not in members:
+                    raise LookupError('no worksheet named {0!r}'.format(worksheet))
+                self.name, member = worksheet, members[worksheet]
+            self._shared_strings = self._read_shared_strings()
+            self._fileobj = self._archive.open(member)
+        except Exception:
+            self._archive.close()
+            raise
+        self._rows = self._iter_rows()
+
+    def _read_shared_strings(self):
+        try:
+            fh = self._archive.open('xl/sharedStrings.xml')
+        except KeyError:
+            return []  # <- EXIT! Workbook has no shared strings.
+
+        strings = []
+        with fh:
+            for _, element in ElementTree.iterparse(fh):
+                if _local_name(element.tag) == 'si':
+                    strings.append(_get_text(element))
+                    element.clear()
+        return strings
+
+    def _get_value(self, cell):
+        cell_type = cell.get('t', 'n')
+        if cell_type == 'inlineStr':
+            for child in cell:
+                if _local_name(child.tag) == 'is':
+                    return _get_text(child)
+            return ''
+
+        value = None
+        for child in cell:
+            if _local_name(child.tag) == 'v':
+                value = child.text
+        if value is None:
+            return ''
+        if cell_type == 's':
+            return self._shared_strings[int(value)]
+        if cell_type == 'b':
+            return int(value)
+        if cell_type in ('str', 'e'):
+            return value
+        return float(value)
+
+    def _iter_rows(self):
+        width = None
+        row_num = 0
+        parent = None
+        for event, element in ElementTree.iterparse(self._fileobj, ('start', 'end')):
+            name = _local_name(element.tag)
+            if event == 'start':
+                if name == 'sheetData':
+                    parent = element
+                elif name == 'dimension':
+                    last_ref = element.get('ref', '').split(':')[-1]
+                    width = (_column_index(last_ref) or 0) + 1
+                continue
+
+            if name != 'row':
+                continue
+
+            values = []
+            for cell in element:
+                if _local_name(cell.tag) != 'c':
+                    continue
+                index = _column_index(cell.get('r'))
+                if index is None:
+                    index = len(values)
+                values.extend([''] * (index - len(values)))
+                values.append(self._get_value(cell))
+            if width is None:
+                width = len(values)  # <- No dimension, use the first row.
+            width = max(width, len(values))
+            values.extend([''] * (width - len(values)))
+
+            row_index = int(element.get('r', row_num + 1))
+            while row_num < row_index - 1:  # <- Fill skipped rows.
+                row_num += 1
+                yield [''] * width
+
+            row_num = row_index
+            parent.clear()  # <- Free parsed rows.
+            yield values
+
+    def close(self):
+        self._rows.close()
+        self._fileobj.close()
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+    def next(self):  # <- For Python 2.
+        return self.__next__()
@@ -2,11 +2,12 @@
 import inspect
 import os
 import sys
-import warnings
 
 from ..utils.builtins import *
 from ..load.csvreader import UnicodeCsvReader
+from ..load.csvreader import _sniff_encoding
 from ..load.sqltemp import TemporarySqliteTable
+from ..load.sqltemp import _warn_encoding_fallback
 
 from .sqlite import SqliteBase
 
@@ -35,25 +36,20 @@ class CsvSource(SqliteBase):
                 columns = next(reader)  # Header row.
                 temptable = TemporarySqliteTable(reader, columns)
         else:
-            try:
-                with UnicodeCsvReader(file, encoding='utf-8', **fmtparams) as reader:
-                    columns = next(reader)  # Header row.
-                    temptable = TemporarySqliteTable(reader, columns)
+            temptable = None
+            if _sniff_encoding(file) != 'iso8859-1':
+                try:
+                    with UnicodeCsvReader(file, encoding='utf-8', **fmtparams) as reader:
+                        columns = next(reader)  # Header row.
+                        temptable = TemporarySqliteTable(reader, columns)
+                except UnicodeDecodeError:
+                    pass  # <- Invalid UTF-8 after the detected prefix.
 
-            except UnicodeDecodeError:
+            if temptable is None:
                 with UnicodeCsvReader(file, encoding='iso8859-1', **fmtparams) as reader:
                     columns = next(reader)  # Header row.
                     temptable = TemporarySqliteTable(reader, columns)
-
-                # Prepare message and raise as warning.
-                try:
-                    filename = os.path.basename(file)
-                except AttributeError:
-                    filename = repr(file)
-                msg = ('\nData in file {0!r} does not appear to be encoded '
-                       'as UTF-8 (used ISO-8859-1 as fallback). To assure '
-                       'correct operation, please specify a text encoding.')
-                warnings.warn(msg.format(filename))
+                _warn_encoding_fallback(file)
 
         # Calling super() with older convention to support Python 2.7 & 2.6.
         super(CsvSource, self).__init__(temptable.connection, temptable.name)
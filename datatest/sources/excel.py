@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import zipfile
 from ..load.sqltemp import TemporarySqliteTable
+from ..load.sqltemp import _from_xlsx
 from .sqlite import SqliteBase
 
 
@@ -14,11 +16,18 @@ class ExcelSource(SqliteBase):
         subject = datatest.ExcelSource('mydata.xlsx', 'Sheet 2')
 
     .. note::
-        This data source is optional---it requires the third-party
-        library `xlrd <https://pypi.python.org/pypi/xlrd>`_.
+        XLSX files are read incrementally. Reading XLS files requires
+        the third-party library `xlrd <https://pypi.python.org/pypi/xlrd>`_.
     """
     def __init__(self, path, worksheet=None, in_memory=False):
         """Initialize self."""
+        self._file_repr = repr(path)
+
+        if zipfile.is_zipfile(path):  # <- XLSX file.
+            temptable = _from_xlsx(path, [worksheet or 0])[0]
+            super(ExcelSource, self).__init__(temptable.connection, temptable.name)
+            return  # <- EXIT!
+
         try:
             import xlrd
         except ImportError:
@@ -29,8 +38,6 @@ class ExcelSource(SqliteBase):
                 "third-party library 'xlrd'."
             )
 
-        self._file_repr = repr(path)
-
         # Open Excel file and get worksheet.
         book = xlrd.open_workbook(path, on_demand=True)
         if worksheet:
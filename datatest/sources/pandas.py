@@ -34,10 +34,11 @@ class PandasSource(BaseSource):
         This data source is optional---it requires the third-party
         library `pandas <https://pypi.python.org/pypi/pandas>`_.
 
-    .. todo::
-        Optimize.  PandasSource is not yet optimized for speed (although
-        it will be in the future).  Testing large DataFrames will be
-        slow---it is faster to use CsvSource or SqliteSource.
+    .. note::
+        PandasSource is not optimized for speed.  Testing large
+        DataFrames will be slow---use :class:`DataFrameSource
+        <datatest.DataFrameSource>` which queries the DataFrame
+        directly using vectorized pandas operations.
     """
     def __init__(self, df):
         """Initialize self."""
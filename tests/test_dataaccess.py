@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from __future__ import division
+import gc
+import gzip
 import os
 import re
+import shutil
 import sqlite3
 import tempfile
 import textwrap
+import time
+import warnings
+import weakref
+import zipfile
+from decimal import Decimal
+from multiprocessing.pool import ThreadPool
 from . import _io as io
 
 from . import _unittest as unittest
 from datatest.utils import collections
 from datatest.utils.misc import _is_nsiterable
 
+from datatest import dataaccess
 from datatest.dataaccess import working_directory
 from datatest.dataaccess import BaseElement
 from datatest.dataaccess import _is_collection_of_items
@@ -22,17 +32,50 @@ from datatest.dataaccess import _filter_data
 from datatest.dataaccess import _reduce_data
 from datatest.dataaccess import _apply_data
 from datatest.dataaccess import _apply_to_data  # <- TODO: Change function name.
+from datatest.dataaccess import _translate_function
 from datatest.dataaccess import _sqlite_sum
 from datatest.dataaccess import _sqlite_count
 from datatest.dataaccess import _sqlite_avg
 from datatest.dataaccess import _sqlite_min
 from datatest.dataaccess import _sqlite_max
 from datatest.dataaccess import _sqlite_distinct
+from datatest.dataaccess import _sqlite_median
+from datatest.dataaccess import _sqlite_percentile
+from datatest.dataaccess import _sqlite_variance
+from datatest.dataaccess import _sqlite_stddev
+from datatest.dataaccess import _HyperLogLog
+from datatest.dataaccess import _QuantileSketch
+from datatest.dataaccess import _sqlite_approx_count_distinct
+from datatest.dataaccess import _sqlite_approx_quantile
+from datatest.dataaccess import _RowSample
+from datatest.dataaccess import _sample_data
 from datatest.dataaccess import _normalize_select
 from datatest.dataaccess import _parse_select
 from datatest.dataaccess import RESULT_TOKEN
 from datatest.dataaccess import DataQuery
 from datatest.dataaccess import DataSource
+from datatest.dataaccess import DataFrameSource
+from datatest.dataaccess import afetch_many
+from datatest.load.sqltemp import TemporaryDatabase
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+from datatest.dataaccess import between
+from datatest.dataaccess import gt
+from datatest.dataaccess import ge
+from datatest.dataaccess import lt
+from datatest.dataaccess import le
+from datatest.dataaccess import not_in
+from datatest.dataaccess import is_null
+from datatest.dataaccess import not_null
+from datatest.dataaccess import regex
 
 
 class TestWorkingDirectory(unittest.TestCase):
@@ -237,6 +280,52 @@ class TestMapData(unittest.TestCase):
         self.assertEqual(result.fetch(), [0.5, 0.25, 0.125])
 
 
+    def test_parallel(self):
+        pool = ThreadPool(2)
+        try:
+            iterable = DataResult({'a': [1, 2], 'b': set([3]), 'c': 4}, dict)
+            function = lambda x: x * 2
+            result = _map_data(function, iterable, executor=pool)
+            self.assertIsInstance(result, DataResult)
+            self.assertEqual(result.evaluation_type, dict)
+            self.assertEqual(result.fetch(), {'a': [2, 4], 'b': [6], 'c': 8})
+
+            iterable = DataResult([(1, 2), (1, 4), (1, 8)], list)
+            function = lambda x, y: x / y  # <- function takes 2 args
+            result = _map_data(function, iterable, executor=pool)
+            self.assertEqual(result.fetch(), [0.5, 0.25, 0.125])
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_parallel_executor_workers(self):
+        class Executor(object):  # <- Only has a map() method.
+            def __init__(self):
+                self.chunks = []
+            def map(self, function, chunks):
+                chunks = list(chunks)
+                self.chunks.append(len(chunks))
+                return [function(x) for x in chunks]
+
+        executor = Executor()
+        iterable = DataResult(list(range(24)), list)
+        result = _map_data(lambda x: x * 2, iterable, workers=3, executor=executor)
+        self.assertEqual(result.fetch(), [x * 2 for x in range(24)])
+        self.assertEqual(executor.chunks, [12])  # <- About four per worker.
+
+        iterable = DataResult(list(range(24)), list)
+        result = _map_data(lambda x: x * 2, iterable, executor=executor)
+        self.assertEqual(result.fetch(), [x * 2 for x in range(24)])
+
+    def test_parallel_workers(self):
+        items = [(str(x), [str(x), str(x + 1)]) for x in range(20)]
+        iterable = DataResult(DictItems(items), dict)
+        result = _map_data(int, iterable, workers=2)
+
+        result = [(k, v.fetch()) for k, v in result]  # <- Order is preserved.
+        expected = [(str(x), [x, x + 1]) for x in range(20)]
+        self.assertEqual(result, expected)
+
 class TestFilterData(unittest.TestCase):
     def test_list_iter(self):
         iterable = DataResult([-4, -1, 2, 3], list)
@@ -345,6 +434,27 @@ class TestGroupwiseApply(unittest.TestCase):
         self.assertEqual(result.fetch(), {'a': 4, 'b': 6})
 
 
+    def test_parallel(self):
+        pool = ThreadPool(2)
+        try:
+            iterable = DataResult({'a': iter([1, 2]), 'b': (3, 4)}, dict)
+            function = lambda itr: [x * 2 for x in itr]
+            result = _apply_data(function, iterable, executor=pool)
+            self.assertIsInstance(result, DataResult)
+            self.assertEqual(result.evaluation_type, dict)
+            self.assertEqual(result.fetch(), {'a': [2, 4], 'b': [6, 8]})
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_parallel_workers(self):
+        items = [(str(x), [x, x + 1]) for x in range(20)]
+        iterable = DataResult(DictItems(items), dict)
+        result = _apply_data(sum, iterable, workers=2)
+
+        expected = [(str(x), x + x + 1) for x in range(20)]
+        self.assertEqual(list(result), expected)  # <- Order is preserved.
+
 class TestSumData(unittest.TestCase):
     def test_list_iter(self):
         iterable = DataResult([1, 2, 3], list)
@@ -355,6 +465,15 @@ class TestSumData(unittest.TestCase):
         result = _sqlite_sum(3)
         self.assertEqual(result, 3)
 
+    def test_result_type(self):
+        """Like SQLite, integers should sum to an integer."""
+        result = _sqlite_sum(DataResult([1, 2, None], list))
+        self.assertIsInstance(result, int)
+
+        result = _sqlite_sum(DataResult([1, 2.5, '3'], list))
+        self.assertIsInstance(result, float)
+        self.assertEqual(result, 6.5)
+
     def test_single_string(self):
         result = _sqlite_sum('abc')
         self.assertEqual(result, 0.0)
@@ -511,6 +630,80 @@ class TestMaxData(unittest.TestCase):
         self.assertEqual(result.fetch(), {'a': 2, 'b': 3, 'c': None})
 
 
+
+class TestDistributionData(unittest.TestCase):
+    def test_median(self):
+        self.assertEqual(_sqlite_median([3, 1, 2]), 2)
+        self.assertEqual(_sqlite_median([4, 1, 3, 2]), 2.5)
+        self.assertEqual(_sqlite_median(['3', None, '1']), 2)
+        self.assertIsNone(_sqlite_median([None]))
+        self.assertEqual(_sqlite_median(5), 5)
+
+    def test_percentile(self):
+        self.assertEqual(_sqlite_percentile([1, 2, 3, 4, 5], 0), 1)
+        self.assertEqual(_sqlite_percentile([1, 2, 3, 4, 5], 100), 5)
+        self.assertEqual(_sqlite_percentile([1, 2, 3, 4, 5], 25), 2)
+        self.assertEqual(_sqlite_percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertIsNone(_sqlite_percentile([], 50))
+
+    def test_variance_and_stddev(self):
+        self.assertEqual(_sqlite_variance([2, 4, 4, 4, 5, 5, 7, 9]), 32 / 7)
+        self.assertAlmostEqual(_sqlite_stddev([1, 2, 3, 4]), 1.2909944487)
+        self.assertIsNone(_sqlite_variance([1, None]))
+        self.assertIsNone(_sqlite_stddev([]))
+
+    def test_dict_iter_of_lists(self):
+        iterable = DataResult({'a': [1, 2, 6], 'b': [3, 4]}, dict)
+        result = _apply_to_data(_sqlite_median, iterable)
+        self.assertEqual(result.fetch(), {'a': 2, 'b': 3.5})
+
+
+class TestApproximateData(unittest.TestCase):
+    def test_approx_count_distinct(self):
+        self.assertEqual(_sqlite_approx_count_distinct([1, 2, 2, None, 3]), 3)
+        self.assertEqual(_sqlite_approx_count_distinct([1, 1.0, '1']), 2)
+        self.assertEqual(_sqlite_approx_count_distinct([]), 0)
+        self.assertEqual(_sqlite_approx_count_distinct('a'), 1)
+
+        estimate = _sqlite_approx_count_distinct(range(20000), precision=12)
+        self.assertLess(abs(estimate - 20000), 20000 * 0.05)
+
+    def test_hyperloglog_merge(self):
+        sketch1 = _HyperLogLog(12)
+        sketch2 = _HyperLogLog(12)
+        for x in range(6000):
+            sketch1.add(x)
+        for x in range(3000, 9000):
+            sketch2.add(x)
+        estimate = sketch1.merge(sketch2).count()
+        self.assertLess(abs(estimate - 9000), 9000 * 0.05)
+
+        with self.assertRaises(ValueError):
+            sketch1.merge(_HyperLogLog(10))
+
+    def test_approx_quantile(self):
+        self.assertEqual(_sqlite_approx_quantile([3, 1, None, 2], 0.5), 2)
+        self.assertEqual(_sqlite_approx_quantile([3, 1, 2], 0), 1)
+        self.assertEqual(_sqlite_approx_quantile([3, 1, 2], 1), 3)
+        self.assertIsNone(_sqlite_approx_quantile([None], 0.5))
+
+        values = list(range(10000))
+        estimate = _sqlite_approx_quantile(values, 0.25, k=200)
+        self.assertLess(abs(estimate - 2500), 10000 * 0.02)
+
+    def test_quantile_sketch_merge(self):
+        sketch1 = _QuantileSketch(100)
+        sketch2 = _QuantileSketch(100)
+        for x in range(5000):
+            sketch1.add(x)
+            sketch2.add(x + 5000)
+        sketch1.merge(sketch2)
+        self.assertEqual(sketch1.count, 10000)
+        self.assertLess(abs(sketch1.quantile(0.5) - 5000), 10000 * 0.04)
+
+        with self.assertRaises(ValueError):
+            sketch1.merge(_QuantileSketch(200))
+
 class TestDistinctData(unittest.TestCase):
     def test_list_iter(self):
         iterable = DataResult([1, 2, 1, 2, 3], list)
@@ -538,6 +731,39 @@ class TestDistinctData(unittest.TestCase):
         self.assertEqual(result.fetch(), {'a': 2, 'b': 3})
 
 
+class TestSampleData(unittest.TestCase):
+    def test_list_iter(self):
+        iterable = DataResult(list(range(100)), list)
+        result = _sample_data(_RowSample(n=5, seed=1), iterable).fetch()
+        self.assertEqual(len(result), 5)
+
+        iterable = DataResult(list(range(100)), list)
+        again = _sample_data(_RowSample(n=5, seed=1), iterable).fetch()
+        self.assertEqual(result, again, msg='same seed, same sample')
+
+        result = _sample_data(_RowSample(n=5, seed=1), DataResult([1, 2, 3], list))
+        self.assertEqual(result.fetch(), [1, 2, 3])
+
+    def test_fraction(self):
+        iterable = DataResult(list(range(1000)), list)
+        result = _sample_data(_RowSample(fraction=0.1), iterable).fetch()
+        self.assertTrue(50 < len(result) < 150)
+        self.assertEqual(result, sorted(result), msg='order is preserved')
+
+    def test_dataiter_dict_of_containers(self):
+        iterable = DataResult({'a': [1, 2, 3, 4], 'b': set([5, 6, 7])}, dict)
+        result = _sample_data(_RowSample(n=2), iterable)
+        self.assertEqual(result.evaluation_type, dict)
+
+        result = result.fetch()
+        self.assertEqual(len(result['a']), 2)
+        self.assertIsInstance(result['b'], set)
+        self.assertEqual(len(result['b']), 2)
+
+    def test_single_int(self):
+        self.assertEqual(_sample_data(_RowSample(n=2), 3), 3)
+
+
 class Test_select_functions(unittest.TestCase):
     def test_normalize_select(self):
         no_change = 'no change for valid containers'
@@ -782,6 +1008,16 @@ class TestDataQuery(unittest.TestCase):
         result = query2(source)
         self.assertEqual(result.fetch(), [2, 2])
 
+    def test_map_parallel(self):
+        query = DataQuery({'col1': 'col2'}).map(int, workers=2)
+        self.assertEqual(query._query_steps[-1], ('map', (int,), {'workers': 2}))
+
+        source = DataSource([('a', '2'), ('b', '3')], fieldnames=['col1', 'col2'])
+        self.assertEqual(query(source).fetch(), {'a': [2], 'b': [3]})
+
+        query = DataQuery({'col1': 'col2'}).apply(sorted, workers=2)
+        self.assertEqual(query(source).fetch(), {'a': ['2'], 'b': ['3']})
+
     def test_filter(self):
         query1 = DataQuery(['col1'])
         query2 = query1.filter(lambda x: x == 'a')
@@ -848,6 +1084,71 @@ class TestDataQuery(unittest.TestCase):
         )
         self.assertEqual(optimized, expected)
 
+    def test_optimize_compiled_steps(self):
+        """
+        Unoptimized:
+            DataSource._select({'col1': ['values']}).filter(isodd).map(double).sum()
+
+        Optimized:
+            DataSource._select_compiled(
+                (('filter', isodd), ('map', double), ('aggregate', 'SUM')),
+                {'col1': ['values']},
+            )
+        """
+        isodd = lambda x: x % 2 == 1
+        double = lambda x: x * 2
+        unoptimized = (
+            (getattr, (RESULT_TOKEN, '_select'), {}),
+            (RESULT_TOKEN, ({'col1': ['values']},), {}),
+            (_filter_data, (isodd, RESULT_TOKEN,), {}),
+            (_map_data, (double, RESULT_TOKEN,), {}),
+            (_apply_to_data, (_sqlite_sum, RESULT_TOKEN,), {}),
+        )
+        optimized = DataQuery._optimize(unoptimized)
+
+        expected = (
+            (getattr, (RESULT_TOKEN, '_select_compiled'), {}),
+            (RESULT_TOKEN, ((('filter', isodd), ('map', double), ('aggregate', 'SUM')),
+                            {'col1': ['values']},), {}),
+        )
+        self.assertEqual(optimized, expected)
+
+    def test_optimize_compiled_steps_partial(self):
+        isodd = lambda x: x % 2 == 1
+        double = lambda x: x * 2
+
+        # Leading filter is compiled, map is left for Python.
+        unoptimized = (
+            (getattr, (RESULT_TOKEN, '_select'), {}),
+            (RESULT_TOKEN, (['values'],), {}),
+            (_filter_data, (isodd, RESULT_TOKEN,), {}),
+            (_map_data, (double, RESULT_TOKEN,), {}),
+        )
+        optimized = DataQuery._optimize(unoptimized)
+        expected = (
+            (getattr, (RESULT_TOKEN, '_select_compiled'), {}),
+            (RESULT_TOKEN, ((('filter', isodd),), ['values'],), {}),
+            (_map_data, (double, RESULT_TOKEN,), {}),
+        )
+        self.assertEqual(optimized, expected)
+
+        # Grouped filters without an aggregate are not compiled.
+        unoptimized = (
+            (getattr, (RESULT_TOKEN, '_select'), {}),
+            (RESULT_TOKEN, ({'col1': ['values']},), {}),
+            (_filter_data, (isodd, RESULT_TOKEN,), {}),
+        )
+        self.assertIsNone(DataQuery._optimize(unoptimized))
+
+        # Multi-column selections are not compiled.
+        unoptimized = (
+            (getattr, (RESULT_TOKEN, '_select'), {}),
+            (RESULT_TOKEN, ([('values', 'values')],), {}),
+            (_map_data, (double, RESULT_TOKEN,), {}),
+            (_apply_to_data, (_sqlite_sum, RESULT_TOKEN,), {}),
+        )
+        self.assertIsNone(DataQuery._optimize(unoptimized))
+
     def test_explain(self):
         query = DataQuery(['col1'])
         expected = """
@@ -886,6 +1187,44 @@ class TestDataQuery(unittest.TestCase):
         returned_value = query._explain(file=None)
         self.assertEqual(returned_value, expected)
 
+    def test_explain_analyze(self):
+        source = DataSource([('a', '1'), ('a', '2'), ('b', '3')], ['A', 'B'])
+        query = source({'A': 'B'}).sum()
+        analysis = query._explain(file=None, analyze=True)
+
+        self.assertIn('time: ', analysis)
+        self.assertIn('rows: 2', analysis)
+        self.assertIn('sql: SELECT "A", SUM("B") FROM tbl', analysis)
+        self.assertIn('<- full scan', analysis)
+        self.assertIn('<- temp b-tree', analysis)
+        self.assertIn('Total Time:', analysis)
+
+        source.create_index('A')
+        analysis = query._explain(file=None, analyze=True)
+        self.assertNotIn('<- full scan', analysis)
+        self.assertNotIn('<- temp b-tree', analysis)
+
+        # Non-SQL steps are timed, too.
+        query = source('B').map(int).filter(lambda x: x > 1)
+        analysis = query._explain(file=None, optimize=False, analyze=True)
+        self.assertEqual(analysis.count('time: '), 4)
+        self.assertIn('rows: 3', analysis)
+        self.assertIn('rows: 2', analysis)
+
+        with self.assertRaises(ValueError):
+            DataQuery('B')._explain(file=None, analyze=True)
+
+    def test_explain_analyze_object(self):
+        query = DataQuery.from_object([1, 2, 3]).map(lambda x: x * 2)
+        analysis = query.explain(file=None, analyze=True)
+        self.assertIn('time: ', analysis)
+        self.assertIn('rows: 3', analysis)
+        self.assertNotIn('sql: ', analysis)
+
+        source = DataSource([('a', '1'), ('b', '2')], ['A', 'B'])
+        analysis = source('B').map(int).sum().explain(file=None, analyze=True)
+        self.assertIn('sql: ', analysis)
+
     def test_repr(self):
         # Check "select-only" signature.
         query = DataQuery(['label1'])
@@ -932,6 +1271,73 @@ class TestDataQuery(unittest.TestCase):
         regex = r"DataQuery\(\[u?'label1'\]\).map\(<lambda>\)"
         self.assertRegex(repr(query), regex)
 
+        # Check query steps with keyword arguments only.
+        query = DataQuery(['label1']).sample(n=5)
+        regex = r"DataQuery\(\[u?'label1'\]\).sample\(n=5, seed=0\)"
+        self.assertRegex(repr(query), regex)
+
+    def test_sample_arguments(self):
+        query = DataQuery(['label1'])
+        with self.assertRaises(TypeError):
+            query.sample()
+
+        with self.assertRaises(TypeError):
+            query.sample(n=5, fraction=0.5)
+
+        with self.assertRaises(ValueError):
+            query.sample(n=0)
+
+        with self.assertRaises(ValueError):
+            query.sample(fraction=1.5)
+
+
+class TestWherePredicates(unittest.TestCase):
+    def test_call(self):
+        self.assertTrue(between(1, 3)(3))
+        self.assertFalse(between(1, 3)(4))
+        self.assertFalse(between(1, 3)(None))
+        self.assertTrue(gt(1)(2))
+        self.assertTrue(ge(2)(2))
+        self.assertTrue(lt(3)(2))
+        self.assertTrue(le(2)(2))
+        self.assertTrue(not_in(['a', 'b'])('c'))
+        self.assertFalse(not_in(['a', 'b'])('a'))
+        self.assertTrue(is_null()(None))
+        self.assertTrue(not_null()(''))
+        self.assertTrue(regex('^a')('abc'))
+        self.assertFalse(regex('^a')('cba'))
+
+        # Non-string values are converted with str(), None never matches.
+        self.assertTrue(regex('^1')(101))
+        self.assertFalse(regex('^2')(101))
+        self.assertFalse(regex('.*')(None))
+
+    def test_call_mixed_types(self):
+        """Values of different types should compare like SQLite."""
+        values = [None, 1, 2.5, 'a', 'b', b'x']
+        connection = sqlite3.connect(':memory:')
+        for predicate in [gt(2), le('a'), between(2, 'a'), lt(b'x'), ge('b')]:
+            sql, params = predicate.sql('?')
+            expected = [x for x in values if connection.execute(
+                'SELECT ' + sql, [x] + params).fetchone()[0]]
+            self.assertEqual([x for x in values if predicate(x)], expected)
+        connection.close()
+
+    def test_sql(self):
+        self.assertEqual(between(1, 3).sql('A'), ('A BETWEEN ? AND ?', [1, 3]))
+        self.assertEqual(not_in([1, 2]).sql('A'), ('A NOT IN (?, ?)', [1, 2]))
+        self.assertEqual(not_null().sql('A'), ('A IS NOT NULL', []))
+
+    def test_equality(self):
+        self.assertEqual(between(1, 3), between(1, 3))
+        self.assertNotEqual(between(1, 3), between(1, 4))
+        self.assertEqual(hash(gt(1)), hash(gt(1)))
+        self.assertEqual(regex(re.compile('a', re.I)), regex('a', re.I))
+
+    def test_repr(self):
+        self.assertEqual(repr(between(1, 3)), 'between(1, 3)')
+        self.assertEqual(repr(is_null()), 'is_null()')
+
 
 class TestDataSourceConstructors(unittest.TestCase):
     @staticmethod
@@ -1022,6 +1428,265 @@ class TestDataSourceConstructors(unittest.TestCase):
                     ('', '4', 'j'), ('', '5', 'k'), ('', '6', 'l')]
         self.assertEqual(set(table_contents), set(expected))
 
+    def test_from_csv_cache_dir(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        cache_dir = os.path.join(temporary_dir, 'cache')
+        csv_path = os.path.join(temporary_dir, 'data.csv')
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B\nx,1\ny,2\n')
+
+        source = DataSource.from_csv(csv_path, cache_dir=cache_dir)
+        self.assertEqual(self.get_table_contents(source), [('x', '1'), ('y', '2')])
+        cache_files = os.listdir(cache_dir)
+        self.assertEqual(len(cache_files), 1)
+
+        # Loading the same file again should reuse the cache (queried
+        # in place, without copying rows).
+        source = DataSource.from_csv(csv_path, cache_dir=cache_dir)
+        self.assertEqual(self.get_table_contents(source), [('x', '1'), ('y', '2')])
+        self.assertEqual(os.listdir(cache_dir), cache_files)
+        cursor = source._connection.execute('SELECT name FROM main.sqlite_master')
+        self.assertEqual(cursor.fetchall(), [])
+
+        # Queries, indexes, and statistics should not modify the cache
+        # file (the table is copied before it is indexed).
+        cache_path = os.path.join(cache_dir, cache_files[0])
+        source.in_table_threshold = 1
+        self.assertEqual(source('A', A=['x', 'y']).fetch(), ['x', 'y'])
+        source.create_index('A')
+        self.assertTrue(source._is_indexed(['A']))
+        self.assertEqual(source('A', B='2').fetch(), ['y'])
+        source.analyze()
+        connection = sqlite3.connect(cache_path)
+        cursor = connection.execute("SELECT type, name FROM sqlite_master")
+        self.assertEqual(len(cursor.fetchall()), 2)  # <- Data and cache key tables.
+        connection.close()
+
+        # Different fmtparams should use a separate cache file.
+        source = DataSource.from_csv(csv_path, cache_dir=cache_dir, delimiter='|')
+        self.assertEqual(self.get_table_contents(source), [('x,1',), ('y,2',)])
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+        # A changed file should not use the old cache.
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B\nx,1\ny,2\nz,3\n')
+        source = DataSource.from_csv(csv_path, cache_dir=cache_dir)
+        self.assertEqual(self.get_table_contents(source), [('x', '1'), ('y', '2'), ('z', '3')])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)  # <- Stale files removed.
+
+        # A failed load should not leave an incomplete file.
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B\nx,1\ny,2\nz,3\nw\xff,4\n')
+        with self.assertRaises(UnicodeDecodeError):
+            DataSource.from_csv(csv_path, cache_dir=cache_dir, encoding='ascii')
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_from_csv_processes(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        csv_path = os.path.join(temporary_dir, 'data.csv')
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B\nx,"1\n2"\ny,3\n')
+
+        source = DataSource.from_csv(csv_path, processes=2)
+        self.assertEqual(self.get_table_contents(source), [('x', '1\n2'), ('y', '3')])
+
+    def test_from_csv_types(self):
+        csv_file = self._get_filelike(b'A,B,C,D\n'
+                                      b'x,1,1.5,00501\n'
+                                      b'y,,2,00502\n', encoding='utf-8')
+        source = DataSource.from_csv(csv_file, types='infer')
+        table_contents = self.get_table_contents(source)
+        self.assertEqual(table_contents, [('x', 1, 1.5, '00501'), ('y', None, 2.0, '00502')])
+        self.assertIsInstance(source('B').sum().fetch(), int)
+
+        csv_file = self._get_filelike(b'A,B\n'
+                                      b'x,1\n'
+                                      b'y,abc\n', encoding='utf-8')
+        source = DataSource.from_csv(csv_file, types={'B': int})
+        table_contents = self.get_table_contents(source)
+        self.assertEqual(table_contents, [('x', 1), ('y', 'abc')])  # <- Text is kept.
+
+    def test_from_csv_usecols(self):
+        csv_file = self._get_filelike(b'A,B,C\n'
+                                      b'x,1,j\n'
+                                      b'y,2,k\n', encoding='utf-8')
+        source = DataSource.from_csv(csv_file, usecols=['C', 'A'])
+        self.assertEqual(source.fieldnames, ('C', 'A'))
+        self.assertEqual(self.get_table_contents(source), [('j', 'x'), ('k', 'y')])
+
+        csv_file = self._get_filelike(b'A,B\nx,1\n', encoding='utf-8')
+        with self.assertRaises(LookupError):
+            DataSource.from_csv(csv_file, usecols=['D'])
+
+    def test_from_csv_compressed(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+
+        gzip_path = os.path.join(temporary_dir, 'data.csv.gz')
+        with gzip.GzipFile(gzip_path, 'wb') as fh:
+            fh.write(b'A,B\nx,1\ny,2\n')
+        source = DataSource.from_csv(gzip_path)
+        self.assertEqual(self.get_table_contents(source), [('x', '1'), ('y', '2')])
+
+        zip_path = os.path.join(temporary_dir, 'data.zip')
+        with zipfile.ZipFile(zip_path, 'w') as archive:
+            archive.writestr('data1.csv', b'A,B\nx,1\n')
+            archive.writestr('data2.csv', b'B,C\n2,j\n')
+        source = DataSource.from_csv(zip_path)
+        self.assertEqual(self.get_table_contents(source), [('x', '1', ''), ('', '2', 'j')])
+
+    def test_from_excel(self):
+        path = os.path.join(os.path.dirname(__file__), 'test_sources_excel.xlsx')
+        source = DataSource.from_excel(path)
+        self.assertEqual(source.fieldnames, ('label1', 'label2', 'value'))
+        self.assertEqual(source('value').sum().fetch(), 135)
+
+        source = DataSource.from_excel(path, 'count_data', usecols=['value'])
+        self.assertEqual(source.fieldnames, ('value',))
+        self.assertEqual(source('value').sum().fetch(), 146)
+
+        source = DataSource.from_excel(path, lazy=True)
+        self.assertEqual(source.fieldnames, ('label1', 'label2', 'value'))
+        self.assertEqual(source('value').sum().fetch(), 135)
+
+    def test_from_excel_worksheets(self):
+        path = os.path.join(os.path.dirname(__file__), 'test_sources_excel.xlsx')
+        for processes in [1, 2]:
+            source1, source2 = DataSource.from_excel(path, [0, 'count_data'],
+                                                     processes=processes)
+            self.assertEqual(source1('value').sum().fetch(), 135)
+            self.assertEqual(source2('value').sum().fetch(), 146)
+            self.assertIs(source1._database, source2._database)
+
+    def _make_sqlite_file(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        path = os.path.join(temporary_dir, 'data.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE "my table" (label, value)')
+        connection.execute('CREATE INDEX idx_label ON "my table" (label)')
+        connection.executemany('INSERT INTO "my table" VALUES (?, ?)',
+                               [('a', 17), ('a', 13), ('b', 5)])
+        connection.commit()
+        self.addCleanup(connection.close)
+        return path, connection
+
+    @unittest.skipIf(TemporaryDatabase().uri is None, 'requires named in-memory databases')
+    def test_from_sqlite(self):
+        path, connection = self._make_sqlite_file()
+
+        source = DataSource.from_sqlite(path, 'my table')
+        self.assertEqual(source.fieldnames, ('label', 'value'))
+        self.assertEqual(source({'label': 'value'}).sum().fetch(), {'a': 30, 'b': 5})
+        self.assertEqual(repr(source), 'DataSource.from_sqlite({0!r}, {1!r})'.format(path, 'my table'))
+        self.assertTrue(source._is_indexed(['label']), msg='should see existing index')
+        source.analyze()
+        self.assertEqual(source.column_stats('value').max, 17)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            source.create_index('value')  # <- File is read-only.
+
+        worker = source._get_worker()
+        self.assertEqual(worker('value').sum().fetch(), 35)
+        source._release_worker(worker)
+
+        source = DataSource.from_sqlite(connection, 'my table', mmap_size=65536)
+        self.assertEqual(source('value').sum().fetch(), 35)
+
+        with self.assertRaises(ValueError):
+            DataSource.from_sqlite(sqlite3.connect(':memory:'), 'my table')
+
+    @unittest.skipIf(TemporaryDatabase().uri is None, 'requires named in-memory databases')
+    def test_from_sqlite_query(self):
+        path, _ = self._make_sqlite_file()
+        query = 'SELECT label, value * 2 AS doubled FROM "my table" WHERE value > 10'
+
+        source = DataSource.from_sqlite(path, query)
+        self.assertEqual(source.fieldnames, ('label', 'doubled'))
+        self.assertEqual(source('doubled').sum().fetch(), 60)
+        self.assertFalse(source._is_indexed(['label']))
+
+        other = DataSource([('a', 'x')], ['label', 'other'], database=source)
+        other.analyze()  # <- Should not write to the attached file.
+        self.assertEqual(other('other').fetch(), ['x'])
+
+    def test_from_csv_cache_dir_errors(self):
+        csv_file = self._get_filelike(b'A,B\nx,1\n', encoding='utf-8')
+        with self.assertRaises(ValueError):
+            DataSource.from_csv(csv_file, cache_dir='cache')  # <- Not a path.
+
+        with self.assertRaises(ValueError):
+            DataSource.from_csv('data.csv', cache_dir='cache', database=DataSource([('x',)], ['A']))
+
+
+def _fetch(result):
+    if isinstance(result, DataResult):
+        return result.fetch()
+    return result
+
+
+@unittest.skipIf(asyncio is None, 'requires asyncio')
+class TestAsyncFetch(unittest.TestCase):
+    def setUp(self):
+        data = [['a', 'x', '17'],
+                ['a', 'y', '13'],
+                ['b', 'z', '5']]
+        self.source = DataSource(data, ['label1', 'label2', 'value'])
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_afetch(self):
+        query = self.source({'label1': 'value'}).map(int).sum()
+        result = self.loop.run_until_complete(query.afetch())
+        self.assertEqual(result, {'a': 30, 'b': 5})
+
+        readers = self.source._database._readers
+        self.assertEqual(len(readers), 1)
+        self.assertIsNot(readers[0], self.source._connection)
+
+    def test_afetch_lazy(self):
+        data = [['a', 'x', '17'], ['a', 'y', '13'], ['b', 'z', '5']]
+        source = DataSource(data, ['label1', 'label2', 'value'], lazy=True)
+        query = source({'label1': 'value'}).map(int).sum()
+        result = self.loop.run_until_complete(query.afetch())
+        self.assertEqual(result, {'a': 30, 'b': 5})
+
+        queries = [source('label2').distinct(), source('value').count()]
+        results = self.loop.run_until_complete(afetch_many(queries))
+        self.assertEqual(results, [['x', 'y', 'z'], 3])
+
+    def test_afetch_non_datasource(self):
+        query = DataQuery.from_object([1, 2, 3]).sum()
+        result = self.loop.run_until_complete(query.afetch())
+        self.assertEqual(result, 6)
+
+    def test_afetch_errors(self):
+        with self.assertRaises(ValueError):
+            DataQuery('label1').afetch()  # <- No data source.
+
+        query = self.source('value').map(lambda x: 1 / 0).sum()
+        with self.assertRaises(ZeroDivisionError):
+            self.loop.run_until_complete(query.afetch())
+
+    def test_afetch_many(self):
+        queries = [
+            self.source('label1').distinct(),
+            self.source({'label1': 'value'}).count(),
+            self.source('value', label1='a').map(int).filter(lambda x: x > 15),
+            self.source('label2').sample(n=2),
+        ]
+        expected = [query.fetch() for query in queries]
+        results = self.loop.run_until_complete(afetch_many(queries, max_workers=2))
+        self.assertEqual(results, expected)
+        self.assertLessEqual(len(self.source._database._readers), 2)
+
 
 class TestDataSource(unittest.TestCase):
     def setUp(self):
@@ -1047,6 +1712,29 @@ class TestDataSource(unittest.TestCase):
         regex = r"DataSource\(<list of records>, fieldnames=\(u?'A', u?'B'\)\)"
         self.assertRegex(repr(source), regex)
 
+    def test_database(self):
+        data = [['x', 100], ['y', 200]]
+        source1 = DataSource(data, ['A', 'B'])
+        source2 = DataSource(data, ['A', 'B'])
+        self.assertIsNot(source1._connection, source2._connection)
+
+        source3 = DataSource(data, ['A', 'B'], database=source1)  # <- Co-locate.
+        self.assertIs(source3._connection, source1._connection)
+        self.assertNotEqual(source3._table, source1._table)
+        self.assertEqual(source3('A').fetch(), ['x', 'y'])
+
+        with self.assertRaises(TypeError):
+            DataSource(data, ['A', 'B'], database='foo')
+
+    def test_pragmas(self):
+        class MySource(DataSource):
+            pragmas = {'cache_size': -8192, 'temp_store': 'MEMORY'}
+
+        source = MySource([['x', 100]], ['A', 'B'])
+        cursor = source._connection.cursor()
+        self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone(), (-8192,))
+        self.assertEqual(cursor.execute('PRAGMA temp_store').fetchone(), (2,))
+
     def test_build_where_clause(self):
         _build_where_clause = DataSource._build_where_clause
 
@@ -1058,11 +1746,80 @@ class TestDataSource(unittest.TestCase):
         expected = ('A IN (?, ?)', ['x', 'y'])
         self.assertEqual(result, expected)
 
-        userfunc = lambda x: len(x) == 1
+        def userfunc(x):
+            return len(x) == 1
         result = _build_where_clause({'A': userfunc})
         expected = ('FUNC{0}(A)'.format(id(userfunc)), [])
         self.assertEqual(result, expected)
 
+        userfunc = lambda x: len(x) == 1  # <- Translated into SQL.
+        result = _build_where_clause({'A': userfunc})
+        expected = ("CASE WHEN typeof(A) = 'text' THEN (length(A) = 1) "
+                    "ELSE FUNC{0}(A) END".format(id(userfunc)), [])
+        self.assertEqual(result, expected)
+
+        result = _build_where_clause({'A': between(1, 5), 'B': not_in(['x'])})
+        expected = ('A BETWEEN ? AND ? AND B NOT IN (?)', [1, 5, 'x'])
+        self.assertEqual(result, expected)
+
+        result = _build_where_clause({'A': gt(1), 'B': is_null()})
+        expected = ('A > ? AND B IS NULL', [1])
+        self.assertEqual(result, expected)
+
+        result = _build_where_clause({'A': re.compile('^x')})
+        expected = ('A REGEXP ?', ['^x'])
+        self.assertEqual(result, expected)
+
+        result = _build_where_clause({'A': regex('^x', re.IGNORECASE)})
+        expected = ('A REGEXP ?', ['(?i)^x'])
+        self.assertEqual(result, expected)
+
+    def test_translate_function(self):
+        userfunc = lambda x: x > 4
+        self.assertEqual(_translate_function(userfunc, '"A"', 'FALLBACK'),
+                         "CASE WHEN typeof(\"A\") IN ('integer', 'real') "
+                         "THEN (\"A\" > 4) ELSE FALLBACK END")
+
+        # Expressions are not translated (they would be evaluated
+        # once for each time they appear in the translation).
+        self.assertIsNone(_translate_function(userfunc, 'FUNC1("A")', 'FALLBACK'))
+        self.assertIsNone(_translate_function(userfunc, '("A" * 2)', 'FALLBACK'))
+
+        # Translated filters over mapped values refer to the computed
+        # value so the map function is still called once per row.
+        source = DataSource([(x,) for x in range(10)], ['A'])
+        calls = []
+        def func(x):
+            calls.append(x)
+            return x
+        query = source('A').map(func).filter(lambda x: x > 2 and x < 8)
+        query = query.filter(lambda x: x != 5).count()
+        self.assertEqual(query.fetch(), 4)
+        self.assertEqual(len(calls), 10)
+
+    def test_translate_function_integer_overflow(self):
+        # Integer arithmetic falls back to the function if the result
+        # overflows (SQLite would return an inexact REAL).
+        userfunc = lambda x: x * 4
+        self.assertEqual(
+            _translate_function(userfunc, '"A"', 'FALLBACK', 'map'),
+            "CASE WHEN typeof(\"A\") IN ('integer', 'real') AND "
+            "(typeof(\"A\") != 'integer' OR typeof((\"A\" * 4)) = 'integer') "
+            "THEN (\"A\" * 4) ELSE FALLBACK END")
+
+        source = DataSource([[2 ** 62], [1]], ['N'])
+        query = source('N').map(lambda x: x * 4).sum()
+        self.assertEqual(query.fetch(), 2 ** 64 + 4)
+
+        query = source('N').filter(lambda x: x * 4 == 2 ** 62 * 4).count()
+        self.assertEqual(query.fetch(), 1)
+
+        query = source('N').map(lambda x: -x - 2 ** 62 - 1)
+        self.assertEqual(query.fetch(), [-2 ** 63 - 1, -2 ** 62 - 2])
+
+        query = source('N').map(lambda x: x * 1.5)  # <- REAL results are expected.
+        self.assertEqual(query.fetch(), [2 ** 62 * 1.5, 1.5])
+
     def test_execute_query(self):
         data = [['x', 101], ['y', 202], ['z', 303]]
         filednames = ['A', 'B']
@@ -1091,6 +1848,111 @@ class TestDataSource(unittest.TestCase):
         result = source('A', B=unhashable_iseven).fetch()
         self.assertEqual(result, ['y'])
 
+    def test_execute_query_predicates(self):
+        data = [['x', 101], ['y', 202], ['z', 303], ['Xx', None]]
+        source = DataSource(data, ['A', 'B'])
+
+        self.assertEqual(source('A', B=between(150, 303)).fetch(), ['y', 'z'])
+        self.assertEqual(source('A', B=gt(202)).fetch(), ['z'])
+        self.assertEqual(source('A', B=ge(202)).fetch(), ['y', 'z'])
+        self.assertEqual(source('A', B=lt(202)).fetch(), ['x'])
+        self.assertEqual(source('A', B=le(202)).fetch(), ['x', 'y'])
+        self.assertEqual(source('A', A=not_in(['x', 'y'])).fetch(), ['z', 'Xx'])
+        self.assertEqual(source('A', B=is_null()).fetch(), ['Xx'])
+        self.assertEqual(source('A', B=not_null()).fetch(), ['x', 'y', 'z'])
+        self.assertEqual(source('A', A=regex('^x')).fetch(), ['x'])
+        self.assertEqual(source('A', A=regex('^x', re.I)).fetch(), ['x', 'Xx'])
+        self.assertEqual(source('A', A=re.compile('x$')).fetch(), ['x', 'Xx'])
+
+        # Non-string values are searched the same way as in Python.
+        predicate = regex('^[12]0')
+        self.assertEqual(source('A', B=predicate).fetch(), ['x', 'y'])
+        self.assertEqual([x for x, y in data if predicate(y)], ['x', 'y'])
+
+        # Ranges can use indexes.
+        source.create_index('B')
+        analysis = source('A', B=between(150, 303))._explain(file=None, analyze=True)
+        self.assertIn('USING INDEX', analysis)
+        self.assertNotIn('<- full scan', analysis)
+
+    def test_execute_query_in_table(self):
+        expected = self.source({'label1': 'value'}, label2=['x', 'y']).fetch()
+
+        self.source.in_table_threshold = 1  # <- Use table for 2 or more items.
+        result = self.source({'label1': 'value'}, label2=['x', 'y']).fetch()
+        self.assertEqual(result, expected)
+        self.assertEqual(len(self.source._in_tables), 1)
+
+        result = self.source('value', label2=set(['y', 'x'])).count().fetch()
+        self.assertEqual(result, 5)
+        self.assertEqual(len(self.source._in_tables), 1, msg='should reuse table')
+
+        result = self.source('label1', label2=['z']).fetch()  # <- Below threshold.
+        self.assertEqual(result, ['a', 'b'])
+        self.assertEqual(len(self.source._in_tables), 1)
+
+    def test_sample(self):
+        data = [['a' if x % 3 else 'b', x] for x in range(1, 101)]
+        source = DataSource(data, ['A', 'B'])
+
+        result = source('B').sample(n=5).fetch()
+        self.assertEqual(len(result), 5)
+        self.assertEqual(source('B').sample(n=5).fetch(), result)
+        self.assertNotEqual(source('B').sample(n=5, seed=1).fetch(), result)
+
+        # Without where-values, rowids match positions in Python.
+        expected = source('B').map(int).sample(n=5).fetch()
+        self.assertEqual(result, expected)
+
+        result = source('B', A='b').sample(n=3).fetch()
+        self.assertEqual(len(result), 3)
+        self.assertTrue(all(x % 3 == 0 for x in result))
+
+        result = source({'A': 'B'}).sample(n=3).fetch()
+        self.assertEqual([len(x) for x in result.values()], [3, 3])
+
+        result = source({'A': 'B'}).sample(n=3).sum().fetch()
+        expected = dict((k, sum(v)) for k, v in source({'A': 'B'}).sample(n=3).fetch().items())
+        self.assertEqual(result, expected)
+
+        result = source('B').sample(fraction=0.2).fetch()
+        self.assertTrue(5 < len(result) < 40)
+
+    def test_sample_without_window_functions(self):
+        data = [['a' if x % 3 else 'b', x] for x in range(1, 101)]
+        source = DataSource(data, ['A', 'B'])
+        expected = source({'A': 'B'}, B=lambda x: x > 10).sample(n=3).fetch()
+
+        original = dataaccess._sqlite_has_window_functions
+        dataaccess._sqlite_has_window_functions = False
+        try:
+            result = source({'A': 'B'}, B=lambda x: x > 10).sample(n=3).fetch()
+        finally:
+            dataaccess._sqlite_has_window_functions = original
+        self.assertEqual(result, expected)
+
+    def test_execute_query_translated_lambdas(self):
+        data = [['x', 101], ['y', 202], ['z', 303], ['', None]]
+        source = DataSource(data, ['A', 'B'])
+
+        result = source('A', B=lambda x: x is not None and x > 200).fetch()
+        self.assertEqual(result, ['y', 'z'])
+
+        result = source('B', A=lambda x: x != '').fetch()
+        self.assertEqual(result, [101, 202, 303])
+
+        result = source('B', A=lambda x: x in ('x', 'z')).fetch()
+        self.assertEqual(result, [101, 303])
+
+        result = source('A', B=lambda x: x is None).fetch()
+        self.assertEqual(result, [''])
+
+        # Values of other types are passed to the Python function.
+        source = DataSource([['x', 101], ['y', 'abc']], ['A', 'B'])
+        result = source('A', B=lambda x: len(x) == 3)
+        with self.assertRaises(Exception):
+            result.fetch()  # <- Raises error for len(101).
+
     def test_iter(self):
         """Test __iter__."""
         result = [row for row in self.source]
@@ -1105,6 +1967,28 @@ class TestDataSource(unittest.TestCase):
         ]
         self.assertEqual(expected, result)
 
+    def test_iterrows(self):
+        result = list(self.source.iterrows())
+        self.assertEqual(result, list(self.source))
+
+        result = list(self.source.iterrows(tuple))
+        self.assertEqual(result[0], ('a', 'x', '17'))
+        self.assertEqual(len(result), 7)
+
+        Row = collections.namedtuple('Row', self.source.fieldnames)
+        result = list(self.source.iterrows(Row))
+        self.assertEqual(result[-1], Row('b', 'x', '25'))
+
+        with self.assertRaises(TypeError):
+            self.source.iterrows(list)
+
+    def test_batch_size(self):
+        self.source.batch_size = 2  # <- Smaller than any group.
+        result = self.source({'label1': 'value'}).fetch()
+        expected = {'a': ['17', '13', '20', '15'], 'b': ['5', '40', '25']}
+        self.assertEqual(result, expected)
+        self.assertEqual(len(list(self.source)), 7)
+
     def test_select_list_of_strings(self):
         result = self.source._select(['label1'])
         expected = ['a', 'a', 'a', 'a', 'b', 'b', 'b']
@@ -1289,6 +2173,383 @@ class TestDataSource(unittest.TestCase):
         }
         self.assertEqual(dict(result), expected)
 
+    def test_select_aggregate_distribution(self):
+        result = self.source._select_aggregate('MEDIAN', ['value'])
+        self.assertEqual(result, 17)
+
+        result = self.source._select_aggregate('MEDIAN', {'label1': ['value']})
+        self.assertEqual(result.fetch(), {'a': 16, 'b': 25})
+
+        result = self.source._select_aggregate('VARIANCE', {'label1': ['value']})
+        self.assertAlmostEqual(result.fetch()['b'], 308.3333333333)
+
+        result = self.source._select_aggregate('STDDEV', ['value'])
+        self.assertAlmostEqual(result, 11.0259434)
+
+    def test_distribution_steps(self):
+        queries = [
+            self.source({'label1': 'value'}).median(),
+            self.source({'label1': 'value'}).stddev(),
+            self.source({'label1': 'value'}).variance(),
+            self.source({'label1': 'value'}).percentile(90),
+            self.source({'label1': 'value'}).map(int).filter(lambda x: x > 15).percentile(50),
+            self.source({'label1': set(['value'])}).percentile(50),
+            self.source('value', label1='c').median(),
+        ]
+        for query in queries:
+            expected = _fetch(query(optimize=False))
+            self.assertEqual(_fetch(query()), expected)
+
+        with self.assertRaises(ValueError):
+            self.source('value').percentile(101)
+
+    def test_approximate_steps(self):
+        queries = [
+            self.source({'label1': 'value'}).approx_count_distinct(),
+            self.source({'label1': 'value'}).approx_quantile(0.5),
+            self.source({'label1': 'value'}).approx_quantile(0.9, error=0.05),
+            self.source({'label1': 'value'}).map(int).approx_quantile(0.5),
+            self.source({'label1': set(['value'])}).approx_count_distinct(0.1),
+            self.source('label2').approx_count_distinct(),
+        ]
+        for query in queries:
+            expected = _fetch(query(optimize=False))
+            self.assertEqual(_fetch(query()), expected)
+
+        result = self.source({'label1': 'label2'}).approx_count_distinct()
+        self.assertEqual(result.fetch(), {'a': 3, 'b': 3})
+
+        with self.assertRaises(ValueError):
+            self.source('value').approx_quantile(1.5)
+
+        with self.assertRaises(ValueError):
+            self.source('value').approx_count_distinct(error=0)
+
+    def test_select_compiled(self):
+        steps = (('filter', lambda x: x != '5'), ('map', int), ('aggregate', 'SUM'))
+        result = self.source._select_compiled(steps, ['value'])
+        self.assertEqual(result, 130)
+
+        result = self.source._select_compiled(steps, {'label1': ['value']})
+        self.assertEqual(result.fetch(), {'a': 65, 'b': 65})
+
+        # Groups without matching values are kept.
+        steps = (('filter', lambda x: x == '5'), ('aggregate', 'COUNT'))
+        result = self.source._select_compiled(steps, {'label1': ['value']})
+        self.assertEqual(result.fetch(), {'a': 0, 'b': 1})
+
+        # Filter without aggregation.
+        steps = (('filter', lambda x: x != 'x'), ('distinct', None))
+        result = self.source._select_compiled(steps, ['label2'])
+        self.assertEqual(sorted(result.fetch()), ['y', 'z'])
+
+    def test_select_compiled_fallback(self):
+        # Map returns values that can not be stored in SQLite.
+        steps = (('map', lambda x: (x, x)), ('aggregate', 'COUNT'))
+        result = self.source._select_compiled(steps, {'label1': ['value']})
+        self.assertEqual(result.fetch(), {'a': 4, 'b': 3})
+
+    def test_select_compiled_calls(self):
+        source = DataSource([(x,) for x in range(10)], ['a'])
+        calls = []
+        def func(x):
+            calls.append(x)
+            return x
+
+        # Mapped values are computed once and reused by later steps.
+        query = source('a').map(func).filter(lambda x: x > 4).sum()
+        self.assertEqual(query.fetch(), 35)
+        self.assertEqual(len(calls), 10)
+
+        del calls[:]
+        query = source('a').map(func).filter(lambda x: x > 4).map(func).sum()
+        self.assertEqual(query.fetch(), 35)
+        self.assertEqual(len(calls), 15)
+
+    def test_select_compiled_decimal(self):
+        # Numbers that SQLite can not store are handled in Python.
+        query = self.source('value').map(lambda x: Decimal(x) / 10).filter(lambda x: x > 2)
+        self.assertEqual(query.fetch(), [Decimal('4'), Decimal('2.5')])
+        self.assertIsInstance(query.fetch()[0], Decimal)
+
+        query = self.source('value').map(lambda x: Decimal(x) / 10).sum()
+        self.assertEqual(query.fetch(), query(optimize=False))
+
+    def test_select_compiled_big_integer(self):
+        def times_four(x):  # <- Not a lambda so it is not translated to SQL.
+            return x * 4
+
+        # Integers outside the 64-bit range are handled in Python.
+        source = DataSource([[2 ** 62], [1]], ['N'])
+        query = source('N').map(times_four).sum()
+        self.assertEqual(query.fetch(), 2 ** 64 + 4)
+        self.assertEqual(query.fetch(), query(optimize=False))
+
+        query = source('N').map(times_four).filter(lambda x: x > 10)
+        self.assertEqual(query.fetch(), [2 ** 64])
+
+    def test_select_compiled_errors(self):
+        def bad_function(x):
+            raise ValueError('bad value')
+
+        steps = (('map', bad_function), ('aggregate', 'SUM'))
+        with self.assertRaisesRegex(ValueError, 'bad value'):
+            self.source._select_compiled(steps, ['value'])
+
+        steps = (('filter', bad_function),)
+        with self.assertRaisesRegex(ValueError, 'bad value'):
+            self.source._select_compiled(steps, ['value']).fetch()
+
+    def test_compiled_query_results(self):
+        query = self.source({'label1': 'value'}).filter(lambda x: x != '5').map(int).max()
+        self.assertEqual(query.fetch(), query(optimize=False).fetch())
+
+        query = self.source('value').map(int).filter(lambda x: x > 15).count()
+        self.assertEqual(query.fetch(), query(optimize=False))
+
+    def test_query_cache(self):
+        self.assertIsNone(self.source.cache_info())
+        self.source.enable_cache()
+
+        query = self.source({'label1': 'value'}).map(int)
+        expected = {'a': [17, 13, 20, 15], 'b': [5, 40, 25]}
+        self.assertEqual(query.fetch(), expected)
+        self.assertEqual(query.fetch(), expected)  # <- From cache.
+
+        result = query()
+        self.assertIsInstance(result, DataResult)
+        self.assertIsInstance(dict(result)['a'], DataResult)
+
+        self.assertEqual(self.source('value').map(int).sum().fetch(), 135)
+        self.assertEqual(self.source('value').map(int).sum().fetch(), 135)
+
+        info = self.source.cache_info()
+        self.assertEqual((info.hits, info.misses), (3, 2))
+        self.assertGreater(info.currbytes, 0)
+
+    def test_query_cache_invalidation(self):
+        self.source.enable_cache()
+        query = self.source('label1').count()
+        self.assertEqual(query(), 7)
+
+        cursor = self.source._connection.cursor()
+        statement = 'INSERT INTO {0} VALUES (?, ?, ?)'.format(self.source._table)
+        cursor.execute(statement, ('c', 'x', '1'))
+
+        self.assertEqual(query(), 8)
+        self.assertEqual(self.source.cache_info().hits, 0)
+
+    def test_query_cache_internal_changes(self):
+        self.source.enable_cache()
+        query = self.source('label1').count()
+        self.assertEqual(query(), 7)
+
+        # Temporary tables for large where-values are not data changes.
+        values = ['x'] + [str(x) for x in range(self.source.in_table_threshold)]
+        self.assertEqual(self.source('value', label2=values).count().fetch(), 3)
+
+        # Loading a co-located source is not a change to this source.
+        DataSource([('a', 'b')], ['C', 'D'], database=self.source)
+
+        self.assertEqual(query(), 7)
+        self.assertEqual(self.source.cache_info().hits, 1)
+
+    def test_query_cache_eviction(self):
+        self.source.enable_cache(maxbytes=2048)
+        self.source('label1').fetch()
+        self.source('label2').fetch()
+        self.source('value').fetch()
+        info = self.source.cache_info()
+        self.assertLessEqual(info.currbytes, 2048)
+
+        self.source('value').fetch()  # <- Most recently used is kept.
+        self.assertEqual(self.source.cache_info().hits, 1)
+
+        self.source.disable_cache()
+        self.assertIsNone(self.source.cache_info())
+
+    def test_execute_many(self):
+        queries = [
+            self.source({'label1': 'value'}).sum(),
+            self.source({'label1': 'value'}).count(),
+            self.source({'label1': 'value'}).map(lambda x: x * 2).max(),
+            self.source({'label1': 'label2'}).count(),
+            self.source('label2').distinct(),
+            self.source('value', label2='x').sum(),
+        ]
+        expected = [query.fetch() for query in queries]
+
+        batches = []
+        execute_batch = self.source._execute_batch
+        def wrapped(key_columns, members):
+            batches.append(len(members))
+            return execute_batch(key_columns, members)
+        self.source._execute_batch = wrapped
+
+        results = self.source.execute_many(queries)
+        results = [_fetch(result) for result in results]
+        self.assertEqual(results, expected)
+        self.assertEqual(batches, [4], msg=(
+            'aggregates grouped by label1 should run as a single batch'))
+
+    def test_execute_many_fallback(self):
+        queries = [  # <- Map returns unsupported type, batch cannot run.
+            self.source({'label1': 'value'}).map(lambda x: (x,)).count(),
+            self.source({'label1': 'value'}).sum(),
+        ]
+        expected = [query.fetch() for query in queries]
+        results = self.source.execute_many(queries)
+        self.assertEqual([_fetch(x) for x in results], expected)
+
+        other_source = DataSource([['a', 1]], ['label1', 'value'])
+        with self.assertRaises(ValueError):
+            self.source.execute_many([other_source('value').sum()])
+
+    def test_execute_many_cache(self):
+        self.source.enable_cache()
+        queries = [
+            self.source({'label1': 'value'}).sum(),
+            self.source({'label1': 'value'}).count(),
+        ]
+        first = [_fetch(x) for x in self.source.execute_many(queries)]
+        second = [_fetch(x) for x in self.source.execute_many(queries)]
+        self.assertEqual(first, second)
+        self.assertEqual(self.source.cache_info().hits, 2)
+
+    def test_index_advisor(self):
+        self.assertEqual(self.source.index_recommendations(), [])
+
+        self.source.enable_index_advisor(threshold=2)
+        self.source('value', label2='x').sum().fetch()
+        self.source({'label1': 'value'}, label2='x').fetch()
+        self.assertEqual(self.source.index_recommendations(), [])
+
+        self.source('value', label2='x').sum().fetch()
+        recommendations = self.source.index_recommendations()
+        self.assertEqual(len(recommendations), 1)
+        self.assertEqual(recommendations[0].columns, ('label2',))
+        self.assertEqual(recommendations[0].queries, 2)
+
+        self.source({'label1': 'value'}, label2='x').fetch()
+        columns = [x.columns for x in self.source.index_recommendations()]
+        self.assertEqual(set(columns), set([('label2',), ('label2', 'label1')]))
+
+        self.source.create_index('label2', 'label1')  # <- Covers both.
+        self.assertEqual(self.source.index_recommendations(), [])
+
+        self.source.disable_index_advisor()
+        self.assertEqual(self.source.index_report(), [])
+
+    def test_index_advisor_range_column(self):
+        self.source.enable_index_advisor(threshold=1)
+        self.source({'label2': 'value'}, label1=gt('a'), label2='x').fetch()
+        columns = [x.columns for x in self.source.index_recommendations()]
+        self.assertEqual(columns, [('label2', 'label1')])  # <- Range is last.
+
+    def test_index_advisor_fetch_time(self):
+        def slow(x):
+            time.sleep(0.01)
+            return True
+
+        self.source.enable_index_advisor(threshold=1)
+        result = self.source('label1', label2='x', value=slow)
+        self.assertEqual(len(result.fetch()), 3)
+        recommendation = self.source.index_recommendations()[0]
+        self.assertEqual(recommendation.columns, ('label2',))
+        self.assertGreaterEqual(recommendation.seconds, 0.03)
+
+    def test_index_advisor_auto_index(self):
+        self.source.enable_index_advisor(auto_index=True, threshold=2)
+        self.source({'label1': 'value'}).sum().fetch()
+        self.source({'label1': 'value'}).sum().fetch()
+        self.assertFalse(self.source._is_indexed(['label1']))
+
+        result = self.source({'label1': 'value'}).sum().fetch()  # <- Builds index.
+        self.assertEqual(result, {'a': 65, 'b': 70})
+        self.assertTrue(self.source._is_indexed(['label1']))
+        self.assertEqual(self.source.index_recommendations(), [])
+
+        report = self.source.index_report()
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0].columns, ('label1',))
+        self.assertEqual(report[0].queries_before, 2)
+        self.assertEqual(report[0].queries_after, 1)
+        self.assertIsNotNone(report[0].seconds_saved)
+
+    def test_column_stats(self):
+        stats = self.source.column_stats('label2')
+        self.assertEqual(stats.rows, 7)
+        self.assertEqual(stats.distinct, 3)
+        self.assertEqual(stats.nulls, 0)
+        self.assertEqual((stats.min, stats.max), ('x', 'z'))
+        self.assertEqual(stats.type, 'TEXT')
+
+        source = DataSource([(1,), (2.5,), (None,)], ['A'])
+        stats = source.column_stats('A')
+        self.assertEqual((stats.rows, stats.nulls, stats.type), (3, 1, 'REAL'))
+
+        with self.assertRaises(LookupError):
+            source.column_stats('B')
+
+    def test_analyze(self):
+        self.source.analyze()
+        self.assertIsNotNone(self.source._get_current_stats('value'))
+
+        # Answered from statistics (no query is executed).
+        self.source._execute_filtered = None
+        self.assertEqual(self.source('value').count().fetch(), 7)
+        self.assertEqual(self.source('value').min().fetch(), '13')
+        self.assertEqual(self.source('value').max().fetch(), '5')
+        del self.source._execute_filtered
+
+        # Statistics are discarded when data changes.
+        cursor = self.source._connection.cursor()
+        cursor.execute("INSERT INTO {0} VALUES ('c', 'x', '1')".format(self.source._table))
+        self.assertIsNone(self.source._get_current_stats('value'))
+        self.assertEqual(self.source('value').count().fetch(), 8)
+
+    def test_analyze_distinct_on_demand(self):
+        self.source.analyze()
+        self.assertIsNone(self.source._get_current_stats('label2').distinct)
+
+        stats = self.source.column_stats('label2')  # <- Counted when needed.
+        self.assertEqual(stats.distinct, 3)
+        self.assertEqual(self.source._get_current_stats('label2').distinct, 3)
+        self.assertIsNone(self.source._get_current_stats('label1').distinct)
+
+    def test_analyze_memoized_steps(self):
+        data = [['a' if x % 2 else 'b', str(x % 3)] for x in range(30)]
+        source = DataSource(data, ['A', 'B'])
+        source.analyze()  # <- Column B has 3 distinct values in 30 rows.
+
+        calls = []
+        def double(x):
+            calls.append(x)
+            return int(x) * 2
+        result = source({'A': 'B'}).map(double).sum().fetch()
+        self.assertEqual(result, {'a': 30, 'b': 30})
+        self.assertEqual(len(calls), 3)
+
+    def test_step_function_registry(self):
+        data = [['a' if x % 2 else 'b', str(x % 3)] for x in range(30)]
+        source = DataSource(data, ['A', 'B'])
+        source.analyze()
+
+        double = lambda x: int(x) * 2 if x else None
+        self.assertEqual(source('B').map(double).sum().fetch(), 60)
+        self.assertEqual(len(source('B').map(double).fetch()), 30)
+
+        # Memoized results are cleared after each execution.
+        step_functions = dataaccess._get_registry(source._connection)['steps']
+        self.assertTrue(step_functions)
+        self.assertTrue(all(x.memo is None for x in step_functions.values()))
+
+        # Registered functions are discarded with the connection.
+        connection = weakref.ref(source._connection)
+        del source, step_functions
+        gc.collect()
+        self.assertIsNone(connection())
+
     def test_call(self):
         query = self.source(['label1'])
         expected = ['a', 'a', 'a', 'a', 'b', 'b', 'b']
@@ -1316,3 +2577,216 @@ class TestDataSource(unittest.TestCase):
         expected = {'a': ['x', 'x', 'y', 'z'], 'b': ['z', 'y', 'x']}
         self.assertIsInstance(query, DataQuery)
         self.assertEqual(query.fetch(), expected)
+
+
+class TestLazyDataSource(TestDataSource):
+    """Run the DataSource tests using a lazy source."""
+    def setUp(self):
+        fieldnames = ['label1', 'label2', 'value']
+        data = [['a', 'x', '17'],
+                ['a', 'x', '13'],
+                ['a', 'y', '20'],
+                ['a', 'z', '15'],
+                ['b', 'z', '5' ],
+                ['b', 'y', '40'],
+                ['b', 'x', '25']]
+        self.source = DataSource(data, fieldnames, lazy=True)
+
+    def test_query_cache_invalidation(self):
+        self.source._load_columns(self.source.fieldnames)
+        super(TestLazyDataSource, self).test_query_cache_invalidation()
+
+    def test_columns_loaded_on_demand(self):
+        lazy_table = self.source._lazy_table
+        self.assertEqual(lazy_table.loaded, [])
+        self.assertEqual(self.source.fieldnames, ('label1', 'label2', 'value'))
+
+        self.assertEqual(self.source('label2', label1='b').fetch(), ['z', 'y', 'x'])
+        self.assertEqual(lazy_table.loaded, ['label1', 'label2'])
+
+        self.assertEqual(self.source('value').map(int).sum().fetch(), 135)
+        self.assertEqual(lazy_table.loaded, ['label1', 'label2', 'value'])
+
+    def test_usecols(self):
+        data = [['a', 'x', '17'], ['b', 'y', '13']]
+        source = DataSource(data, ['A', 'B', 'C'], lazy=True, usecols=['C', 'A'])
+        self.assertEqual(source.fieldnames, ('C', 'A'))
+        self.assertEqual(source(('A', 'C')).fetch(), [('a', '17'), ('b', '13')])
+
+        with self.assertRaises(LookupError):
+            DataSource(data, ['A', 'B', 'C'], lazy=True, usecols=['D'])
+
+    def test_from_csv(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        csv_path = os.path.join(temporary_dir, 'data.csv')
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B,C\nx,1,j\ny,2,k\n')
+
+        source = DataSource.from_csv(csv_path, lazy=True, types={'B': int})
+        self.assertEqual(source.fieldnames, ('A', 'B', 'C'))
+        self.assertEqual(source('B').sum().fetch(), 3)
+        self.assertEqual(source({'A': 'C'}).fetch(), {'x': ['j'], 'y': ['k']})
+
+        source = DataSource.from_csv(csv_path, lazy=True, usecols=['C'])
+        self.assertEqual(source.fieldnames, ('C',))
+
+        csv_file = io.StringIO(u'A,B\nx,1\n')
+        with self.assertRaises(ValueError):
+            DataSource.from_csv(csv_file, lazy=True)  # <- Not a path.
+
+        class FileLike(object):  # <- Like Python 2 StringIO (not an IOBase).
+            def __init__(self, text):
+                self._lines = text.splitlines(True)
+            def read(self, size=-1):
+                return ''.join(self._lines)
+            def __iter__(self):
+                return iter(self._lines)
+
+        with self.assertRaises(ValueError):
+            DataSource.from_csv(FileLike('A,B\nx,1\n'), lazy=True)  # <- Not a path.
+        with self.assertRaises(ValueError):
+            DataSource.from_csv(FileLike('A,B\nx,1\n'), cache_dir='cache')
+
+    def test_from_csv_late_encoding_error(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        csv_path = os.path.join(temporary_dir, 'data.csv')
+        with open(csv_path, 'wb') as fh:
+            fh.write(b'A,B\n' + b'x,1\n' * 300000)  # <- Longer than sniffed prefix.
+            fh.write(b'y,\xf1\n')  # <- ISO-8859-1 for \xf1.
+
+        source = DataSource.from_csv(csv_path, lazy=True)
+        with self.assertWarns(UserWarning):
+            self.assertEqual(source('A').count().fetch(), 300001)
+
+        # Later loads should use the saved encoding (without warning again).
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(source('B', A='y').fetch(), [u'\xf1'])
+        self.assertEqual(caught, [])
+
+
+@unittest.skipIf(pandas is None, 'pandas not found')
+class TestDataFrameSource(unittest.TestCase):
+    """Queries should return the same results as DataSource."""
+    def setUp(self):
+        fieldnames = ['label1', 'label2', 'value', 'number']
+        data = [['a', 'x',  '17', 1.5],
+                ['a', 'x',  '13', None],
+                ['a', 'y',  '20', 3.0],
+                ['a', None, '15', 4.0],
+                ['b', 'z',  '5',  -2.0],
+                ['b', 'y',  '40', 6.0],
+                ['b', 'x',  '25', 7.5]]
+        self.source = DataSource(data, fieldnames)
+        self.frame_source = DataFrameSource(pandas.DataFrame(data, columns=fieldnames))
+
+    def assertSameResult(self, func):
+        expected = func(self.source)
+        result = func(self.frame_source)
+        if isinstance(expected, DataResult):
+            expected = expected.fetch()
+            result = result.fetch()
+
+        if isinstance(expected, dict):
+            self.assertEqual(list(result.keys()), list(expected.keys()))
+            for key in expected:
+                self.assertAlmostEqualOrEqual(result[key], expected[key])
+        else:
+            self.assertAlmostEqualOrEqual(result, expected)
+        return result
+
+    def assertAlmostEqualOrEqual(self, first, second):
+        if isinstance(second, float):
+            self.assertAlmostEqual(first, second)  # <- Rounding may differ.
+        else:
+            self.assertEqual(first, second)
+
+    def test_fieldnames(self):
+        self.assertEqual(self.frame_source.fieldnames, self.source.fieldnames)
+        self.assertEqual(list(self.frame_source), list(self.source))
+
+    def test_select(self):
+        self.assertSameResult(lambda s: s('label1')())
+        self.assertSameResult(lambda s: s({'label1'})())
+        self.assertSameResult(lambda s: s(('label2', 'number'))())
+        self.assertSameResult(lambda s: s({'label2': 'value'})())
+        self.assertSameResult(lambda s: s({('label1', 'label2'): ['number']})())
+
+        result = self.assertSameResult(lambda s: s({'label2': 'number'})())
+        self.assertEqual(list(result.keys())[0], None)  # <- None is first.
+
+    def test_where(self):
+        self.assertSameResult(lambda s: s('value', label1='b')())
+        self.assertSameResult(lambda s: s('value', label2=['x', 'y'])())
+        self.assertSameResult(lambda s: s('value', label2=None)())
+        self.assertSameResult(lambda s: s('value', label2=is_null())())
+        self.assertSameResult(lambda s: s('value', number=gt(3))())
+        self.assertSameResult(lambda s: s('value', label2=lambda x: x == 'y')())
+        with self.assertRaises(LookupError):
+            self.frame_source('value', label3='a')()
+
+    def test_distinct(self):
+        self.assertSameResult(lambda s: s('label2').distinct()())
+        self.assertSameResult(lambda s: s({'label1': 'label2'}).distinct()())
+
+    def test_aggregate(self):
+        for name in ['sum', 'count', 'avg', 'min', 'max', 'median', 'variance', 'stddev']:
+            self.assertSameResult(lambda s: getattr(s('number'), name)()())
+            self.assertSameResult(lambda s: getattr(s('value'), name)()())
+            self.assertSameResult(lambda s: getattr(s({'label1': 'number'}), name)()())
+            self.assertSameResult(lambda s: getattr(s({'label2': 'value'}), name)()())
+
+        self.assertSameResult(lambda s: s({'label1': {'label2'}}).count()())
+        self.assertSameResult(lambda s: s('number', label1='x').sum()())
+        self.assertSameResult(lambda s: s({'label1': 'number'}).percentile(90)())
+
+        result = self.assertSameResult(lambda s: s('label1').count()())
+        self.assertIsInstance(result, int)
+
+    def test_compiled_steps(self):
+        self.assertSameResult(lambda s: s('value').map(int).sum()())
+        self.assertSameResult(lambda s: s({'label1': 'value'}).filter(lambda x: x > '2')())
+
+    def test_sample(self):
+        self.assertSameResult(lambda s: s('value').sample(3, seed=7)())
+        self.assertSameResult(lambda s: s({'label1': 'value'}).sample(2)())
+        self.assertSameResult(lambda s: s('value').sample(fraction=0.5)())
+
+    def test_mixed_types(self):
+        data = [['a', 1], ['b', 'x'], ['c', 2.5], ['d', None]]
+        self.source = DataSource(data, ['A', 'B'])
+        self.frame_source = DataFrameSource(pandas.DataFrame(data, columns=['A', 'B']))
+        self.assertSameResult(lambda s: s('A', B=gt(2))())
+        self.assertSameResult(lambda s: s('A', B=between(1, 'z'))())
+        self.assertSameResult(lambda s: s('A', B=lt('a'))())
+
+    def test_sum_overflow(self):
+        frame = pandas.DataFrame({'A': ['x', 'x', 'y'],
+                                  'B': [2 ** 62, 2 ** 62, 5]}, dtype=object)
+        frame['B'] = frame['B'].astype('int64')
+        source = DataFrameSource(frame)
+        self.assertEqual(source('B').sum().fetch(), 2 ** 63 + 5)
+        self.assertEqual(source({'A': 'B'}).sum().fetch(), {'x': 2 ** 63, 'y': 5})
+
+    def test_index_and_stats(self):
+        self.frame_source.create_index('label1', 'label2')  # <- Does nothing.
+        with self.assertRaises(LookupError):
+            self.frame_source.create_index('label3')
+
+        self.frame_source.enable_index_advisor(auto_index=True)
+        self.frame_source('value', label1='a').fetch()
+        self.assertEqual(self.frame_source.index_recommendations(), [])
+
+        self.frame_source.analyze()
+        self.source.analyze()
+        for column in self.source.fieldnames:
+            self.assertEqual(self.frame_source.column_stats(column),
+                             self.source.column_stats(column))
+
+    def test_named_index(self):
+        frame = pandas.DataFrame({'A': ['x', 'y'], 'B': [1, 2]}).set_index('A')
+        source = DataFrameSource(frame)
+        self.assertEqual(source.fieldnames, ('A', 'B'))
+        self.assertEqual(source({'A': 'B'}).sum().fetch(), {'x': 1, 'y': 2})
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+
+# Import compatiblity layers and helpers.
+from . import _io as io
+from . import _unittest as unittest
+
+# Import code to test.
+from datatest.load import csvreader
+from datatest.load.csvreader import UnicodeCsvReader
+from datatest.load.csvreader import ParallelCsvReader
+from datatest.load.csvreader import _find_record_boundaries
+from datatest.load.csvreader import _parse_csv_range
+from datatest.load.csvreader import _sniff_encoding
+from datatest.load.csvreader import _get_compression
+from datatest.load.csvreader import _expand_archives
+from datatest.load.csvreader import _ZipMember
+
+
+class TestParallelCsvReader(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temporary_dir))
+
+    def _make_file(self, data):
+        path = os.path.join(self.temporary_dir, 'data.csv')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def _read_sequential(self, path, **fmtparams):
+        with UnicodeCsvReader(path, encoding='utf-8', **fmtparams) as reader:
+            return list(reader)
+
+    def test_find_record_boundaries(self):
+        path = self._make_file(b'A,B\n'
+                               b'x,"one\ntwo"\n'
+                               b'y,three\n')
+        boundaries = _find_record_boundaries(path, 1, b'"')
+        self.assertEqual(boundaries, [0, 4, 16, 24])
+
+        boundaries = _find_record_boundaries(path, 1, None)  # <- Ignore quotes.
+        self.assertEqual(boundaries, [0, 4, 11, 16, 24])
+
+        boundaries = _find_record_boundaries(path, 1, b'"', blocksize=3)
+        self.assertEqual(boundaries, [0, 4, 16, 24])
+
+        boundaries = _find_record_boundaries(path, 100, b'"')
+        self.assertEqual(boundaries, [0, 24])
+
+    def test_parse_csv_range(self):
+        path = self._make_file(b'A,B\n'
+                               b'x,"one\ntwo"\n'
+                               b'y,three')  # <- No final newline.
+
+        rows = _parse_csv_range((path, 'utf-8', 4, 24, 'excel', {}))
+        self.assertEqual(rows, [['x', 'one\ntwo'], ['y', 'three']])
+
+        rows = _parse_csv_range((path, 'utf-8', 0, 11, 'excel', {}))
+        self.assertIsNone(rows, msg='range ends inside a quoted field')
+
+    def test_parallel_read(self):
+        lines = []
+        for i in range(200):
+            lines.append('{0},"multi\nline {0}",plain {0}\n'.format(i))
+        path = self._make_file(('A,B,C\n' + ''.join(lines)).encode('utf-8'))
+
+        with ParallelCsvReader(path, 'utf-8', processes=2, chunksize=512) as reader:
+            rows = list(reader)
+        self.assertEqual(rows, self._read_sequential(path))
+        self.assertEqual(len(rows), 201)
+
+    def test_misleading_quotes(self):
+        """Quote characters inside unquoted fields are not counted
+        correctly when finding boundaries. Parsing should fall back
+        to reading the file in the current process.
+        """
+        lines = ['0,5" pipe,x\n']  # <- Unquoted field with quote character.
+        for i in range(1, 100):
+            lines.append('{0},"a\nb",c\n'.format(i))
+        path = self._make_file(('A,B,C\n' + ''.join(lines)).encode('utf-8'))
+
+        with ParallelCsvReader(path, 'utf-8', processes=2, chunksize=256) as reader:
+            boundaries = reader._get_boundaries()
+            rows = list(reader)
+        self.assertIsNone(_parse_csv_range((path, 'utf-8', 0, boundaries[1], 'excel', {})))
+        self.assertEqual(rows, self._read_sequential(path))
+        self.assertEqual(len(rows), 101)
+
+    def test_fmtparams(self):
+        lines = ['{0}|x {0}|y\n'.format(i) for i in range(100)]
+        path = self._make_file(('A|B|C\n' + ''.join(lines)).encode('utf-8'))
+
+        with ParallelCsvReader(path, 'utf-8', processes=2, chunksize=128, delimiter='|') as reader:
+            rows = list(reader)
+        self.assertEqual(rows, self._read_sequential(path, delimiter='|'))
+
+    def test_sequential_fallback(self):
+        path = self._make_file(u'A,B\nx,1\ny,2\n'.encode('utf-16'))
+        with ParallelCsvReader(path, 'utf-16', processes=2, chunksize=4) as reader:
+            self.assertIsNone(reader._get_boundaries())  # <- Not ASCII-compatible.
+
+        fh = io.BytesIO(b'A,B\nx,1\n')
+        if str is not bytes:  # <- Python 3 requires text streams.
+            fh = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+        with ParallelCsvReader(fh, 'utf-8', processes=2, chunksize=4) as reader:
+            self.assertIsNone(reader._get_boundaries())  # <- Not a file path.
+            self.assertEqual(list(reader), [['A', 'B'], ['x', '1']])
+
+
+
+class TestSniffEncoding(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temporary_dir))
+
+    def _make_file(self, data):
+        path = os.path.join(self.temporary_dir, 'data.csv')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def test_utf8(self):
+        path = self._make_file(b'A,B\nx,1\n')
+        self.assertEqual(_sniff_encoding(path), 'utf-8')
+
+        path = self._make_file(b'A,B\nx,\xc3\xb1\n')  # <- UTF-8 for \xf1.
+        self.assertEqual(_sniff_encoding(path), 'utf-8')
+
+    def test_iso88591(self):
+        path = self._make_file(b'A,B\nx,\xf1\n')  # <- ISO-8859-1 for \xf1.
+        self.assertEqual(_sniff_encoding(path), 'iso8859-1')
+
+        path = self._make_file(b'A,B\nx,1\n' * 10 + b'y,\xf1\n')
+        self.assertEqual(_sniff_encoding(path, blocksize=4), 'iso8859-1')
+
+        path = self._make_file(b'A,B\nx,\xc3')  # <- Truncated character.
+        self.assertEqual(_sniff_encoding(path), 'iso8859-1')
+
+    def test_split_character(self):
+        path = self._make_file(b'A,B\nx,\xc3\xb1\n')
+        self.assertEqual(_sniff_encoding(path, blocksize=7), 'utf-8')  # <- Splits \xc3\xb1.
+
+    def test_limit(self):
+        path = self._make_file(b'A,B\n' + b'x,1\n' * 10 + b'y,\xf1\n')
+        self.assertEqual(_sniff_encoding(path, limit=16), 'utf-8')  # <- Prefix only.
+        self.assertEqual(_sniff_encoding(path, limit=1024), 'iso8859-1')
+
+        path = self._make_file(b'A,B\nx,\xc3\xb1\n')
+        self.assertEqual(_sniff_encoding(path, limit=7), 'utf-8')  # <- Splits \xc3\xb1.
+
+    def test_file_object(self):
+        fh = io.BytesIO(b'A,B\nx,1\n')
+        self.assertIsNone(_sniff_encoding(fh))
+
+
+
+class TestCompressedFiles(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temporary_dir))
+        self.data = b'A,B\nx,1\ny,\xc3\xb1\n'
+        self.expected = [['A', 'B'], ['x', '1'], ['y', u'\xf1']]
+
+    def _read(self, path):
+        with UnicodeCsvReader(path, encoding='utf-8') as reader:
+            return list(reader)
+
+    def test_gzip(self):
+        path = os.path.join(self.temporary_dir, 'data.csv.gz')
+        with gzip.GzipFile(path, 'wb') as fh:
+            fh.write(self.data)
+        self.assertEqual(_get_compression(path), 'gzip')
+        self.assertEqual(self._read(path), self.expected)
+        self.assertEqual(_sniff_encoding(path), 'utf-8')
+
+    def test_bz2(self):
+        path = os.path.join(self.temporary_dir, 'data.dat')  # <- Extension is not used.
+        with open(path, 'wb') as fh:
+            fh.write(bz2.compress(self.data))
+        self.assertEqual(_get_compression(path), 'bz2')
+        self.assertEqual(self._read(path), self.expected)
+
+    def test_non_io_file_object(self):
+        """Decompressing objects without the io interface (like the
+        BZ2File class in Python 2) should be used without buffering.
+        """
+        class LegacyBZ2File(object):
+            def __init__(self, path, mode):
+                self._fh = bz2.BZ2File(path, mode)
+            def read(self, size=-1):
+                return self._fh.read(size)
+            def __iter__(self):
+                return iter(self._fh)
+            def close(self):
+                self._fh.close()
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc_info):
+                self.close()
+
+        original = csvreader.bz2
+        csvreader.bz2 = type(original)('bz2')
+        csvreader.bz2.BZ2File = LegacyBZ2File
+        self.addCleanup(lambda: setattr(csvreader, 'bz2', original))
+
+        path = os.path.join(self.temporary_dir, 'data.csv.bz2')
+        with open(path, 'wb') as fh:
+            fh.write(bz2.compress(self.data))
+        with csvreader._open_binary(path) as fh:
+            self.assertIsInstance(fh, LegacyBZ2File)
+            self.assertEqual(fh.read(), self.data)
+        self.assertEqual(_sniff_encoding(path), 'utf-8')
+
+    def test_xz(self):
+        try:
+            import lzma
+        except ImportError:
+            return self.skipTest('lzma not available')
+        path = os.path.join(self.temporary_dir, 'data.csv.xz')
+        with open(path, 'wb') as fh:
+            fh.write(lzma.compress(self.data))
+        self.assertEqual(_get_compression(path), 'xz')
+        self.assertEqual(self._read(path), self.expected)
+
+    def test_zip(self):
+        path = os.path.join(self.temporary_dir, 'data.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('data.csv', self.data)
+        self.assertEqual(_get_compression(path), 'zip')
+        self.assertEqual(self._read(path), self.expected)
+
+        with zipfile.ZipFile(path, 'a') as archive:
+            archive.writestr('more/data2.csv', b'B,C\n2,z\n')
+
+        members = _expand_archives([path])
+        self.assertEqual([x.name for x in members], ['data.csv', 'more/data2.csv'])
+        self.assertEqual(self._read(members[1]), [['B', 'C'], ['2', 'z']])
+
+        with self.assertRaises(ValueError):
+            self._read(path)  # <- Archive has more than one file.
+
+    def test_uncompressed(self):
+        path = os.path.join(self.temporary_dir, 'data.csv')
+        with open(path, 'wb') as fh:
+            fh.write(self.data)
+        self.assertIsNone(_get_compression(path))
+        self.assertEqual(_expand_archives([path]), [path])
+
+    def test_parallel_reader(self):
+        path = os.path.join(self.temporary_dir, 'data.csv.gz')
+        with gzip.GzipFile(path, 'wb') as fh:
+            fh.write(self.data * 10)
+        with ParallelCsvReader(path, 'utf-8', processes=2, chunksize=4) as reader:
+            self.assertIsNone(reader._get_boundaries())  # <- Compressed.
+            self.assertEqual(len(list(reader)), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
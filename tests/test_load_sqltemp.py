@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
 import sqlite3
+import tempfile
 
 # Import compatiblity layers and helpers.
 from . import _unittest as unittest
@@ -8,6 +11,97 @@ from datatest.utils import collections
 # Import code to test.
 from datatest.load.sqltemp import TemporarySqliteTable
 from datatest.load.sqltemp import TemporarySqliteTableForCsv
+from datatest.load.sqltemp import TemporaryDatabase
+from datatest.load.sqltemp import _infer_column_types
+from datatest.load.sqltemp import _normalize_type
+
+
+class TestTemporaryDatabase(unittest.TestCase):
+    def test_pragmas(self):
+        database = TemporaryDatabase({'cache_size': -4096, 'page_size': 8192})
+        cursor = database.connection.cursor()
+        self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone(), (-4096,))
+        self.assertEqual(cursor.execute('PRAGMA page_size').fetchone(), (8192,))
+
+        with self.assertRaises(ValueError):
+            TemporaryDatabase({'cache_size': '0; DROP TABLE foo'})
+
+    def test_separate_databases(self):
+        database1 = TemporaryDatabase()
+        database2 = TemporaryDatabase()
+        table = TemporarySqliteTable([('a', 'b')], ['x', 'y'], database1.connection)
+
+        tables = TemporarySqliteTable._get_existing_tables(database2.connection.cursor())
+        self.assertNotIn(table.name, tables)
+
+    @unittest.skipIf(TemporaryDatabase().uri is None, 'requires named in-memory databases')
+    def test_acquire_reader(self):
+        database = TemporaryDatabase()
+        data = [('1A', '1B'), ('2A', '2B')]
+        temptable = TemporarySqliteTable(data, ['COL_A', 'COL_B'], database.connection)
+
+        reader = database.acquire_reader()
+        self.assertIsNot(reader, database.connection)
+        cursor = reader.execute('SELECT * FROM ' + temptable.name)
+        self.assertEqual(cursor.fetchall(), data)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute('DELETE FROM ' + temptable.name)
+
+        database.release_reader(reader)
+        self.assertIs(database.acquire_reader(), reader, msg='should reuse connection')
+
+    def test_file_database(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        path = os.path.join(temporary_dir, 'data.sqlite3')
+
+        database = TemporaryDatabase(path=path)
+        self.assertIsNone(database.uri)
+        table = TemporarySqliteTable([('a', 'b')], ['x', 'y'], database.connection)
+        reader = database.acquire_reader()
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute('SELECT * FROM ' + table.name)  # <- TEMPORARY table.
+        database.release_reader(reader)
+
+        database.connection.temporary_tables = False
+        table = TemporarySqliteTable([('a', 'b')], ['x', 'y'], database.connection)
+        reader = database.acquire_reader()
+        cursor = reader.execute('SELECT * FROM ' + table.name)
+        self.assertEqual(cursor.fetchall(), [('a', 'b')])
+        database.release_reader(reader)
+        database.close()
+
+        connection = sqlite3.connect(path)
+        cursor = connection.execute('SELECT * FROM ' + table.name)
+        self.assertEqual(cursor.fetchall(), [('a', 'b')])
+        connection.close()
+
+    @unittest.skipIf(TemporaryDatabase().uri is None, 'requires named in-memory databases')
+    def test_attach(self):
+        temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temporary_dir))
+        path = os.path.join(temporary_dir, 'data.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE mytable (x, y)')
+        connection.execute("INSERT INTO mytable VALUES ('a', 'b')")
+        connection.commit()
+        connection.close()
+
+        database = TemporaryDatabase()
+        schema = database.attach(path, mmap_size=65536)
+        cursor = database.connection.execute('SELECT * FROM {0}.mytable'.format(schema))
+        self.assertEqual(cursor.fetchall(), [('a', 'b')])
+        with self.assertRaises(sqlite3.OperationalError):
+            database.connection.execute('DELETE FROM {0}.mytable'.format(schema))
+
+        reader = database.acquire_reader()  # <- Readers are attached too.
+        cursor = reader.execute('SELECT * FROM {0}.mytable'.format(schema))
+        self.assertEqual(cursor.fetchall(), [('a', 'b')])
+        database.release_reader(reader)
+
+        with self.assertRaises(IOError):
+            database.attach(os.path.join(temporary_dir, 'missing.sqlite3'))
 
 
 class TestTemporarySqliteTable(unittest.TestCase):
@@ -253,3 +347,47 @@ class TestTemporarySqliteTableForCsv(unittest.TestCase):
             ('',  '',  'd', '4'),
         ]
         self.assertEqual(result, expected)
+
+    def test_typed_columns(self):
+        columns = ['foo', 'bar', 'baz']
+        data = [
+            ('a', '1', '1.5'),
+            ('b', '', 'x'),
+        ]
+        types = {'bar': 'INTEGER', 'baz': 'REAL'}
+        temptable = TemporarySqliteTableForCsv(data, columns, types=types)
+        cursor = temptable.connection.cursor()
+        cursor.execute('SELECT foo, bar, baz, typeof(bar), typeof(baz) FROM ' + temptable.name)
+        expected = [
+            ('a', 1, 1.5, 'integer', 'real'),
+            ('b', None, 'x', 'null', 'text'),  # <- Empty string loaded as NULL.
+        ]
+        self.assertEqual(list(cursor), expected)
+
+        temptable._concatenate_data([('c', '7')], ['foo', 'qux'], {'qux': 'INTEGER'})
+        cursor.execute('SELECT qux FROM ' + temptable.name)
+        self.assertEqual(list(cursor), [(None,), (None,), (7,)])
+
+
+class TestColumnTypes(unittest.TestCase):
+    def test_normalize_type(self):
+        self.assertEqual(_normalize_type('integer'), 'INTEGER')
+        self.assertEqual(_normalize_type(float), 'REAL')
+        self.assertEqual(_normalize_type(str), 'TEXT')
+        self.assertIsNone(_normalize_type(None))
+
+        with self.assertRaises(ValueError):
+            _normalize_type('DATE')
+
+    def test_infer_column_types(self):
+        columns = ['a', 'b', 'c', 'd', 'e']
+        rows = [
+            ['1', '1.5', '00501', 'x', ''],
+            ['-20', '3', '00502', '1', ''],
+            ['', '1e3', '1', '2', ''],
+        ]
+        expected = {'a': 'INTEGER', 'b': 'REAL', 'c': 'TEXT', 'd': 'TEXT', 'e': 'TEXT'}
+        self.assertEqual(_infer_column_types(columns, rows), expected)
+
+        rows = [['12345678901234567890', '', '', '', '']]  # <- Larger than 64-bit.
+        self.assertEqual(_infer_column_types(columns, rows)['a'], 'TEXT')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import zipfile
+
+# Import compatiblity layers and helpers.
+from . import _unittest as unittest
+
+# Import code to test.
+from datatest.load.xlsxreader import XlsxReader
+from datatest.load.xlsxreader import get_worksheet_names
+from datatest.load.xlsxreader import _column_index
+
+workbook_path = os.path.join(os.path.dirname(__file__), 'test_sources_excel.xlsx')
+
+
+class TestXlsxReader(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temporary_dir))
+
+    def _make_workbook(self, sheet_data, shared_strings=None, dimension=None):
+        """Write a minimal XLSX file with one worksheet."""
+        ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        path = os.path.join(self.temporary_dir, 'data.xlsx')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('xl/workbook.xml', (
+                '<workbook {0} xmlns:r="http://schemas.openxmlformats.org/'
+                'officeDocument/2006/relationships"><sheets>'
+                '<sheet name="data" sheetId="1" r:id="rId1"/>'
+                '</sheets></workbook>').format(ns))
+            archive.writestr('xl/_rels/workbook.xml.rels', (
+                '<Relationships xmlns="http://schemas.openxmlformats.org/'
+                'package/2006/relationships"><Relationship Id="rId1" '
+                'Target="/xl/worksheets/data.xml"/></Relationships>'))
+            if dimension is not None:
+                dimension = '<dimension ref="{0}"/>'.format(dimension)
+            archive.writestr('xl/worksheets/data.xml', (
+                '<worksheet {0}>{1}<sheetData>{2}</sheetData></worksheet>'
+            ).format(ns, dimension or '', sheet_data))
+            if shared_strings is not None:
+                archive.writestr('xl/sharedStrings.xml', (
+                    '<sst {0}>{1}</sst>').format(ns, shared_strings))
+        return path
+
+    def test_column_index(self):
+        self.assertEqual(_column_index('A1'), 0)
+        self.assertEqual(_column_index('C7'), 2)
+        self.assertEqual(_column_index('AA10'), 26)
+        self.assertIsNone(_column_index('1A'))
+
+    def test_worksheets(self):
+        self.assertEqual(get_worksheet_names(workbook_path), ['Sheet1', 'count_data'])
+
+        with XlsxReader(workbook_path) as reader:
+            self.assertEqual(reader.name, 'Sheet1')
+            self.assertEqual(next(reader), ['label1', 'label2', 'value'])
+            self.assertEqual(next(reader), ['a', 'x', 17.0])
+
+        with XlsxReader(workbook_path, 'count_data') as reader:
+            rows = list(reader)
+        self.assertEqual(rows[4], ['a', '', 15.0])
+
+        with self.assertRaises(LookupError):
+            XlsxReader(workbook_path, 'missing')
+
+        with self.assertRaises(LookupError):
+            XlsxReader(workbook_path, 5)
+
+    def test_cell_types(self):
+        path = self._make_workbook(
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c>'
+            '<c r="C1" t="inlineStr"><is><t>C</t></is></c></row>'
+            '<row r="2"><c r="A2" t="b"><v>1</v></c><c r="B2"><v>2.5</v></c>'
+            '<c r="C2" t="e"><v>#N/A</v></c></row>'
+            '<row r="4"><c r="B4" t="str"><v>x</v></c></row>',  # <- Skips row 3.
+            '<si><t>A</t></si><si><r><t>B</t></r><r><t>b</t></r></si>',
+        )
+        with XlsxReader(path) as reader:
+            rows = list(reader)
+
+        expected = [
+            ['A', 'Bb', 'C'],
+            [1, 2.5, '#N/A'],
+            ['', '', ''],
+            ['', 'x', ''],
+        ]
+        self.assertEqual(rows, expected)
+
+    def test_row_width(self):
+        # Without a dimension, the width is taken from the first row.
+        path = self._make_workbook(
+            '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><v>2</v></c></row>'
+            '<row r="3"><c r="A3"><v>3</v></c></row>'
+            '<row r="4"><c r="A4"><v>4</v></c><c r="C4"><v>5</v></c></row>',
+        )
+        with XlsxReader(path) as reader:
+            rows = list(reader)
+        self.assertEqual(rows, [['', ''], [1.0, 2.0], [3.0, ''], [4.0, '', 5.0]])
+
+        # With a dimension, rows are padded to the dimension's width
+        # but cells beyond it (a stale dimension) are kept.
+        path = self._make_workbook(
+            '<row r="1"><c r="A1"><v>1</v></c><c r="B1"><v>2</v></c>'
+            '<c r="C1"><v>3</v></c></row>'
+            '<row r="2"><c r="A2"><v>4</v></c></row>',
+            dimension='A1:B2',
+        )
+        with XlsxReader(path) as reader:
+            rows = list(reader)
+        self.assertEqual(rows, [[1.0, 2.0, 3.0], [4.0, '', '']])
+
+        path = self._make_workbook('<row r="1"><c r="A1"><v>1</v></c></row>',
+                                   dimension='A1:C1')
+        with XlsxReader(path) as reader:
+            self.assertEqual(list(reader), [[1.0, '', '']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,24 +5,17 @@ from . import _unittest as unittest
 from .mixins import OtherTests
 from .mixins import CountTests
 
-try:
-    import xlrd
-except ImportError:
-    xlrd = None
-
 from datatest.sources.excel import ExcelSource
 
 workbook_path = os.path.join(os.path.dirname(__file__), 'test_sources_excel.xlsx')
 
 
-@unittest.skipIf(xlrd is None, 'xlrd not found')
 class TestExcelSource(OtherTests, unittest.TestCase):
     def setUp(self):
         global workbook_path
         self.datasource = ExcelSource(workbook_path)  # <- Defaults to "Sheet 1"
 
 
-@unittest.skipIf(xlrd is None, 'xlrd not found')
 class TestExcelSourceCount(unittest.TestCase):
 #class TestExcelSourceCount(CountTests, unittest.TestCase):
     def setUp(self):